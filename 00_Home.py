@@ -217,6 +217,14 @@ else:
 
     # Render Standard Header
     render_header("Módulos del Sistema")
+
+    # --- PDF Templates & Assets Warm-up (once per process) ---
+    try:
+        from src.utils.pdf_generators import warm_up_pdf_templates, preload_pdf_assets
+        warm_up_pdf_templates()
+        preload_pdf_assets()
+    except Exception as e:
+        print(f"[WARN] No se pudieron precargar las plantillas PDF: {e}")
     
     # --- CSS Alignment Fix ---
     st.markdown('''<style>
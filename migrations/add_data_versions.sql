@@ -0,0 +1,54 @@
+-- Tokens de cambio por tabla (supabase_repository.get_data_version)
+-- Cada escritura (INSERT/UPDATE/DELETE/TRUNCATE) incrementa el contador de su tabla, una
+-- vez por sentencia. Las páginas leen esta tabla pequeña para saber si sus datos
+-- cacheados (colas de Aprobación/Desembolso, reportes) siguen vigentes.
+
+-- PASO 1: Tabla de versiones
+CREATE TABLE IF NOT EXISTS public.data_versions (
+    table_name TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- PASO 2: Función del trigger (nivel sentencia: un bulk insert cuenta como un cambio)
+-- SECURITY DEFINER: corre con los permisos del dueño de la tabla, así la aplicación
+-- escribe en las tablas versionadas sin tener permiso de escritura en data_versions.
+CREATE OR REPLACE FUNCTION public.bump_data_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO public.data_versions (table_name, version, updated_at)
+    VALUES (TG_TABLE_NAME, 1, now())
+    ON CONFLICT (table_name)
+    DO UPDATE SET version = public.data_versions.version + 1, updated_at = now();
+    RETURN NULL;
+END;
+$$;
+
+-- PASO 3: Triggers en las tablas versionadas
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY[
+        'propuestas', 'liquidaciones_resumen', 'liquidacion_eventos',
+        'desembolsos_resumen', 'desembolso_eventos', 'EMISORES.ACEPTANTES'
+    ]
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_data_version ON public.%I', t);
+        EXECUTE format(
+            'CREATE TRIGGER trg_data_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.%I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION public.bump_data_version()', t
+        );
+        INSERT INTO public.data_versions (table_name) VALUES (t) ON CONFLICT (table_name) DO NOTHING;
+    END LOOP;
+END;
+$$;
+
+-- PASO 4: La aplicación solo lee; únicamente el trigger (dueño) escribe
+REVOKE ALL ON public.data_versions FROM anon, authenticated;
+GRANT SELECT ON public.data_versions TO anon, authenticated, service_role;
+REVOKE ALL ON FUNCTION public.bump_data_version() FROM PUBLIC, anon, authenticated;
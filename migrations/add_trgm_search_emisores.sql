@@ -0,0 +1,36 @@
+-- Búsqueda de emisores/aceptantes por RUC o Razón Social
+-- Índices GIN de pg_trgm: permiten que ILIKE '%termino%' (search_emisores_deudores)
+-- use índice en lugar de recorrer toda la tabla.
+
+-- PASO 1: Habilitar la extensión
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- PASO 2: Índices trigram sobre las columnas de búsqueda
+CREATE INDEX IF NOT EXISTS idx_emisores_aceptantes_ruc_trgm
+ON public."EMISORES.ACEPTANTES" USING gin ("RUC" gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_emisores_aceptantes_razon_social_trgm
+ON public."EMISORES.ACEPTANTES" USING gin ("Razon Social" gin_trgm_ops);
+
+-- PASO 3: Búsqueda ordenada por similitud (opcional, vía supabase.rpc)
+CREATE OR REPLACE FUNCTION public.search_emisores_aceptantes(termino TEXT, max_resultados INTEGER DEFAULT 10)
+RETURNS TABLE ("RUC" TEXT, "Razon Social" TEXT, "TIPO" TEXT, score REAL)
+LANGUAGE sql STABLE AS $$
+    SELECT e."RUC"::TEXT, e."Razon Social"::TEXT, e."TIPO"::TEXT,
+           GREATEST(
+               CASE WHEN e."RUC" LIKE termino || '%' THEN 1.0 ELSE 0.0 END,
+               word_similarity(termino, e."Razon Social")
+           )::REAL AS score
+    FROM public."EMISORES.ACEPTANTES" e
+    WHERE e."RUC" LIKE termino || '%'
+       OR termino <% e."Razon Social"
+       OR e."Razon Social" ILIKE '%' || termino || '%'
+    ORDER BY score DESC, e."Razon Social"
+    LIMIT max_resultados;
+$$;
+
+-- Verificar índices
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'EMISORES.ACEPTANTES'
+  AND indexname LIKE '%trgm%';
@@ -0,0 +1,10 @@
+-- Cambios en vivo para Aprobación/Desembolso/Liquidación (src/services/change_feed.py)
+-- Supabase Realtime solo emite postgres_changes de las tablas en la publicación supabase_realtime.
+
+-- PASO 1: Publicar las tablas
+ALTER PUBLICATION supabase_realtime ADD TABLE public.propuestas;
+ALTER PUBLICATION supabase_realtime ADD TABLE public.liquidacion_eventos;
+
+-- PASO 2 (opcional): enviar también la fila anterior en UPDATE (old_record completo).
+-- Permite descontar facturas que salen de lotes aún no mostrados en la cola.
+ALTER TABLE public.propuestas REPLICA IDENTITY FULL;
@@ -71,7 +71,7 @@ def mostrar_busqueda():
     
     col1, col2 = st.columns([3, 1])
     with col1:
-        ruc_buscar = st.text_input("🔍 Buscar por RUC", max_chars=11, help="Ingresa el RUC de 11 dígitos")
+        ruc_buscar = st.text_input("🔍 Buscar por RUC o Razón Social", help="RUC de 11 dígitos, parte del RUC o del nombre")
     with col2:
         st.write("")  # Espaciador
         st.write("")  # Espaciador
@@ -80,9 +80,26 @@ def mostrar_busqueda():
             st.session_state.registro_encontrado = None
             st.rerun()
     
+    ruc_buscar = ruc_buscar.strip()
     if ruc_buscar:
         if not re.match(r'^\d{11}$', ruc_buscar):
-            st.warning("⚠️ El RUC debe tener exactamente 11 dígitos numéricos")
+            # Búsqueda parcial por RUC o nombre (índice en memoria, ordenado por relevancia)
+            from src.services.counterparty_search import search_counterparties
+            coincidencias = search_counterparties(ruc_buscar, limit=10)
+            if not coincidencias:
+                st.info(f"ℹ️ No se encontraron coincidencias para: {ruc_buscar}")
+            for item in coincidencias:
+                c1, c2, c3 = st.columns([2, 5, 1])
+                c1.write(item['RUC'])
+                c2.write(f"{item['Razon Social']} ({item.get('TIPO') or '-'})")
+                if c3.button("Abrir", key=f"abrir_{item['RUC']}"):
+                    registro = db.get_signatory_data_by_ruc(item['RUC'])
+                    if registro:
+                        st.session_state.registro_encontrado = registro
+                        st.session_state.vista_registro = 'editar'
+                        st.rerun()
+                    else:
+                        st.error(f"❌ No se pudo cargar el registro con RUC {item['RUC']}")
         else:
             # Buscar en base de datos (búsqueda EXACTA por RUC)
             try:
@@ -106,6 +123,44 @@ def mostrar_busqueda():
                     st.session_state.vista_registro = 'crear'
                     st.rerun()
 
+    mostrar_carga_masiva()
+
+
+def mostrar_carga_masiva():
+    """Carga masiva de emisores/aceptantes desde CSV o XLSX (upsert por RUC)"""
+    from src.services.emisores_import import parse_emisores_file
+
+    with st.expander("📥 Carga Masiva (CSV / XLSX)"):
+        st.caption(
+            "Columnas obligatorias: RUC, Razon Social, TIPO (EMISOR o ACEPTANTE). "
+            "Las demás columnas de la ficha son opcionales. Los RUC existentes se actualizan."
+        )
+        archivo = st.file_uploader("Archivo", type=["csv", "xlsx"], key="carga_masiva_archivo")
+        actualizar = st.checkbox("Actualizar registros existentes", value=True, key="carga_masiva_actualizar")
+
+        if archivo is not None:
+            try:
+                filas = parse_emisores_file(archivo.getvalue(), archivo.name)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+                return
+            st.info(f"ℹ️ {len(filas)} filas leídas de {archivo.name}")
+
+            if filas and st.button("Importar", type="primary", key="carga_masiva_importar"):
+                with st.spinner("Importando registros..."):
+                    resultados = db.bulk_upsert_emisores_deudores(filas, update_existing=actualizar)
+                st.session_state.carga_masiva_resultados = resultados
+
+        resultados = st.session_state.get('carga_masiva_resultados')
+        if resultados:
+            conteo = {}
+            for r in resultados:
+                conteo[r['estado']] = conteo.get(r['estado'], 0) + 1
+            cols = st.columns(4)
+            for col, estado in zip(cols, ['creado', 'actualizado', 'omitido', 'error']):
+                col.metric(estado.capitalize(), conteo.get(estado, 0))
+            st.dataframe(resultados, use_container_width=True, hide_index=True)
+
 
 def mostrar_formulario_crear():
     """Vista de creación de nuevo registro con TODOS los campos"""
@@ -1,20 +1,19 @@
 import os
 import json
 import datetime
-import tempfile
-import requests
 import streamlit as st
 import pandas as pd
 
 # --- Project Imports ---
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
-import importlib
 from src.services import pdf_parser
 from src.data import supabase_repository as db
-from src.utils import pdf_generators
-importlib.reload(pdf_generators) # Force reload to pick up new signatures
-# from src.utils.pdf_generators import generar_anexo_liquidacion_pdf # Removed to avoid stale reference
+from src.services.calculation_client import get_calculation_client, CalculationError
+from src.services.spill_store import get_spill_store
+from src.core.factura_originacion import FacturaOriginacion, ArchivoCargado
+from src.core.lote_originacion import LoteOriginacion, construir_payload
+from src.services.document_renderer import render_documents_to_dict
 
 from src.utils.google_integration import (
     render_folder_navigator_v2, 
@@ -35,14 +34,12 @@ st.set_page_config(
 # --- Navigation Tracking ---
 st.session_state.last_page = '02_Originacion'
 
-# Backend URL Strategy
-API_BASE_URL = os.getenv("BACKEND_API_URL")
-if not API_BASE_URL:
-    try:
-        API_BASE_URL = st.secrets["backend_api"]["url"]
-    except (KeyError, AttributeError):
-        st.error("❌ La URL del backend no está configurada. Define BACKEND_API_URL o configúrala en st.secrets.")
-        st.stop()
+# Calculation Client (in-process by default; CALCULATION_TRANSPORT=http uses the backend API)
+try:
+    CALC_CLIENT = get_calculation_client()
+except CalculationError as e:
+    st.error(f"❌ {e}")
+    st.stop()
 
 # Service Account Credentials
 try:
@@ -205,31 +202,57 @@ def validate_inputs(invoice: dict) -> bool:
     return True
 
 
+def apply_to_invoices(field: str, value, widget_value=None, update_dates=False) -> int:
+    """
+    Sets `field` to `value` only on the invoices where it differs (and their widget key),
+    so the lot model recalculates only those. Returns how many invoices changed.
+    """
+    changed = 0
+    for idx, invoice in enumerate(st.session_state.invoices_data):
+        if invoice[field] == value:
+            continue
+        invoice[field] = value
+        st.session_state[f"{field}_{idx}"] = value if widget_value is None else widget_value
+        if update_dates:
+            update_date_calculations(invoice, idx=idx)
+        changed += 1
+    return changed
+
+
 def propagate_commission_changes():
     """Propagates global fee parameters to all invoices if 'fijar_condiciones' is active."""
     if st.session_state.get('fijar_condiciones', False) and st.session_state.invoices_data and len(st.session_state.invoices_data) > 1:
         first_invoice = st.session_state.invoices_data[0]
-        ref_tasa = st.session_state.get(f"tasa_de_avance_0", first_invoice['tasa_de_avance'])
-        ref_int_m = st.session_state.get(f"interes_mensual_0", first_invoice['interes_mensual'])
-        ref_int_mor = st.session_state.get(f"interes_moratorio_0", first_invoice['interes_moratorio'])
-        
-        # We also propagate manual fees if set
-        ref_com_pen = st.session_state.get(f"comision_afiliacion_pen_0", first_invoice['comision_afiliacion_pen'])
-        ref_com_usd = st.session_state.get(f"comision_afiliacion_usd_0", first_invoice['comision_afiliacion_usd'])
+        for field in ('tasa_de_avance', 'interes_mensual', 'interes_moratorio', 'comision_afiliacion_pen', 'comision_afiliacion_usd'):
+            # We also propagate manual fees if set
+            apply_to_invoices(field, st.session_state.get(f"{field}_0", first_invoice[field]))
 
-        first_invoice['tasa_de_avance'] = ref_tasa
-        first_invoice['interes_mensual'] = ref_int_m
-        first_invoice['interes_moratorio'] = ref_int_mor
-        first_invoice['comision_afiliacion_pen'] = ref_com_pen
-        first_invoice['comision_afiliacion_usd'] = ref_com_usd
 
-        for i in range(1, len(st.session_state.invoices_data)):
-            invoice = st.session_state.invoices_data[i]
-            invoice['tasa_de_avance'] = ref_tasa
-            invoice['interes_mensual'] = ref_int_m
-            invoice['interes_moratorio'] = ref_int_mor
-            invoice['comision_afiliacion_pen'] = ref_com_pen
-            invoice['comision_afiliacion_usd'] = ref_com_usd
+# Invoice widgets whose value is copied into the invoice when the widget renders (Sección 3)
+INVOICE_INPUT_WIDGETS = (
+    'monto_total_factura', 'monto_neto_factura', 'moneda_factura', 'dias_minimos_interes_individual',
+    'tasa_de_avance', 'interes_mensual', 'interes_moratorio',
+)
+
+def sync_invoices_from_widgets():
+    """Copies edited invoice widgets into the invoices before the lot is recalculated (they render later)."""
+    for idx, invoice in enumerate(st.session_state.invoices_data):
+        for field in INVOICE_INPUT_WIDGETS:
+            key = f"{field}_{idx}"
+            if key in st.session_state and st.session_state[key] != invoice[field]:
+                invoice[field] = st.session_state[key]
+
+
+def lot_conditions() -> dict:
+    """Lot-level inputs of the calculation (see lote_originacion.DEPENDENCIAS_LOTE)."""
+    return {
+        'comision_estructuracion_pct': st.session_state.comision_estructuracion_pct_global,
+        'aplicar_comision_afiliacion': st.session_state.get('aplicar_comision_afiliacion_global', False),
+        'comision_minima_pen': st.session_state.comision_estructuracion_min_pen_global,
+        'comision_minima_usd': st.session_state.comision_estructuracion_min_usd_global,
+        'comision_afiliacion_pen': st.session_state.comision_afiliacion_pen_global,
+        'comision_afiliacion_usd': st.session_state.comision_afiliacion_usd_global,
+    }
 
 
 def to_date_obj(date_str):
@@ -242,59 +265,106 @@ def to_date_obj(date_str):
         return None
 
 
+# --- Report PDFs (Perfil / Anexo de Liquidación) ---
+
+def perfil_pdf_job(base_path_string: str):
+    """Job de document_renderer para el Perfil de Operación (None si no hay facturas calculadas)."""
+    pdf_list = []
+    for inv in st.session_state.invoices_data:
+        if inv.tiene_resultado:
+            # Inject global commission helper data expected by generator
+            inv['comision_de_estructuracion_global'] = st.session_state.comision_estructuracion_pct_global
+            inv['detraccion_monto'] = inv['monto_total_factura'] - inv['monto_neto_factura']
+            # Inject Detected Metadata
+            inv['contract_number'] = st.session_state.contract_number
+            inv['anexo_number'] = st.session_state.anexo_number
+            # Semantic Lote ID for PDF Header (Uses pre-calculated filtered string)
+            inv['lote_id'] = f"{base_path_string} | G{inv.get('group_id', '?')}"
+            # Plain dict: results decoded once, not on every template lookup
+            pdf_list.append(inv.copy())
+    if not pdf_list:
+        return None
+    return {'key': 'perfil', 'report': 'generate_perfil_operacion_pdf', 'kwargs': {'invoices_data': pdf_list}}
+
+def anexo_pdf_job():
+    """Job de document_renderer para el Anexo de Liquidación (None si no hay facturas calculadas)."""
+    pdf_list = []
+    for inv in st.session_state.invoices_data:
+        if inv.tiene_resultado:
+            inv['contract_number'] = st.session_state.contract_number
+            inv['anexo_number'] = st.session_state.anexo_number
+            pdf_list.append(inv.copy())
+    if not pdf_list:
+        return None
+
+    # Fetch Bank Info for Anexo (from First Invoice's Emisor)
+    bank_info_dict = {}
+    if pdf_list[0].get('emisor_ruc'):
+        raw_emisor_data = db.get_signatory_data_by_ruc(pdf_list[0]['emisor_ruc'])
+        if raw_emisor_data:
+            # DB Columns: 'Institucion Financiera', 'Numero de Cuenta PEN'/'Numero de Cuenta USD'
+            suffix = "PEN" if pdf_list[0].get('moneda_factura', 'PEN') == 'PEN' else "USD"
+            bank_info_dict = {
+                'banco': raw_emisor_data.get('Institucion Financiera', 'N/A'),
+                'cuenta': raw_emisor_data.get(f'Numero de Cuenta {suffix}', 'N/A'),
+                'cci': raw_emisor_data.get(f'Numero de CCI {suffix}', 'N/A')
+            }
+    return {'key': 'liquidacion', 'report': 'generar_anexo_liquidacion_pdf',
+            'kwargs': {'invoices_data': pdf_list, 'bank_info': bank_info_dict}}
+
+REPORT_PDF_FILES = {'perfil': 'perfil_operacion', 'liquidacion': 'anexo_liquidacion'}
+
+def render_report_pdfs(jobs: list, path_sanitized: str) -> list:
+    """
+    Renders the report jobs (in parallel when there are several) and stores each one in
+    the spill store as st.session_state['last_generated_<key>_pdf']. Returns the keys that failed.
+    """
+    jobs = [j for j in jobs if j]
+    failed = []
+    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    for key, pdf_bytes in render_documents_to_dict(jobs).items():
+        if not pdf_bytes:
+            failed.append(key)
+            continue
+        fname = f"{REPORT_PDF_FILES[key]}_{path_sanitized}_{timestamp}.pdf"
+        st.session_state[f'last_generated_{key}_pdf'] = {'digest': SPILL_STORE.put(pdf_bytes), 'filename': fname}
+    return failed
+
 # --- Global Parameter Handlers ---
 
 def handle_global_payment_date_change():
     if st.session_state.get('aplicar_fecha_vencimiento_global') and st.session_state.get('fecha_vencimiento_global'):
         global_due_date_obj = st.session_state.fecha_vencimiento_global
         global_due_date_str = global_due_date_obj.strftime('%d-%m-%Y')
-        for idx, invoice in enumerate(st.session_state.invoices_data):
-            invoice['fecha_pago_calculada'] = global_due_date_str
-            st.session_state[f"fecha_pago_calculada_{idx}"] = global_due_date_obj
-            update_date_calculations(invoice, changed_field='fecha', idx=idx)
-        st.toast("✅ Fecha de pago global aplicada.")
+        n = apply_to_invoices('fecha_pago_calculada', global_due_date_str, global_due_date_obj, update_dates=True)
+        st.toast(f"✅ Fecha de pago global aplicada ({n} facturas).")
 
 def handle_global_disbursement_date_change():
     if st.session_state.get('aplicar_fecha_desembolso_global') and st.session_state.get('fecha_desembolso_global'):
         global_disbursement_date_obj = st.session_state.fecha_desembolso_global
         global_disbursement_date_str = global_disbursement_date_obj.strftime('%d-%m-%Y')
-        for idx, invoice in enumerate(st.session_state.invoices_data):
-            invoice['fecha_desembolso_factoring'] = global_disbursement_date_str
-            st.session_state[f"fecha_desembolso_factoring_{idx}"] = global_disbursement_date_obj
-            update_date_calculations(invoice, idx=idx)
-        st.toast("✅ Fecha de desembolso global aplicada.")
+        n = apply_to_invoices('fecha_desembolso_factoring', global_disbursement_date_str, global_disbursement_date_obj, update_dates=True)
+        st.toast(f"✅ Fecha de desembolso global aplicada ({n} facturas).")
 
 def handle_global_tasa_avance_change():
     if st.session_state.get('aplicar_tasa_avance_global') and st.session_state.get('tasa_avance_global') is not None:
-        val = st.session_state.tasa_avance_global
-        for idx, invoice in enumerate(st.session_state.invoices_data):
-            invoice['tasa_de_avance'] = val
-            st.session_state[f"tasa_de_avance_{idx}"] = val
-        st.toast("✅ Tasa de avance global aplicada.")
+        n = apply_to_invoices('tasa_de_avance', st.session_state.tasa_avance_global)
+        st.toast(f"✅ Tasa de avance global aplicada ({n} facturas).")
 
 def handle_global_interes_mensual_change():
     if st.session_state.get('aplicar_interes_mensual_global') and st.session_state.get('interes_mensual_global') is not None:
-        val = st.session_state.interes_mensual_global
-        for idx, invoice in enumerate(st.session_state.invoices_data):
-            invoice['interes_mensual'] = val
-            st.session_state[f"interes_mensual_{idx}"] = val
-        st.toast("✅ Interés mensual global aplicado.")
+        n = apply_to_invoices('interes_mensual', st.session_state.interes_mensual_global)
+        st.toast(f"✅ Interés mensual global aplicado ({n} facturas).")
 
 def handle_global_interes_moratorio_change():
     if st.session_state.get('aplicar_interes_moratorio_global') and st.session_state.get('interes_moratorio_global') is not None:
-        val = st.session_state.interes_moratorio_global
-        for idx, invoice in enumerate(st.session_state.invoices_data):
-            invoice['interes_moratorio'] = val
-            st.session_state[f"interes_moratorio_{idx}"] = val
-        st.toast("✅ Interés moratorio global aplicado.")
+        n = apply_to_invoices('interes_moratorio', st.session_state.interes_moratorio_global)
+        st.toast(f"✅ Interés moratorio global aplicado ({n} facturas).")
 
 def handle_global_min_interest_days_change():
     if st.session_state.get('aplicar_dias_interes_minimo_global'):
-        val = st.session_state.get('dias_interes_minimo_global', 15)
-        for idx, invoice in enumerate(st.session_state.invoices_data):
-            invoice['dias_minimos_interes_individual'] = val
-            st.session_state[f"dias_minimos_interes_individual_{idx}"] = val
-        st.toast("✅ Días de interés mínimo global aplicado.")
+        n = apply_to_invoices('dias_minimos_interes_individual', st.session_state.get('dias_interes_minimo_global', 15))
+        st.toast(f"✅ Días de interés mínimo global aplicado ({n} facturas).")
 
 def handle_bucket_change(grp_id):
     """Updates all invoices in a specific group when bucket params change."""
@@ -322,6 +392,10 @@ def handle_bucket_change(grp_id):
 
 
 # --- Session State Initialization ---
+# Los bytes de los PDFs (cargados y generados) viven en el spill store: la sesión solo guarda
+# su SHA-256 (ArchivoCargado / 'digest'). Las facturas son FacturaOriginacion, no dicts.
+SPILL_STORE = get_spill_store()
+
 defaults = {
     'invoices_data': [],
     'pdf_datos_cargados': False,
@@ -372,7 +446,7 @@ for key, val in defaults.items():
 
 # --- Ingester Callbacks ---
 def ingest_files(grp_id):
-    """Callback to move files from uploader widget to persistent state."""
+    """Callback to move files from uploader widget to the spill store (session keeps only hashes)."""
     current_key_check = st.session_state.get(f"uploader_key_grp_{grp_id}", 0)
     widget_key = f"uploader_widget_grp_{grp_id}_{current_key_check}"
     
@@ -381,14 +455,19 @@ def ingest_files(grp_id):
     if uploaded_files:
         # Append to our persistent list
         current_list = st.session_state[f"accumulated_files_grp_{grp_id}"]
-        # Avoid duplicates by name (heuristic)
-        existing_names = set(f.name for f in current_list)
+        # Avoid duplicates by name (heuristic) or by content
+        existing = set(a.nombre for a in current_list) | set(a.digest for a in current_list)
         
         for f in uploaded_files:
-            if f.name not in existing_names:
-                current_list.append(f)
+            if f.name in existing:
+                continue
+            data = f.getvalue()
+            digest = SPILL_STORE.put(data)
+            if digest not in existing:
+                current_list.append(ArchivoCargado(f.name, digest, len(data)))
+                existing.update((f.name, digest))
                 
-        # Force Uploader Reset by incrementing key
+        # Force Uploader Reset by incrementing key (drops the UploadedFile objects)
         st.session_state[f"uploader_key_grp_{grp_id}"] += 1
 
 def delete_file(grp_id, file_index):
@@ -464,7 +543,7 @@ with st.container(border=True):
                         target_col = fc1 if f_idx % 2 == 0 else fc2
                         with target_col:
                             # Interactive Brick
-                            if st.button(f"📄 {f.name[:25]}... ✖" if len(f.name)>28 else f"📄 {f.name}   ✖", 
+                            if st.button(f"📄 {f.nombre[:25]}... ✖" if len(f.nombre)>28 else f"📄 {f.nombre}   ✖", 
                                          key=f"brick_{grp_id}_{f_idx}", 
                                          help="Haz clic para eliminar este archivo",
                                          use_container_width=True):
@@ -498,7 +577,7 @@ with st.container(border=True):
         # Reset Main Data
         st.session_state.invoices_data = []
         st.session_state.pdf_datos_cargados = False
-        st.session_state.original_uploads_cache = []
+        st.session_state.pop('lote_originacion', None) # New lot: next "Calcular" starts from scratch
         st.session_state.rates_prefilled_flag = False # Force DB lookup on new batch
         
         all_processed_ok = True
@@ -514,60 +593,53 @@ with st.container(border=True):
             
             f_pago_str = f_pago_val.strftime('%d-%m-%Y') if f_pago_val else ""
             
-            for uploaded_file in files:
-                # Cache raw content
-                file_bytes_content = uploaded_file.getvalue()
-                st.session_state.original_uploads_cache.append({
-                    'name': uploaded_file.name,
-                    'bytes': file_bytes_content
-                })
-                
-                # Temp file for parser
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(file_bytes_content)
-                    temp_file_path = tmp.name
+            for archivo in files:
+                # The parser reads the stored file directly (no temp copy)
+                stored_path = SPILL_STORE.path(archivo.digest)
+                if stored_path is None:
+                    st.error(f"[G{i}] {archivo.nombre} ya no está disponible en el servidor. Vuelve a cargarlo.")
+                    all_processed_ok = False
+                    continue
 
                 try:
                     # Parse
-                    parsed_data = pdf_parser.extract_fields_from_pdf(temp_file_path)
+                    parsed_data = pdf_parser.extract_fields_from_pdf(stored_path)
                     
                     if parsed_data.get("error"):
-                         st.error(f"[G{i}] Error parsing {uploaded_file.name}: {parsed_data['error']}")
+                         st.error(f"[G{i}] Error parsing {archivo.nombre}: {parsed_data['error']}")
                          all_processed_ok = False
                     else:
                         # Build Invoice Object
-                        invoice_entry = {
+                        invoice_entry = FacturaOriginacion(
                             # Metadata
-                            'group_id': i,  # <--- NEW: Track Origin Bucket
-                            'parsed_pdf_name': uploaded_file.name,
-                            'file_id': uploaded_file.file_id,
+                            group_id=i,  # Track Origin Bucket
+                            parsed_pdf_name=archivo.nombre,
+                            file_digest=archivo.digest,
                             
                             # Fields
-                            'emisor_ruc': parsed_data.get('emisor_ruc', ''),
-                            'aceptante_ruc': parsed_data.get('aceptante_ruc', ''),
-                            'fecha_emision_factura': parsed_data.get('fecha_emision', ''),
-                            'monto_total_factura': parsed_data.get('monto_total', 0.0),
-                            'monto_neto_factura': parsed_data.get('monto_neto', 0.0),
-                            'moneda_factura': parsed_data.get('moneda', 'PEN'),
-                            'numero_factura': parsed_data.get('invoice_id', ''),
-                            'emisor_nombre': db.get_razon_social_by_ruc(parsed_data.get('emisor_ruc', '')),
-                            'aceptante_nombre': db.get_razon_social_by_ruc(parsed_data.get('aceptante_ruc', '')),
+                            emisor_ruc=parsed_data.get('emisor_ruc', ''),
+                            aceptante_ruc=parsed_data.get('aceptante_ruc', ''),
+                            fecha_emision_factura=parsed_data.get('fecha_emision', ''),
+                            monto_total_factura=parsed_data.get('monto_total', 0.0),
+                            monto_neto_factura=parsed_data.get('monto_neto', 0.0),
+                            moneda_factura=parsed_data.get('moneda', 'PEN'),
+                            numero_factura=parsed_data.get('invoice_id', ''),
+                            cuotas=parsed_data.get('cuotas', []), # Cronograma "Información del crédito"
+                            emisor_nombre=db.get_razon_social_by_ruc(parsed_data.get('emisor_ruc', '')),
+                            aceptante_nombre=db.get_razon_social_by_ruc(parsed_data.get('aceptante_ruc', '')),
                             
                             # Assigned Dates from Bucket
-                            'fecha_desembolso_factoring': "", # Must be set globally
-                            'fecha_pago_calculada': f_pago_str, # Override parsed date with Bucket date
+                            fecha_desembolso_factoring="", # Must be set globally
+                            fecha_pago_calculada=f_pago_str, # Override parsed date with Bucket date
                             
                             # Config Defaults
-                            'tasa_de_avance': st.session_state.default_tasa_de_avance,
-                            'interes_mensual': st.session_state.default_interes_mensual,
-                            'interes_moratorio': st.session_state.default_interes_moratorio,
-                            'comision_afiliacion_pen': st.session_state.default_comision_afiliacion_pen,
-                            'comision_afiliacion_usd': st.session_state.default_comision_afiliacion_usd,
-                            'dias_minimos_interes_individual': 15, # Default, must be set globally
-                            'detraccion_porcentaje': 0.0,
-                            'plazo_credito_dias': 0,
-                            'plazo_operacion_calculado': 0,
-                        }
+                            tasa_de_avance=st.session_state.default_tasa_de_avance,
+                            interes_mensual=st.session_state.default_interes_mensual,
+                            interes_moratorio=st.session_state.default_interes_moratorio,
+                            comision_afiliacion_pen=st.session_state.default_comision_afiliacion_pen,
+                            comision_afiliacion_usd=st.session_state.default_comision_afiliacion_usd,
+                            dias_minimos_interes_individual=15, # Default, must be set globally
+                        )
                         
                         # --- Apply DB Rates Logic (Full Implementation) ---
                         try:
@@ -651,10 +723,7 @@ with st.container(border=True):
                         st.session_state.invoices_data.append(invoice_entry)
 
                 except Exception as e:
-                    st.error(f"Excepción en {uploaded_file.name}: {e}")
-                finally:
-                    if os.path.exists(temp_file_path):
-                        os.remove(temp_file_path)
+                    st.error(f"Excepción en {archivo.nombre}: {e}")
         
         if st.session_state.invoices_data:
             st.session_state.pdf_datos_cargados = True
@@ -712,6 +781,27 @@ if st.session_state.invoices_data:
     # SECCIÓN 3: DETALLE DE FACTURAS (GROUPED)
     # ==============================================================================
     st.subheader("3. Detalle de Facturas")
+
+    # --- Incremental recalculation (after the first "Calcular") ---
+    # The lot model recomputes only the invoices affected by this rerun's edits.
+    recalculated_idx = set()
+    lote_model = st.session_state.get('lote_originacion')
+    if lote_model is not None:
+        sync_invoices_from_widgets()
+        if all(validate_inputs(inv) for inv in st.session_state.invoices_data):
+            try:
+                cambios = lote_model.recalcular(st.session_state.invoices_data, lot_conditions())
+                cambios.aplicar(st.session_state.invoices_data)
+                recalculated_idx = set(cambios.recalculadas)
+                if cambios and not cambios.completo:
+                    st.caption(f"🔄 Recalculadas {len(recalculated_idx)} de {len(st.session_state.invoices_data)} facturas (solo las afectadas por el cambio).")
+                for etapa, metodo in (("desembolso inicial", cambios.metodo_desembolso), ("búsqueda de tasa", cambios.metodo_tasa)):
+                    if metodo and metodo[0] and not cambios.completo:
+                        st.info(f"Método de comisión del lote ({etapa}): {metodo[0]} → {metodo[1]}")
+            except Exception as e:
+                st.error(f"Error en el recálculo: {e}")
+        else:
+            st.warning("⚠️ Hay facturas con datos incompletos: los resultados mostrados no reflejan los últimos cambios.")
     
     # Identify active groups
     active_groups = sorted(list(set(inv.get('group_id', 1) for inv in st.session_state.invoices_data)))
@@ -727,7 +817,7 @@ if st.session_state.invoices_data:
             # to keep data sync with st.session_state.invoices_data[idx]
             
             with st.container(border=True):
-                st.markdown(f"**Factura {idx + 1}:** `{invoice.get('parsed_pdf_name', 'N/A')}`")
+                st.markdown(f"**Factura {idx + 1}:** `{invoice.get('parsed_pdf_name', 'N/A')}`" + (" · 🔄 recalculada" if idx in recalculated_idx else ""))
 
                 with st.container():
                     st.caption("Involucrados")
@@ -798,7 +888,7 @@ if st.session_state.invoices_data:
 
                 
                 # --- Results Display Within Invoice ---
-                if invoice.get('recalculate_result'):
+                if invoice.tiene_resultado:
                     st.divider()
                     st.write("##### Perfil de la Operación")
                     st.markdown(
@@ -810,7 +900,7 @@ if st.session_state.invoices_data:
                         f"**Monto Total:** {invoice.get('moneda_factura', '')} {invoice.get('monto_total_factura', 0):,.2f} | "
                         f"**Monto Neto:** {invoice.get('moneda_factura', '')} {invoice.get('monto_neto_factura', 0):,.2f}"
                     )
-                    recalc_result = invoice['recalculate_result']
+                    recalc_result = invoice.recalculate_result
                     desglose = recalc_result.get('desglose_final_detallado', {})
                     calculos = recalc_result.get('calculo_con_tasa_encontrada', {})
                     busqueda = recalc_result.get('resultado_busqueda', {})
@@ -876,7 +966,7 @@ if st.session_state.invoices_data:
     # SECCIÓN 4: ACCIONES Y REPORTES
     # ==============================================================================
     # st.markdown("---")
-    has_results = any(inv.get('recalculate_result') for inv in st.session_state.invoices_data)
+    has_results = any(inv.tiene_resultado for inv in st.session_state.invoices_data)
     
     with st.container(border=True):
         st.subheader("4. Resultados, Simulación y Formalización")
@@ -900,73 +990,20 @@ if st.session_state.invoices_data:
                     st.success("Iniciando cálculos...")
                     # ... (Calculation Logic preserved) ...
                     try:
-                        # Prepare Payload
-                        payload = []
-                        # Pre-calculate totals for apportionment
-                        total_cap_pen = sum(i['monto_neto_factura'] * (i['tasa_de_avance']/100) for i in st.session_state.invoices_data if i['moneda_factura'] == 'PEN')
-                        total_cap_usd = sum(i['monto_neto_factura'] * (i['tasa_de_avance']/100) for i in st.session_state.invoices_data if i['moneda_factura'] == 'USD')
-                        
-                        for inv in st.session_state.invoices_data:
-                            # Logic for Apportionment
-                            cap = inv['monto_neto_factura'] * (inv['tasa_de_avance']/100)
-                            is_sol = inv['moneda_factura'] == 'PEN'
-                            total_cap = total_cap_pen if is_sol else total_cap_usd
-                            share = cap / total_cap if total_cap > 0 else 0
-                            
-                            # Commissions
-                            com_min = (st.session_state.comision_estructuracion_min_pen_global if is_sol else st.session_state.comision_estructuracion_min_usd_global) * share
-                            com_afi = (st.session_state.comision_afiliacion_pen_global if is_sol else st.session_state.comision_afiliacion_usd_global) * share
-                            
-                            plazo = max(inv.get('plazo_operacion_calculado', 0), inv.get('dias_minimos_interes_individual', 15))
-                            
-                            payload.append({
-                                "plazo_operacion": plazo,
-                                "mfn": inv['monto_neto_factura'],
-                                "tasa_avance": inv['tasa_de_avance'] / 100,
-                                "interes_mensual": inv['interes_mensual'] / 100,
-                                "interes_moratorio_mensual": inv['interes_moratorio'] / 100,
-                                "comision_estructuracion_pct": st.session_state.comision_estructuracion_pct_global / 100,
-                                "comision_minima_aplicable": com_min,
-                                "igv_pct": 0.18,
-                                "comision_afiliacion_aplicable": com_afi,
-                                "aplicar_comision_afiliacion": st.session_state.get('aplicar_comision_afiliacion_global', False)
-                            })
-
-                        # Call API 1: Calculate Disbursement
-                        resp1 = requests.post(f"{API_BASE_URL}/calcular_desembolso_lote", json=payload)
-                        resp1.raise_for_status()
-                        res1 = resp1.json()
-
-                        if res1.get("error"):
-                            st.error(res1['error'])
-                            st.stop()
-
-                        # Prepare Payload 2: Goal Seeking
-                        payload2 = []
-                        for i, inv in enumerate(st.session_state.invoices_data):
-                            inv['initial_calc_result'] = res1["resultados_por_factura"][i]
-                            abono_teorico = inv['initial_calc_result'].get('abono_real_teorico', 0)
-                            
-                            # Round down to nearest 10
-                            goal = (abono_teorico // 10) * 10
-                            
-                            p2_item = payload[i].copy()
-                            p2_item['monto_objetivo'] = goal
-                            p2_item.pop('tasa_avance', None) # Remove fixed rate to let solver find it
-                            payload2.append(p2_item)
-
-                        # Call API 2: Goal Seek
-                        resp2 = requests.post(f"{API_BASE_URL}/encontrar_tasa_lote", json=payload2)
-                        resp2.raise_for_status()
-                        res2 = resp2.json()
-
-                        if res2.get("error"):
-                            st.error(res2['error'])
-                            st.stop()
+                        if CALC_CLIENT.transport == "inprocess":
+                            # Lot model: same numbers as calcular_lote; later edits recalculate only the affected invoices
+                            lote_model = st.session_state.get('lote_originacion') or LoteOriginacion()
+                            lote_model.recalcular(st.session_state.invoices_data, lot_conditions(), forzar=True).aplicar(st.session_state.invoices_data)
+                            st.session_state.lote_originacion = lote_model
+                        else:
+                            # Remote backend: one call per lot (desembolso inicial + búsqueda de tasa, objetivo redondeado a 10)
+                            payload = construir_payload(st.session_state.invoices_data, lot_conditions())
+                            res1, res2 = CALC_CLIENT.calcular_lote(payload)
 
-                        # Store Results
-                        for i, inv in enumerate(st.session_state.invoices_data):
-                            inv['recalculate_result'] = res2["resultados_por_factura"][i]
+                            # Store Results
+                            for i, inv in enumerate(st.session_state.invoices_data):
+                                inv.initial_calc_result = res1["resultados_por_factura"][i]
+                                inv.recalculate_result = res2["resultados_por_factura"][i]
 
                         st.success("✅ Cálculos Completados")
                         st.rerun()
@@ -1071,78 +1108,32 @@ if st.session_state.invoices_data:
                 with col_pdf_p:
                      if st.button("Generar PDF Perfil", disabled=not ready_metadata, use_container_width=True, type="primary"):
                         try:
-                            # Prepare data list for PDF generator
-                            pdf_list = []
-                            for inv in st.session_state.invoices_data:
-                                if inv.get('recalculate_result'):
-                                    # Inject global commission helper data expected by generator
-                                    inv['comision_de_estructuracion_global'] = st.session_state.comision_estructuracion_pct_global
-                                    inv['detraccion_monto'] = inv['monto_total_factura'] - inv['monto_neto_factura']
-                                    
-                                    # Inject Detected Metadata
-                                    inv['contract_number'] = st.session_state.contract_number
-                                    inv['anexo_number'] = st.session_state.anexo_number
-                                    
-                                    # Semantic Lote ID for PDF Header (Uses pre-calculated filtered string)
-                                    inv['lote_id'] = f"{base_path_string} | G{inv.get('group_id', '?')}"
-                                    
-                                    pdf_list.append(inv)
-                            
-                            if pdf_list:
-                                pdf_bytes = pdf_generators.generate_perfil_operacion_pdf(pdf_list)
-                                timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                                fname = f"perfil_operacion_{path_sanitized}_{timestamp}.pdf"
-                                st.session_state['last_generated_perfil_pdf'] = {'bytes': pdf_bytes, 'filename': fname}
-
+                            if render_report_pdfs([perfil_pdf_job(base_path_string)], path_sanitized):
+                                st.error("Error PDF: no se pudo generar el Perfil.")
                         except Exception as e:
                             st.error(f"Error PDF: {e}")
                     
                      # Download Link Logic
                      if 'last_generated_perfil_pdf' in st.session_state:
                         p = st.session_state['last_generated_perfil_pdf']
-                        st.download_button("⬇️ Descargar Perfil", p['bytes'], p['filename'], "application/pdf", use_container_width=True)
+                        p_bytes = SPILL_STORE.get(p['digest'])
+                        if p_bytes:
+                            st.download_button("⬇️ Descargar Perfil", p_bytes, p['filename'], "application/pdf", use_container_width=True)
 
                 with col_pdf_l:
                     if st.button("Generar PDF Liquidación", disabled=not ready_metadata, use_container_width=True, type="primary"):
                         try:
-                            # Same filtering logic
-                            pdf_list = [] 
-                            for inv in st.session_state.invoices_data:
-                                 if inv.get('recalculate_result'):
-                                    # Inject Detected Metadata logic might be needed inside generator or obj
-                                    inv['contract_number'] = st.session_state.contract_number
-                                    inv['anexo_number'] = st.session_state.anexo_number
-                                    pdf_list.append(inv)
-                                    
-                            if pdf_list:
-                                # Fetch Bank Info for Anexo (from First Invoice's Emisor)
-                                bank_info_dict = {}
-                                if pdf_list[0].get('emisor_ruc'):
-                                    raw_emisor_data = db.get_signatory_data_by_ruc(pdf_list[0]['emisor_ruc'])
-                                    if raw_emisor_data:
-                                        # Map DB columns to our needed keys (Bank, Account, CCI)
-                                        # DB Columns: 'Institucion Financiera', 'Numero de Cuenta PEN'/'Numero de Cuenta USD'
-                                        currency = pdf_list[0].get('moneda_factura', 'PEN')
-                                        suffix = "PEN" if currency == 'PEN' else "USD"
-                                        
-                                        bank_info_dict = {
-                                            'banco': raw_emisor_data.get('Institucion Financiera', 'N/A'),
-                                            'cuenta': raw_emisor_data.get(f'Numero de Cuenta {suffix}', 'N/A'),
-                                            'cci': raw_emisor_data.get(f'Numero de CCI {suffix}', 'N/A')
-                                        }
-
-                                pdf_bytes = pdf_generators.generar_anexo_liquidacion_pdf(pdf_list, bank_info=bank_info_dict)
-                                timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                                fname = f"anexo_liquidacion_{path_sanitized}_{timestamp}.pdf"
-                                st.session_state['last_generated_liquidacion_pdf'] = {'bytes': pdf_bytes, 'filename': fname}
-
+                            if render_report_pdfs([anexo_pdf_job()], path_sanitized):
+                                st.error("Error PDF: no se pudo generar la Liquidación.")
                         except Exception as e:
                             st.error(f"Error PDF: {e}")
 
                     # Download Link Logic
                     if 'last_generated_liquidacion_pdf' in st.session_state:
                         l = st.session_state['last_generated_liquidacion_pdf']
-                        st.download_button("⬇️ Descargar Liquidación", l['bytes'], l['filename'], "application/pdf", use_container_width=True)
+                        l_bytes = SPILL_STORE.get(l['digest'])
+                        if l_bytes:
+                            st.download_button("⬇️ Descargar Liquidación", l_bytes, l['filename'], "application/pdf", use_container_width=True)
 
 
         # --- FINAL SAVE BUTTON (Merged Action) ---
@@ -1160,7 +1151,19 @@ if st.session_state.invoices_data:
                          path_parts.pop(0)
 
                     base_path_string = " ".join(path_parts)
-                    
+
+                    # Reports not generated yet with the buttons above: rendered together, in parallel
+                    missing_jobs = []
+                    if 'last_generated_perfil_pdf' not in st.session_state:
+                        missing_jobs.append(perfil_pdf_job(base_path_string))
+                    if 'last_generated_liquidacion_pdf' not in st.session_state:
+                        missing_jobs.append(anexo_pdf_job())
+                    if any(missing_jobs):
+                        with st.spinner("Generando Perfil / Liquidación..."):
+                            path_sanitized = "_".join(path_parts).replace(" ", "_").replace("/", "-").replace("\\", "-")
+                            for key in render_report_pdfs(missing_jobs, path_sanitized):
+                                st.error(f"No se pudo generar el PDF de {key}.")
+
                     saved_count = 0
                     for idx, inv in enumerate(st.session_state.invoices_data):
                         # 1. Update metadata
@@ -1175,14 +1178,10 @@ if st.session_state.invoices_data:
                         # Re-locate the raw file from cache to upload
                         # (Ideally we should cache the drive link too, but for now simple re-upload logic or assume done)
                         # Note: This logic assumes we need to upload the PDF. 
-                        # In the new multi-bucket logic, we stored original bytes in 'original_uploads_cache'.
-                        
-                        # Find bytes
-                        file_bytes = None
-                        for cache in st.session_state.original_uploads_cache:
-                            if cache['name'] == inv['parsed_pdf_name']:
-                                file_bytes = cache['bytes']
-                                break
+                        # The original bytes are in the spill store under the invoice's file_digest.
+                        file_bytes = SPILL_STORE.get(inv.file_digest)
+                        if file_bytes is None and inv.file_digest:
+                            st.error(f"El PDF de {inv['numero_factura']} ya no está disponible en el servidor; no se subirá a Drive.")
                         
                         drive_link = ""
                         if file_bytes:
@@ -1238,7 +1237,11 @@ if st.session_state.invoices_data:
                         if 'last_generated_perfil_pdf' in st.session_state:
                             p_data = st.session_state['last_generated_perfil_pdf']
                             st.write(f"DEBUG: Subiendo Perfil Global... ({p_data['filename']})")
-                            success, fid = upload_file_with_sa(p_data['bytes'], p_data['filename'], folder_info['id'], sa_creds)
+                            report_bytes = SPILL_STORE.get(p_data['digest'])
+                            if report_bytes:
+                                success, fid = upload_file_with_sa(report_bytes, p_data['filename'], folder_info['id'], sa_creds)
+                            else:
+                                success, fid = False, "el PDF generado ya no está disponible; vuelve a generarlo"
                             if success: 
                                 st.toast(f"✅ Perfil subido: {p_data['filename']}")
                             else: 
@@ -1251,7 +1254,11 @@ if st.session_state.invoices_data:
                         if 'last_generated_liquidacion_pdf' in st.session_state:
                             l_data = st.session_state['last_generated_liquidacion_pdf']
                             st.write(f"DEBUG: Subiendo Anexo/Liquidación... ({l_data['filename']})")
-                            success, fid = upload_file_with_sa(l_data['bytes'], l_data['filename'], folder_info['id'], sa_creds)
+                            report_bytes = SPILL_STORE.get(l_data['digest'])
+                            if report_bytes:
+                                success, fid = upload_file_with_sa(report_bytes, l_data['filename'], folder_info['id'], sa_creds)
+                            else:
+                                success, fid = False, "el PDF generado ya no está disponible; vuelve a generarlo"
                             if success: 
                                 st.toast(f"✅ Liquidación/Anexo subido: {l_data['filename']}")
                             else: 
@@ -11,7 +11,12 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 # --- Module Imports from `src` ---
 from src.data import supabase_repository as db
+from src.data import json_codec
 from src.ui.email_component import render_email_sender
+from src.ui.proposal_queue import (
+    sincronizar_cola, invalidar_colas, render_paginacion_lotes, render_tabla_seleccion, seleccionar_lote
+)
+from src.ui.live_updates import render_vigilancia_cambios
 
 # --- Configuración de la Página ---
 st.set_page_config(
@@ -41,18 +46,13 @@ st.markdown('''<style>
 }
 </style>''', unsafe_allow_html=True)
 
-# --- Auto-Reload Logic on Entry ---
-if st.session_state.get('last_page') != '03_Aprobacion':
-    st.session_state.reload_data = True
-    st.session_state.last_page = '03_Aprobacion'
-
 # --- Inicialización del Session State ---
 if 'facturas_activas' not in st.session_state:
-    st.session_state.facturas_activas = []
+    st.session_state.facturas_activas = {} # proposal_id -> fila de la cola (páginas ya vistas)
 if 'facturas_seleccionadas_aprobacion' not in st.session_state:
     st.session_state.facturas_seleccionadas_aprobacion = {}
-if 'reload_data' not in st.session_state:
-    st.session_state.reload_data = True
+if 'estados_simulados_aprobacion' not in st.session_state:
+    st.session_state.estados_simulados_aprobacion = {}
 if 'last_approved_invoices' not in st.session_state:
     st.session_state.last_approved_invoices = [] # List of dicts {num, amount}
 if 'last_approved_total' not in st.session_state:
@@ -80,157 +80,103 @@ def safe_decimal(value, default=0.0):
 
 def get_monto_a_desembolsar(factura: dict) -> float:
     """Calcula el monto a desembolsar desde el JSON de recálculo"""
+    if 'monto_desembolsar' in factura:
+        return factura['monto_desembolsar'] # Ya extraído por la cola
     try:
         recalc_json = factura.get('recalculate_result_json', '{}')
         if isinstance(recalc_json, dict):
              recalc_data = recalc_json
         else:
-             recalc_data = json.loads(recalc_json)
+             recalc_data = json_codec.loads(recalc_json)
         
         return recalc_data.get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0.0)
     except (json.JSONDecodeError, AttributeError, TypeError):
         return 0.0
 
-def toggle_batch_selection(batch_key, invoice_ids):
-    """Callback para seleccionar/deseleccionar todo el lote"""
-    # El valor del checkbox maestro ya se actualizó en session_state antes de llamar al callback
-    master_val = st.session_state[batch_key]
-    for pid in invoice_ids:
-        # Actualizar el diccionario de valores lógicos
-        st.session_state.facturas_seleccionadas_aprobacion[pid] = master_val
-        # Actualizar el estado visual del widget (si existe o se va crear)
-        st.session_state[f"chk_app_{pid}"] = master_val
-
-def render_status_brick(text, is_green):
-    color = "#2e7d32" if is_green else "#c62828"
-    bg = "#e8f5e9" if is_green else "#ffebee"
-    return f"""
-    <div style="background-color: {bg}; color: {color}; padding: 2px 6px; border-radius: 4px; font-weight: bold; text-align: center; border: 1px solid {color}; font-size: 0.8em; width: fit-content;">
-        {text}
-    </div>
-    """
-
 # --- UI: CSS ---
 # --- UI: CSS & Header (Moved to top) ---
 
-# --- Cargar Facturas Activas Automáticamente ---
-if st.session_state.reload_data:
-    with st.spinner("Cargando facturas pendientes de aprobación..."):
-        st.session_state.facturas_activas = db.get_active_proposals_for_approval()
-        # Inicializar checkboxes y SIMULACIÓN DE ESTADOS
-        for f in st.session_state.facturas_activas:
-            pid = f['proposal_id']
-            # Inicializar en el diccionario lógico
-            if pid not in st.session_state.facturas_seleccionadas_aprobacion:
-                st.session_state.facturas_seleccionadas_aprobacion[pid] = False
-            
-            # Inicializar la KEY del widget
-            widget_key = f"chk_app_{pid}"
-            if widget_key not in st.session_state:
-                st.session_state[widget_key] = st.session_state.facturas_seleccionadas_aprobacion[pid]
-
-            # --- SIMULACIÓN DE ESTADOS RANDOM ---
-            # Solo asignar si no existen, para mantener consistencia en la sesión
-            if 'status_cavali' not in f:
-                f['status_cavali'] = random.choice(['ENVIADO', 'CONFIRMADA'])
-            if 'status_letra' not in f:
-                f['status_letra'] = random.choice(['ENVIADA', 'FIRMADA'])
-                
-        st.session_state.reload_data = False
+# --- Cargar Facturas Activas (cola paginada por lote, al día con los cambios en vivo) ---
+with st.spinner("Cargando facturas pendientes de aprobación..."):
+    cola, salieron = sincronizar_cola('aprobacion', 'ACTIVO')
+if salieron is None:
+    # Cola recargada desde la BD: las filas se vuelven a registrar al mostrarse
+    st.session_state.facturas_activas = {}
+else:
+    # Aprobadas/retiradas por otra sesión mientras se mostraban
+    for pid in salieron:
+        st.session_state.facturas_activas.pop(pid, None)
+        st.session_state.facturas_seleccionadas_aprobacion.pop(pid, None)
+lotes_pendientes = cola.lotes
+render_vigilancia_cambios('aprobacion')
 
 # --- Mostrar Facturas Pendientes ---
-if not st.session_state.facturas_activas:
+if not lotes_pendientes:
     st.info("✅ No hay facturas pendientes de aprobación en este momento.")
     # Button moved to Sidebar
 else:
-    # Agrupar por Lote
-    grouped_invoices = defaultdict(list)
-    for inv in st.session_state.facturas_activas:
-        lote_id = inv.get('identificador_lote', 'Sin Lote')
-        grouped_invoices[lote_id].append(inv)
-    
     with st.container(border=True):
         st.subheader("1. Facturas Pendientes de Aprobación")
-        
-        # Button moved to Sidebar
-        
+        lotes_pagina = render_paginacion_lotes(lotes_pendientes, key="aprobacion")
+
+        facturas_pagina = cola.filas_de([l['identificador_lote'] for l in lotes_pagina])
+        grouped_invoices = defaultdict(list)
+        for f in facturas_pagina:
+            pid = f['proposal_id']
+            # --- SIMULACIÓN DE ESTADOS RANDOM ---
+            # Solo asignar si no existen, para mantener consistencia en la sesión
+            estados = st.session_state.estados_simulados_aprobacion.setdefault(pid, {
+                'status_cavali': random.choice(['ENVIADO', 'CONFIRMADA']),
+                'status_letra': random.choice(['ENVIADA', 'FIRMADA']),
+            })
+            f.update(estados)
+            st.session_state.facturas_activas[pid] = f
+            grouped_invoices[f['identificador_lote']].append(f)
+
         st.markdown("---")
-        
+
+        seleccion = st.session_state.facturas_seleccionadas_aprobacion
         # Iterar por cada grupo (Lote)
-        for lote_id, invoices_in_batch in grouped_invoices.items():
-            
-            # Obtener datos del lote (Emisor fecha) del primer elemento
-            first_inv = invoices_in_batch[0]
-            emisor_name = first_inv.get('emisor_nombre', 'N/A')
-            created_at = first_inv.get('created_at', '') # Si existe
-            
-            # IDs de este lote
+        for lote in lotes_pagina:
+            lote_id = lote['identificador_lote']
+            invoices_in_batch = grouped_invoices.get(lote_id, [])
+            if not invoices_in_batch:
+                continue
             batch_pids = [inv['proposal_id'] for inv in invoices_in_batch]
-            
-            # Calcular estado actual del "Select All" para este lote
-            all_selected = all(st.session_state.facturas_seleccionadas_aprobacion.get(pid, False) for pid in batch_pids)
-        
-        with st.container(border=True):
-            # Header del Lote (Clean)
-            st.markdown(f"**Lote:** `{lote_id}` | **Emisor:** {emisor_name} | **Cant:** {len(invoices_in_batch)}")
-            
-            # Header de la Tablita
-            col_check, col_factura, col_aceptante, col_monto, col_desembolso, col_cavali, col_letra = st.columns([0.4, 1.2, 1.8, 1.0, 1.0, 1.1, 1.1])
-            
-            with col_check: 
-                # Checkbox Maestro para este lote
+            # La key cambia con las filas: las ediciones pendientes no se aplican a otras facturas
+            editor_key = f"tabla_aprobacion_{lote_id}_{hash(tuple(batch_pids))}"
+
+            with st.container(border=True):
+                # Header del Lote (Clean)
+                col_info, col_all = st.columns([4, 1])
+                col_info.markdown(f"**Lote:** `{lote_id}` | **Emisor:** {lote['emisor_nombre']} | **Cant:** {len(invoices_in_batch)}")
+                render_tabla_seleccion(
+                    invoices_in_batch,
+                    {
+                        "Factura": lambda f: parse_invoice_number(f['proposal_id']),
+                        "Aceptante": lambda f: f.get('aceptante_nombre') or 'N/A',
+                        "Moneda": lambda f: f.get('moneda_factura') or 'PEN',
+                        "M. Neto": lambda f: safe_decimal(f.get('monto_neto_factura', 0)),
+                        "Desembolso": get_monto_a_desembolsar,
+                        "Est. Cavali": lambda f: ('🟢 ' if f['status_cavali'] == 'CONFIRMADA' else '🔴 ') + f['status_cavali'],
+                        "Est. Letra": lambda f: ('🟢 ' if f['status_letra'] == 'FIRMADA' else '🔴 ') + f['status_letra'],
+                    },
+                    seleccion,
+                    key=editor_key,
+                    column_config={
+                        "M. Neto": st.column_config.NumberColumn(format="%.2f"),
+                        "Desembolso": st.column_config.NumberColumn(format="%.2f"),
+                    },
+                )
+                # Checkbox Maestro para este lote (después de la tabla: refleja lo recién marcado)
                 batch_key = f"select_all_{lote_id}"
-                st.checkbox(
-                    "Todo", # Label corto o vacío
-                    value=all_selected,
+                st.session_state[batch_key] = all(seleccion.get(pid, False) for pid in batch_pids)
+                col_all.checkbox(
+                    "Todo el lote",
                     key=batch_key,
-                    on_change=toggle_batch_selection,
-                    args=(batch_key, batch_pids),
-                    label_visibility="collapsed"
+                    on_change=seleccionar_lote,
+                    args=(seleccion, batch_pids, batch_key, editor_key),
                 )
-            with col_factura: st.markdown("**Factura**")
-            with col_aceptante: st.markdown("**Aceptante**")
-            with col_monto: st.markdown("**M. Neto**")
-            with col_desembolso: st.markdown("**Desembolso**")
-            with col_cavali: st.markdown("**Est. Cavali**")
-            with col_letra: st.markdown("**Est. Letra**")
-            
-            # Filas
-            for idx, factura in enumerate(invoices_in_batch):
-                col_check, col_factura, col_aceptante, col_monto, col_desembolso, col_cavali, col_letra = st.columns([0.4, 1.2, 1.8, 1.0, 1.0, 1.1, 1.1])
-                
-                with col_check:
-                    # Usamos el ID real como key del checkbox
-                    pid = factura['proposal_id']
-                    # IMPORTANTE: No pasar 'value' si ya existe en session_state para evitar warning
-                    # El valor se maneja via key y callbacks
-                    is_checked = st.checkbox(
-                        "",
-                        # value=... REMOVED to avoid conflict with key in session_state
-                        key=f"chk_app_{pid}", # Unique Key per invoice
-                        label_visibility="collapsed"
-                    )
-                    # Sincronizar el diccionario lógico con el widget
-                    st.session_state.facturas_seleccionadas_aprobacion[pid] = is_checked
-                
-                with col_factura: st.markdown(f"`{parse_invoice_number(factura['proposal_id'])}`")
-                with col_aceptante: st.markdown(factura.get('aceptante_nombre', 'N/A'))
-                with col_monto:
-                    monto = safe_decimal(factura.get('monto_neto_factura', 0))
-                    moneda = factura.get('moneda_factura', 'PEN')
-                    st.markdown(f"{moneda} {monto:,.2f}")
-                with col_desembolso:
-                    monto_des = get_monto_a_desembolsar(factura)
-                    moneda = factura.get('moneda_factura', 'PEN')
-                    # Resaltar en negrita si es > 0, es el valor clave
-                    val_str = f"**{moneda} {monto_des:,.2f}**" if monto_des > 0 else f"{moneda} 0.00"
-                    st.markdown(val_str)
-                with col_cavali:
-                    stat = factura.get('status_cavali', 'PENDIENTE')
-                    st.markdown(render_status_brick(stat, stat=='CONFIRMADA'), unsafe_allow_html=True)
-                with col_letra:
-                    stat = factura.get('status_letra', 'PENDIENTE')
-                    st.markdown(render_status_brick(stat, stat=='FIRMADA'), unsafe_allow_html=True)
 
         st.markdown("---")
         
@@ -258,8 +204,8 @@ else:
             ]
             
             selected_invoices_objs = [
-                f for f in st.session_state.facturas_activas 
-                if f['proposal_id'] in selected_ids
+                st.session_state.facturas_activas[pid] for pid in selected_ids
+                if pid in st.session_state.facturas_activas
             ]
             
             if not selected_invoices_objs:
@@ -299,6 +245,8 @@ else:
                 proposal_id = invoice['proposal_id']
                 try:
                     db.update_proposal_status(proposal_id, 'APROBADO')
+                    st.session_state.facturas_seleccionadas_aprobacion.pop(proposal_id, None)
+                    st.session_state.facturas_activas.pop(proposal_id, None)
                     
                     inv_num = parse_invoice_number(proposal_id)
                     mont_des = get_monto_a_desembolsar(invoice)
@@ -328,8 +276,7 @@ else:
             if error_count > 0:
                 st.error(f"⚠️ Hubo errores en {error_count} factura(s).")
             
-            # Recargar y rerun automático (sin botón Continuar)
-            st.session_state.reload_data = True
+            # Rerun automático (sin botón Continuar): update_proposal_status cambió el token de la cola
             st.rerun()
 
 
@@ -374,5 +321,7 @@ with st.container(border=True):
 with st.sidebar:
     st.markdown('---')
     if st.button(' Recargar Data', type='primary', use_container_width=True, help='Actualizar la lista de facturas pendientes'):
-        st.session_state.reload_data = True
+        invalidar_colas()
+        st.session_state.facturas_activas = {}
+        st.session_state.facturas_seleccionadas_aprobacion = {}
         st.rerun()
@@ -4,7 +4,6 @@ import sys
 import datetime
 import json
 import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Path Setup ---
 # Add root directory to path to allow imports from src
@@ -12,9 +11,17 @@ sys.path.append(os.path.abspath("."))
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
 from src.data import supabase_repository as db
-from src.utils.google_integration import render_folder_navigator_v2, upload_file_with_sa
+from src.data import json_codec
+from src.utils.google_integration import render_folder_navigator_v2
+from src.services.drive_uploader import create_sa_upload_manager, format_upload_stats
+from src.services.job_queue import enqueue_drive_uploads, ensure_worker_running
+from src.ui.job_status_component import render_job_batch_status
 from src.ui.email_component import render_email_sender
-from src.utils.pdf_generators import generar_voucher_transferencia_pdf
+from src.ui.proposal_queue import (
+    sincronizar_cola, invalidar_colas, render_paginacion_lotes, render_tabla_seleccion
+)
+from src.ui.live_updates import render_vigilancia_cambios
+from src.services.document_renderer import render_documents_to_dict
 
 # --- Estrategia Unificada para la URL del Backend ---
 API_BASE_URL = os.getenv("BACKEND_API_URL")
@@ -69,11 +76,9 @@ if not check_user_access("Desembolso", user_email):
 
 # --- Inicialización del Session State ---
 if 'facturas_aprobadas' not in st.session_state:
-    st.session_state.facturas_aprobadas = []
+    st.session_state.facturas_aprobadas = {} # proposal_id -> fila de la cola (páginas ya vistas)
 if 'facturas_seleccionadas_desembolso' not in st.session_state:
     st.session_state.facturas_seleccionadas_desembolso = {}
-if 'reload_data' not in st.session_state:
-    st.session_state.reload_data = True
 
 # Voucher State
 if 'voucher_generado' not in st.session_state:
@@ -94,6 +99,8 @@ if 'individual_proof_files' not in st.session_state:
     st.session_state.individual_proof_files = {}
 if 'resultados_desembolso' not in st.session_state:
     st.session_state.resultados_desembolso = None
+if 'lote_desembolsado' not in st.session_state:
+    st.session_state.lote_desembolsado = [] # Facturas del último desembolso (salen de la cola al registrarse)
 
 # --- Funciones de Ayuda ---
 def parse_invoice_number(proposal_id: str) -> str:
@@ -104,34 +111,48 @@ def parse_invoice_number(proposal_id: str) -> str:
         return proposal_id
 
 def get_monto_a_desembolsar(factura: dict) -> float:
+    if 'monto_desembolsar' in factura:
+        return factura['monto_desembolsar'] # Ya extraído por la cola
     try:
         recalc_json = factura.get('recalculate_result_json', '{}')
-        recalc_data = json.loads(recalc_json)
+        recalc_data = json_codec.loads(recalc_json)
         return recalc_data.get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0.0)
     except (json.JSONDecodeError, AttributeError, TypeError):
         return 0.0
 
-def upload_helper(file_bytes, file_name, folder_id, sa_creds):
-    try:
-        if not file_bytes:
-            return False, f"Sin contenido: {file_name}"
-        # USA SERVICE ACCOUNT
-        success, res_id = upload_file_with_sa(file_bytes, file_name, folder_id, sa_creds)
-        if success:
-             return True, f"Subido (SA): {file_name}"
+def upload_files_now(upload_tasks, folder_id):
+    """Carga síncrona (respaldo si la cola en segundo plano no está disponible)."""
+    results_msg = []
+    errors_count = 0
+    curr_bar = st.progress(0, text="Iniciando carga de archivos...")
+    total_files = len(upload_tasks)
+    uploader = create_sa_upload_manager(SA_CREDENTIALS)
+    for i, res in enumerate(uploader.upload_many(upload_tasks, folder_id)):
+        if res['success']:
+            results_msg.append(f"Subido (SA): {res['name']}")
         else:
-             return False, f"Error {file_name}: {res_id}" 
-    except Exception as e:
-        return False, f"Error {file_name}: {str(e)}"
-
-# --- Cargar Facturas ---
-if st.session_state.reload_data:
-    with st.spinner("Cargando facturas aprobadas pendientes de desembolso..."):
-        st.session_state.facturas_aprobadas = db.get_approved_proposals_for_disbursement()
-        st.session_state.facturas_seleccionadas_desembolso = {
-            f['proposal_id']: False for f in st.session_state.facturas_aprobadas
-        }
-        st.session_state.reload_data = False
+            errors_count += 1
+            results_msg.append(f"Error {res['name']}: {res['result']}")
+        curr_bar.progress((i + 1) / total_files, text=f"Subiendo {i+1}/{total_files}...")
+    curr_bar.empty()
+    st.caption(format_upload_stats(uploader.last_stats))
+    for msg in results_msg:
+        if msg.startswith("Error"): st.error(msg)
+        else: st.write(msg)
+    return results_msg, errors_count
+
+# --- Cargar Facturas (cola paginada por lote, al día con los cambios en vivo) ---
+with st.spinner("Cargando facturas aprobadas pendientes de desembolso..."):
+    cola, salieron = sincronizar_cola('desembolso', 'APROBADO')
+if salieron is None:
+    # Cola recargada desde la BD: las filas se vuelven a registrar al mostrarse
+    st.session_state.facturas_aprobadas = {}
+else:
+    # Desembolsadas/retiradas por otra sesión: dejan de estar seleccionables
+    for pid in salieron:
+        st.session_state.facturas_aprobadas.pop(pid, None)
+        st.session_state.facturas_seleccionadas_desembolso.pop(pid, None)
+lotes_aprobados = cola.lotes
 
 # --- UI: Header con Logos (Estandarizado) ---
 # (Moved to top)
@@ -142,44 +163,38 @@ if st.session_state.reload_data:
 # ==============================================================================
 with st.container(border=True):
     st.subheader("1. Facturas Pendientes")
-    
-    # Filtrar seleccionadas
-    facturas_seleccionadas = [
-        f for f in st.session_state.facturas_aprobadas
-        if st.session_state.facturas_seleccionadas_desembolso.get(f['proposal_id'], False)
-    ]
+    render_vigilancia_cambios('desembolso')
 
-    if not st.session_state.facturas_aprobadas:
+    if not lotes_aprobados:
         st.info("No hay facturas aprobadas pendientes de desembolso.")
     else:
-        # Header de la tabla
-        cols = st.columns([0.5, 1.5, 1.5, 2, 2, 1.5])
-        headers = ["Sel", "Factura", "Lote", "Emisor", "Aceptante", "Monto"]
-        for col, h in zip(cols, headers): 
-            col.markdown(f"**{h}**")
-            
-        for idx, factura in enumerate(st.session_state.facturas_aprobadas):
-            col_check, col_factura, col_lote, col_emisor, col_aceptante, col_monto = st.columns([0.5, 1.5, 1.5, 2, 2, 1.5])
-            
-            with col_check:
-                st.session_state.facturas_seleccionadas_desembolso[factura['proposal_id']] = st.checkbox(
-                    "",
-                    value=st.session_state.facturas_seleccionadas_desembolso.get(factura['proposal_id'], False),
-                    key=f"check_bu_{idx}",
-                    label_visibility="collapsed"
-                )
-                
-            col_factura.markdown(f"`{parse_invoice_number(factura['proposal_id'])}`")
-            col_lote.markdown(f"`{factura.get('identificador_lote', 'N/A')}`")
-            col_emisor.markdown(factura.get('emisor_nombre', 'N/A'))
-            col_aceptante.markdown(factura.get('aceptante_nombre', 'N/A'))
-            col_monto.markdown(f"{factura.get('moneda_factura', 'PEN')} {get_monto_a_desembolsar(factura):,.2f}")
-
-        # Re-evaluar seleccionadas
-        facturas_seleccionadas = [
-            f for f in st.session_state.facturas_aprobadas
-            if st.session_state.facturas_seleccionadas_desembolso.get(f['proposal_id'], False)
-        ]
+        lotes_pagina = render_paginacion_lotes(lotes_aprobados, key="desembolso")
+        facturas_pagina = cola.filas_de([l['identificador_lote'] for l in lotes_pagina])
+        for factura in facturas_pagina:
+            st.session_state.facturas_aprobadas[factura['proposal_id']] = factura
+
+        render_tabla_seleccion(
+            facturas_pagina,
+            {
+                "Factura": lambda f: parse_invoice_number(f['proposal_id']),
+                "Lote": lambda f: f.get('identificador_lote', 'N/A'),
+                "Emisor": lambda f: f.get('emisor_nombre') or 'N/A',
+                "Aceptante": lambda f: f.get('aceptante_nombre') or 'N/A',
+                "Moneda": lambda f: f.get('moneda_factura') or 'PEN',
+                "Monto": get_monto_a_desembolsar,
+            },
+            st.session_state.facturas_seleccionadas_desembolso,
+            # La key cambia con las filas: las ediciones pendientes no se aplican a otras facturas
+            key=f"tabla_desembolso_{hash(tuple(f['proposal_id'] for f in facturas_pagina))}",
+            column_config={"Monto": st.column_config.NumberColumn(format="%.2f")},
+        )
+
+    # Seleccionadas (de cualquier página ya vista)
+    facturas_seleccionadas = [
+        f for pid, f in st.session_state.facturas_aprobadas.items()
+        if st.session_state.facturas_seleccionadas_desembolso.get(pid, False)
+    ]
+    if lotes_aprobados:
         st.caption(f"Registros seleccionados: {len(facturas_seleccionadas)}")
 
 if not facturas_seleccionadas:
@@ -232,13 +247,17 @@ else:
                             'monto': get_monto_a_desembolsar(f)
                         } for f in facturas_seleccionadas]
                         
-                        pdf_bytes = generar_voucher_transferencia_pdf(
-                            datos_emisor=datos_emisor,
-                            monto_total=monto_total,
-                            moneda=moneda,
-                            facturas=facturas_para_pdf,
-                            fecha_generacion=datetime.date.today()
-                        )
+                        pdf_bytes = render_documents_to_dict([{
+                            'key': 'voucher',
+                            'report': 'generar_voucher_transferencia_pdf',
+                            'kwargs': dict(
+                                datos_emisor=datos_emisor,
+                                monto_total=monto_total,
+                                moneda=moneda,
+                                facturas=facturas_para_pdf,
+                                fecha_generacion=datetime.date.today()
+                            ),
+                        }])['voucher']
                         
                         if pdf_bytes:
                             st.session_state.voucher_generado = True
@@ -379,6 +398,9 @@ else:
                              response.raise_for_status()
                              st.session_state.resultados_desembolso = response.json()
                              api_success = True
+                             st.session_state.lote_desembolsado = [dict(f) for f in facturas_seleccionadas]
+                             # La API escribió en otro proceso: el token local no cambió
+                             invalidar_colas()
                         else:
                              st.error("No API URL")
                     except Exception as e:
@@ -417,29 +439,19 @@ else:
                         errors_count = 0
                         
                         if upload_tasks:
-                            curr_bar = st.progress(0, text="Iniciando carga de archivos...")
-                            total_files = len(upload_tasks)
-                            
-                            with ThreadPoolExecutor(max_workers=5) as executor:
-                                future_to_file = {
-                                    executor.submit(upload_helper, b, n, folder_id, SA_CREDENTIALS): n 
-                                    for b, n in upload_tasks
-                                }
-                                
-                                for i, future in enumerate(as_completed(future_to_file)):
-                                    success, msg = future.result()
-                                    results_msg.append(msg)
-                                    if not success:
-                                        errors_count += 1
-                                    prog = (i + 1) / total_files
-                                    curr_bar.progress(prog, text=f"Subiendo {i+1}/{total_files}...")
-                            
-                            curr_bar.empty()
-                            
-                            with st.expander("Resultados de Carga", expanded=errors_count > 0):
-                                for msg in results_msg:
-                                    if "Error" in msg: st.error(msg)
-                                    else: st.write(msg)
+                            # Se suben en segundo plano (job_queue): la página no se bloquea
+                            try:
+                                st.session_state.upload_batch_desembolso = enqueue_drive_uploads(upload_tasks, folder_id)
+                            except Exception as e:
+                                st.warning(f"No se pudo encolar la carga ({e}). Subiendo directamente...")
+                                results_msg, errors_count = upload_files_now(upload_tasks, folder_id)
+                            else:
+                                st.info(f"📤 {len(upload_tasks)} archivos encolados para Google Drive.")
+                                # Ya están en la cola: si el worker no arranca ahora, no se suben también aquí (se duplicarían)
+                                try:
+                                    ensure_worker_running()
+                                except Exception as e:
+                                    st.warning(f"Archivos encolados, pero no se pudo iniciar el proceso de carga ({e}). Se subirán cuando arranque.")
                         
                         st.balloons()
                         st.success("¡Desembolso Completado Exitosamente!")
@@ -476,39 +488,52 @@ else:
                         for res in st.session_state.resultados_desembolso.get('resultados_del_lote', []):
                                 if res.get('status') == 'SUCCESS':
                                     pass
-                        
-                        if st.button("Recargar Página"):
-                            st.session_state.reload_data = True
-                            st.session_state.show_email_desembolso = False # Reset on reload
-                            st.rerun()
 
         else:
              st.warning("Navega y selecciona una carpeta destino para habilitar el botón final.")
 
 
-    if st.session_state.get('show_email_desembolso', False):
-         with st.container(border=True):
-             st.subheader("5. Envío de Reportes por Correo")
-             
-             # Try to get meaningful default subject
-             lote_id = "Lote"
-             if facturas_seleccionadas:
-                 lote_id = facturas_seleccionadas[0].get('identificador_lote', 'Lote')
-             
-             render_email_sender(
-                 key_suffix="desembolso", 
-                 documents=st.session_state.get('email_docs_desembolso', []),
-                 default_subject=f"Sustentos de Desembolso - {lote_id}",
-                 default_email=""
-             )
-    
-    elif facturas_seleccionadas and not selected_folder:
-        pass # Warning already shown above
+# ==============================================================================
+# RESULTADOS DEL DESEMBOLSO
+# ==============================================================================
+# Fuera de la sección de selección: las facturas desembolsadas salen de la cola
+# (y de la selección) en el siguiente rerun, pero su carga y su correo siguen aquí
+if st.session_state.get('upload_batch_desembolso'):
+    with st.container(border=True):
+        render_job_batch_status(st.session_state.upload_batch_desembolso, key_suffix="desembolso")
+
+if st.session_state.get('show_email_desembolso', False):
+    with st.container(border=True):
+        st.subheader("5. Envío de Reportes por Correo")
+
+        # Try to get meaningful default subject
+        lote_id = "Lote"
+        if st.session_state.lote_desembolsado:
+            lote_id = st.session_state.lote_desembolsado[0].get('identificador_lote', 'Lote')
+
+        render_email_sender(
+            key_suffix="desembolso",
+            documents=st.session_state.get('email_docs_desembolso', []),
+            default_subject=f"Sustentos de Desembolso - {lote_id}",
+            default_email="",
+            background=True
+        )
+
+if st.session_state.lote_desembolsado:
+    if st.button("Recargar Página"):
+        st.session_state.facturas_aprobadas = {}
+        st.session_state.facturas_seleccionadas_desembolso = {}
+        st.session_state.show_email_desembolso = False # Reset on reload
+        st.session_state.upload_batch_desembolso = None
+        st.session_state.lote_desembolsado = []
+        st.rerun()
 
 
 # --- Sidebar Boton Rojo ---
 with st.sidebar:
     st.markdown('---')
     if st.button('🔄 Actualizar', key='sidebar_refresh_btn', type='primary', use_container_width=True, help='Recargar lista desde Base de Datos'):
-        st.session_state.reload_data = True
+        invalidar_colas()
+        st.session_state.facturas_aprobadas = {}
+        st.session_state.facturas_seleccionadas_desembolso = {}
         st.rerun()
@@ -4,15 +4,19 @@ import streamlit as st
 import datetime
 import json
 from decimal import Decimal, InvalidOperation
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --- Path Setup & Module Imports ---
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 from src.data import supabase_repository as db
+from src.data import json_codec
 from src.core.factoring_system import SistemaFactoringCompleto
 from src.utils.pdf_generators import generate_liquidacion_universal_pdf
-from src.utils.google_integration import render_folder_navigator_v2, upload_file_with_sa
+from src.utils.google_integration import render_folder_navigator_v2
+from src.services.drive_uploader import create_sa_upload_manager, format_upload_stats
+from src.services.job_queue import enqueue_drive_uploads, ensure_worker_running
+from src.ui.job_status_component import render_job_batch_status
 from src.ui.email_component import render_email_sender
+from src.ui.live_updates import consumir_cambios, reiniciar_cursor, render_vigilancia_cambios
 
 # --- Page Config ---
 st.set_page_config(
@@ -151,18 +155,26 @@ def serialize_resultado_for_json(resultado: dict) -> dict:
             serialized[key] = value
     return serialized
 
-def upload_helper(file_bytes, file_name, folder_id, sa_creds):
-    try:
-        if not file_bytes:
-            return False, f"Sin contenido: {file_name}"
-        # USA SERVICE ACCOUNT - Reusando la lógica de Desembolso
-        success, res_id = upload_file_with_sa(file_bytes, file_name, folder_id, sa_creds)
-        if success:
-             return True, f"Subido: {file_name}"
+def upload_files_now(upload_tasks, folder_id):
+    """Carga síncrona (respaldo si la cola en segundo plano no está disponible)."""
+    results_msg = []
+    errors_count = 0
+    curr_bar = st.progress(0, text="Iniciando carga de archivos...")
+    total_files = len(upload_tasks)
+    uploader = create_sa_upload_manager(SA_CREDENTIALS)
+    for i, res in enumerate(uploader.upload_many(upload_tasks, folder_id)):
+        if res['success']:
+            results_msg.append(f"Subido: {res['name']}")
         else:
-             return False, f"Error {file_name}: {res_id}" 
-    except Exception as e:
-        return False, f"Error {file_name}: {str(e)}"
+            errors_count += 1
+            results_msg.append(f"Error {res['name']}: {res['result']}")
+        curr_bar.progress((i + 1) / total_files, text=f"Subiendo {i+1}/{total_files}...")
+    curr_bar.empty()
+    st.caption(format_upload_stats(uploader.last_stats))
+    for msg in results_msg:
+        if msg.startswith("Error"): st.error(msg)
+        else: st.write(msg)
+    return results_msg, errors_count
 
 def generar_tabla_calculo_liquidacion(resultado: dict, factura_original: dict) -> str:
     """
@@ -217,7 +229,7 @@ def generar_tabla_calculo_liquidacion(resultado: dict, factura_original: dict) -
     
     if factura_original:
         try:
-            recalc_json = json.loads(factura_original.get('recalculate_result_json', '{}'))
+            recalc_json = json_codec.loads(factura_original.get('recalculate_result_json', '{}'))
             # desglose = recalc_json.get('desglose_final_detallado', {}) # Unused
             calculos = recalc_json.get('calculo_con_tasa_encontrada', {})
             
@@ -345,6 +357,8 @@ def mostrar_busqueda_universal():
             st.session_state.lote_encontrado_universal = []
         else:
             with st.spinner("Buscando facturas por liquidar..."):
+                reiniciar_cursor('liquidacion')  # Los cambios posteriores se muestran en vivo
+                st.session_state.actividad_liquidacion = []
                 resultados = db.get_disbursed_proposals_by_lote(lote_id_sanitized)
                 if resultados:
                     st.success(f"Se encontraron {len(resultados)} facturas desembolsadas.")
@@ -360,8 +374,36 @@ def mostrar_busqueda_universal():
                 else:
                     st.warning("No se encontraron facturas para el identificador de lote proporcionado.")
 
+def aplicar_cambios_en_vivo():
+    """Parcha el estado de las facturas del lote con los cambios recibidos (change_feed)."""
+    cambios = consumir_cambios('liquidacion', ('propuestas', 'liquidacion_eventos'))
+    if cambios is None:
+        st.warning("Se perdieron actualizaciones en vivo. Vuelve a buscar el lote para ver el estado actual.")
+        return
+    facturas = {f.get('proposal_id'): f for f in st.session_state.lote_encontrado_universal}
+    actividad = st.session_state.setdefault('actividad_liquidacion', [])
+    for cambio in cambios:
+        registro = cambio['record']
+        if cambio['table'] == 'propuestas':
+            factura = facturas.get(registro.get('proposal_id'))
+            nuevo_estado = registro.get('estado')
+            if factura is not None and nuevo_estado and factura.get('estado') != nuevo_estado:
+                factura['estado'] = nuevo_estado
+                actividad.append(f"Factura {parse_invoice_number(factura['proposal_id'])}: estado {nuevo_estado}")
+        elif cambio['table'] == 'liquidacion_eventos' and cambio['type'] == 'INSERT':
+            actividad.append(
+                f"Evento de liquidación registrado: {registro.get('tipo_evento', 'N/A')} "
+                f"({registro.get('fecha_evento', '')}, monto {registro.get('monto_recibido', 0)})"
+            )
+
 def mostrar_liquidacion_universal():
     st.header("Paso 2: Configurar y Ejecutar Liquidación")
+    aplicar_cambios_en_vivo()
+    render_vigilancia_cambios('liquidacion', ('propuestas', 'liquidacion_eventos'))
+    if st.session_state.get('actividad_liquidacion'):
+        with st.expander(f"Actividad reciente ({len(st.session_state.actividad_liquidacion)})"):
+            for linea in st.session_state.actividad_liquidacion[-20:]:
+                st.write(linea)
     if st.button("<- Volver a la búsqueda"):
         st.session_state.vista_actual_universal = 'busqueda'
         st.session_state.lote_encontrado_universal = []
@@ -372,6 +414,7 @@ def mostrar_liquidacion_universal():
         st.session_state.fechas_pago_individuales = {} # Limpiar fechas individuales
         st.session_state.previous_global_date = None # Resetear fecha previa
         st.session_state.show_email_liquidacion = False
+        st.session_state.upload_batch_liquidacion = None
         st.rerun()
 
     # Inicializar fechas individuales si no existen (primera vez que se carga el lote)
@@ -489,7 +532,7 @@ def mostrar_liquidacion_universal():
                 fecha_pago_factura = fechas_pago_inputs.get(proposal_id, st.session_state.global_liquidation_date_universal)  # Nuevo: usar fecha individual
                 
                 try:
-                    recalc_json = json.loads(factura.get('recalculate_result_json', '{}'))
+                    recalc_json = json_codec.loads(factura.get('recalculate_result_json', '{}'))
                     calculo_tasa = recalc_json.get('calculo_con_tasa_encontrada', {})
                     desglose = recalc_json.get('desglose_final_detallado', {})
 
@@ -619,26 +662,19 @@ def mostrar_liquidacion_universal():
                      errors_count = 0
                      
                      if upload_tasks:
-                         curr_bar = st.progress(0, text="Iniciando subida de archivos...")
-                         total_files = len(upload_tasks)
-                         
-                         with ThreadPoolExecutor(max_workers=5) as executor:
-                             # Submit all
-                             future_to_file = {
-                                 executor.submit(upload_helper, b, n, folder_id, SA_CREDENTIALS): n 
-                                 for b, n in upload_tasks
-                             }
-                             
-                             for i, future in enumerate(as_completed(future_to_file)):
-                                 success, msg = future.result()
-                                 results_msg.append(msg)
-                                 if not success:
-                                     errors_count += 1
-                                 prog = (i + 1) / total_files
-                                 curr_bar.progress(prog, text=f"Subiendo {i+1}/{total_files}...")
-                         
-                         curr_bar.empty()
-                         st.write(results_msg)
+                         # Se suben en segundo plano (job_queue): la página no se bloquea
+                         try:
+                             st.session_state.upload_batch_liquidacion = enqueue_drive_uploads(upload_tasks, folder_id)
+                         except Exception as e:
+                             st.warning(f"No se pudo encolar la carga ({e}). Subiendo directamente...")
+                             results_msg, errors_count = upload_files_now(upload_tasks, folder_id)
+                         else:
+                             st.info(f"📤 {len(upload_tasks)} archivos encolados para Google Drive.")
+                             # Ya están en la cola: si el worker no arranca ahora, no se suben también aquí (se duplicarían)
+                             try:
+                                 ensure_worker_running()
+                             except Exception as e:
+                                 st.warning(f"Archivos encolados, pero no se pudo iniciar el proceso de carga ({e}). Se subirán cuando arranque.")
 
                      # 4. Save to DB
                      count_saved = 0
@@ -684,6 +720,11 @@ def mostrar_liquidacion_universal():
         else:
              st.warning("Selecciona carpeta para guardar.")
 
+    # --- ESTADO DE CARGAS EN SEGUNDO PLANO ---
+    if st.session_state.get('upload_batch_liquidacion'):
+         with st.container(border=True):
+             render_job_batch_status(st.session_state.upload_batch_liquidacion, key_suffix="liquidacion")
+
     # --- RENDER EMAIL SENDER OUTSIDE BUTTON SCOPE ---
     if st.session_state.get('show_email_liquidacion', False):
          st.markdown("---")
@@ -698,7 +739,8 @@ def mostrar_liquidacion_universal():
              key_suffix="liquidacion", 
              documents=st.session_state.get('email_docs_liquidacion', []),
              default_subject=f"Liquidación - {lote_id}",
-             default_email="" # Pending: Fetch client email from DB if available
+             default_email="", # Pending: Fetch client email from DB if available
+             background=True
          )
     # ------------------------------------------------
 
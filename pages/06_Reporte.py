@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
 import datetime
-import json
 import os
 
 from src.data import supabase_repository as db
+from src.data import json_codec
 from src.ui.header import render_header
 
 # --- Configuration ---
@@ -32,6 +32,16 @@ st.markdown('''<style>
 }
 </style>''', unsafe_allow_html=True)
 
+# --- Data (cacheada por token de cambios de 'propuestas') ---
+@st.cache_data(ttl=600, show_spinner=False)
+def buscar_operaciones(emisor_ruc, fecha_inicio, fecha_fin, lote_filter, version):
+    return db.search_proposals_advanced(
+        emisor_ruc=emisor_ruc,
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        lote_filter=lote_filter
+    )
+
 # --- Filters ---
 st.markdown("### Filtros de Búsqueda")
 
@@ -72,12 +82,7 @@ if btn_search:
         
         target_ruc = emisor_input.strip() if emisor_input else None
         
-        results = db.search_proposals_advanced(
-            emisor_ruc=target_ruc,
-            fecha_inicio=f_start,
-            fecha_fin=f_end,
-            lote_filter=lote_input
-        )
+        results = buscar_operaciones(target_ruc, f_start, f_end, lote_input, db.get_data_version('propuestas'))
         
     if not results:
         st.warning("No se encontraron operaciones con los filtros seleccionados.")
@@ -92,7 +97,7 @@ if btn_search:
             group_id = "-"
             if raw_json:
                 try:
-                    parsed = json.loads(raw_json)
+                    parsed = json_codec.loads(raw_json)
                     group_id = parsed.get('group_id', '-')
                 except:
                     pass
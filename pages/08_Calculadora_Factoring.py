@@ -1,7 +1,6 @@
 # 03_Calculadora_Factoring.py
 
 import streamlit as st
-import requests
 import os
 import datetime
 import json
@@ -15,20 +14,14 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 # --- Module Imports from `src` ---
 from src.utils import pdf_generators
 
-# --- Estrategia Unificada para la URL del Backend ---
-
-# 1. Intenta leer la URL desde una variable de entorno local (para desarrollo).
-#    Esta es la que usarás para apuntar a Render desde tu máquina.
-API_BASE_URL = os.getenv("BACKEND_API_URL")
-
-# 2. Si no la encuentra, intenta leerla desde los secretos de Streamlit (para la nube).
-if not API_BASE_URL:
-    try:
-        API_BASE_URL = st.secrets["backend_api"]["url"]
-    except (KeyError, AttributeError):
-        # 3. Si todo falla, muestra un error claro.
-        st.error("La URL del backend no está configurada. Define BACKEND_API_URL o configúrala en st.secrets.")
-        st.stop() # Detiene la ejecución si no hay URL
+# --- Cliente de Cálculo ---
+# En proceso por defecto; con CALCULATION_TRANSPORT=http usa la API (BACKEND_API_URL o st.secrets).
+from src.services.calculation_client import get_calculation_client, CalculationError
+try:
+    CALC_CLIENT = get_calculation_client()
+except CalculationError as e:
+    st.error(str(e))
+    st.stop() # Detiene la ejecución si no hay URL
 
 st.set_page_config(
     layout="wide",
@@ -154,6 +147,50 @@ def handle_global_disbursement_date_change():
             update_date_calculations(invoice)
         st.toast("Fecha de desembolso global aplicada a todas las facturas.")
 
+def construir_payload_lote():
+    """Datos de cálculo de todas las facturas (comisiones mínimas y de afiliación prorrateadas)."""
+    num_invoices = len(st.session_state.invoices_data)
+    comision_pen_apportioned = st.session_state.get('comision_afiliacion_pen_global', 0.0) / num_invoices if num_invoices > 0 else 0
+    comision_usd_apportioned = st.session_state.get('comision_afiliacion_usd_global', 0.0) / num_invoices if num_invoices > 0 else 0
+    comision_estructuracion_pct = st.session_state.comision_estructuracion_pct_global
+    comision_min_pen_apportioned_struct = st.session_state.comision_estructuracion_min_pen_global / num_invoices if num_invoices > 0 else 0
+    comision_min_usd_apportioned_struct = st.session_state.comision_estructuracion_min_usd_global / num_invoices if num_invoices > 0 else 0
+
+    payload = []
+    for invoice in st.session_state.invoices_data:
+        if invoice['moneda_factura'] == 'USD':
+            comision_minima_aplicable = comision_min_usd_apportioned_struct
+            comision_afiliacion_aplicable = comision_usd_apportioned
+        else:
+            comision_minima_aplicable = comision_min_pen_apportioned_struct
+            comision_afiliacion_aplicable = comision_pen_apportioned
+
+        plazo_real = invoice.get('plazo_operacion_calculado', 0)
+        plazo_para_api = plazo_real
+        if st.session_state.get('aplicar_dias_interes_minimo_global', False):
+            dias_minimos_a_usar = invoice.get('dias_minimos_interes_individual', 15)
+            plazo_para_api = max(plazo_real, dias_minimos_a_usar)
+
+        payload.append({
+            "plazo_operacion": plazo_para_api,
+            "mfn": invoice['monto_neto_factura'],
+            "tasa_avance": invoice['tasa_de_avance'] / 100,
+            "interes_mensual": invoice['interes_mensual'] / 100,
+            "comision_estructuracion_pct": comision_estructuracion_pct / 100,
+            "comision_minima_aplicable": comision_minima_aplicable,
+            "igv_pct": 0.18,
+            "comision_afiliacion_aplicable": comision_afiliacion_aplicable,
+            "aplicar_comision_afiliacion": st.session_state.get('aplicar_comision_afiliacion_global', False)
+        })
+    return payload
+
+def rango_valores(minimo, maximo, paso):
+    """Valores de minimo a maximo (inclusive) cada `paso`."""
+    if paso <= 0 or maximo < minimo:
+        return [minimo]
+    n = int(round((maximo - minimo) / paso)) + 1
+    return [round(minimo + i * paso, 6) for i in range(n)]
+
 def handle_global_tasa_avance_change():
     if st.session_state.get('aplicar_tasa_avance_global') and st.session_state.get('tasa_avance_global') is not None:
         global_tasa = st.session_state.tasa_avance_global
@@ -397,70 +434,84 @@ if st.session_state.invoices_data:
             st.warning("No se pueden calcular todas las facturas. Por favor, revisa los errores mencionados arriba.")
         else:
             st.success("Todas las facturas son válidas. Iniciando cálculos...")
-            for idx, invoice in enumerate(st.session_state.invoices_data):
-                with st.spinner(f"Calculando Factura {idx + 1}/{len(st.session_state.invoices_data)}..."):
-                    num_invoices = len(st.session_state.invoices_data)
-                    
-                    comision_pen_apportioned = st.session_state.get('comision_afiliacion_pen_global', 0.0) / num_invoices if num_invoices > 0 else 0
-                    comision_usd_apportioned = st.session_state.get('comision_afiliacion_usd_global', 0.0) / num_invoices if num_invoices > 0 else 0
-                    comision_estructuracion_pct = st.session_state.comision_estructuracion_pct_global
-                    comision_min_pen_apportioned_struct = st.session_state.comision_estructuracion_min_pen_global / num_invoices if num_invoices > 0 else 0
-                    comision_min_usd_apportioned_struct = st.session_state.comision_estructuracion_min_usd_global / num_invoices if num_invoices > 0 else 0
-
-                    if invoice['moneda_factura'] == 'USD':
-                        comision_minima_aplicable = comision_min_usd_apportioned_struct
-                        comision_afiliacion_aplicable = comision_usd_apportioned
-                    else:
-                        comision_minima_aplicable = comision_min_pen_apportioned_struct
-                        comision_afiliacion_aplicable = comision_pen_apportioned
-
-                    plazo_real = invoice.get('plazo_operacion_calculado', 0)
-                    plazo_para_api = plazo_real
-                    if st.session_state.get('aplicar_dias_interes_minimo_global', False):
-                        dias_minimos_a_usar = invoice.get('dias_minimos_interes_individual', 15)
-                        plazo_para_api = max(plazo_real, dias_minimos_a_usar)
-
-                    api_data = {
-                        "plazo_operacion": plazo_para_api,
-                        "mfn": invoice['monto_neto_factura'],
-                        "tasa_avance": invoice['tasa_de_avance'] / 100,
-                        "interes_mensual": invoice['interes_mensual'] / 100,
-                        "comision_estructuracion_pct": comision_estructuracion_pct / 100,
-                        "comision_minima_aplicable": comision_minima_aplicable,
-                        "igv_pct": 0.18,
-                        "comision_afiliacion_aplicable": comision_afiliacion_aplicable,
-                        "aplicar_comision_afiliacion": st.session_state.get('aplicar_comision_afiliacion_global', False)
-                    }
-                    try:
-                        response = requests.post(f"{API_BASE_URL}/calcular_desembolso", json=api_data)
-                        response.raise_for_status()
-                        invoice['initial_calc_result'] = response.json()
-
-                        if invoice['initial_calc_result'] and 'abono_real_teorico' in invoice['initial_calc_result']:
-                            abono_real_teorico = invoice['initial_calc_result']['abono_real_teorico']
-                            monto_desembolsar_objetivo = (abono_real_teorico // 10) * 10
-
-                            api_data_recalculate = {
-                                "plazo_operacion": plazo_para_api,
-                                "mfn": invoice['monto_neto_factura'],
-                                "interes_mensual": invoice['interes_mensual'] / 100,
-                                "comision_estructuracion_pct": comision_estructuracion_pct / 100,
-                                "igv_pct": 0.18,
-                                "monto_objetivo": monto_desembolsar_objetivo,
-                                "comision_minima_aplicable": comision_minima_aplicable,
-                                "comision_afiliacion_aplicable": comision_afiliacion_aplicable,
-                                "aplicar_comision_afiliacion": st.session_state.get('aplicar_comision_afiliacion_global', False)
-                            }
-                            response_recalculate = requests.post(f"{API_BASE_URL}/encontrar_tasa", json=api_data_recalculate)
-                            response_recalculate.raise_for_status()
-                            invoice['recalculate_result'] = response_recalculate.json()
-                        else:
-                            invoice['recalculate_result'] = None
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"Error de conexión con la API para Factura {idx + 1}: {e}")
-                        break 
-            st.success("¡Cálculo de todas las facturas completado!")
+            num_invoices = len(st.session_state.invoices_data)
+            payload = construir_payload_lote()
 
+            # Todo el lote en una llamada (desembolso inicial + búsqueda de tasa)
+            with st.spinner(f"Calculando {num_invoices} facturas..."):
+                try:
+                    resultado_inicial, resultado_tasa = CALC_CLIENT.calcular_lote(payload)
+                    for idx, invoice in enumerate(st.session_state.invoices_data):
+                        invoice['initial_calc_result'] = resultado_inicial["resultados_por_factura"][idx]
+                        invoice['recalculate_result'] = resultado_tasa["resultados_por_factura"][idx]
+                    st.success("¡Cálculo de todas las facturas completado!")
+                except CalculationError as e:
+                    st.error(f"Error en el cálculo del lote: {e}")
+
+
+# --- UI: Simulación de Escenarios (lote completo sobre una grilla) ---
+if st.session_state.invoices_data:
+    with st.expander("Simulación de Escenarios del Lote", expanded=False):
+        st.caption("Evalúa el lote completo para cada combinación de tasa de avance, interés mensual y plazo. "
+                   "Deja un parámetro sin marcar para usar el valor de cada factura.")
+        col_ta, col_im, col_pl = st.columns(3)
+        with col_ta:
+            variar_tasa = st.checkbox("Variar Tasa de Avance (%)", value=True, key="sim_variar_tasa")
+            ta_min = st.number_input("Desde", value=80.0, step=1.0, key="sim_ta_min", disabled=not variar_tasa)
+            ta_max = st.number_input("Hasta", value=98.0, step=1.0, key="sim_ta_max", disabled=not variar_tasa)
+            ta_paso = st.number_input("Paso", value=1.0, min_value=0.01, step=0.5, key="sim_ta_paso", disabled=not variar_tasa)
+        with col_im:
+            variar_interes = st.checkbox("Variar Interés Mensual (%)", value=True, key="sim_variar_interes")
+            im_min = st.number_input("Desde", value=1.0, step=0.1, key="sim_im_min", disabled=not variar_interes)
+            im_max = st.number_input("Hasta", value=3.0, step=0.1, key="sim_im_max", disabled=not variar_interes)
+            im_paso = st.number_input("Paso", value=0.25, min_value=0.01, step=0.05, key="sim_im_paso", disabled=not variar_interes)
+        with col_pl:
+            variar_plazo = st.checkbox("Variar Plazo (días)", value=False, key="sim_variar_plazo")
+            pl_min = st.number_input("Desde", value=30, min_value=1, step=1, key="sim_pl_min", disabled=not variar_plazo)
+            pl_max = st.number_input("Hasta", value=120, min_value=1, step=1, key="sim_pl_max", disabled=not variar_plazo)
+            pl_paso = st.number_input("Paso", value=15, min_value=1, step=1, key="sim_pl_paso", disabled=not variar_plazo)
+
+        grilla = {}
+        if variar_tasa:
+            grilla['tasa_avance'] = [v / 100 for v in rango_valores(ta_min, ta_max, ta_paso)]
+        if variar_interes:
+            grilla['interes_mensual'] = [v / 100 for v in rango_valores(im_min, im_max, im_paso)]
+        if variar_plazo:
+            grilla['plazo_operacion'] = rango_valores(int(pl_min), int(pl_max), int(pl_paso))
+        num_escenarios = 1
+        for valores in grilla.values():
+            num_escenarios *= len(valores)
+
+        if st.button(f"Simular {num_escenarios:,} Escenarios", disabled=not grilla, key="sim_ejecutar"):
+            if not all(validate_inputs(invoice) for invoice in st.session_state.invoices_data):
+                st.warning("Completa los datos de todas las facturas antes de simular.")
+            else:
+                try:
+                    st.session_state.simulacion_lote = CALC_CLIENT.simular_lote(construir_payload_lote(), grilla)
+                except CalculationError as e:
+                    st.error(f"Error en la simulación: {e}")
+
+        simulacion = st.session_state.get('simulacion_lote')
+        if simulacion:
+            import pandas as pd
+            escenarios = {
+                'Tasa Avance (%)': [None if v is None else v * 100 for v in simulacion['escenarios']['tasa_avance']],
+                'Interés Mensual (%)': [None if v is None else v * 100 for v in simulacion['escenarios']['interes_mensual']],
+                'Plazo (días)': simulacion['escenarios']['plazo_operacion'],
+            }
+            resultados = simulacion['resultados']
+            df_sim = pd.DataFrame({
+                **{k: v for k, v in escenarios.items() if any(x is not None for x in v)},
+                'Abono': resultados['abono_real'],
+                'Abono (%)': resultados['abono_pct'],
+                'Tasa Avance Encontrada (%)': [v * 100 for v in resultados['tasa_avance_encontrada']],
+                'Intereses': resultados['interes'],
+                'Com. Estructuración': resultados['comision_estructuracion'],
+                'IGV': resultados['igv_total'],
+                'Margen Seguridad': resultados['margen_seguridad'],
+                'Método Comisión': resultados['metodo_comision'],
+            })
+            st.dataframe(df_sim, use_container_width=True, hide_index=True)
 
 # --- UI: Formulario Principal ---
 if st.session_state.invoices_data:
@@ -735,4 +786,5 @@ if st.session_state.invoices_data:
     if st.button("Limpiar Todo"):
         st.session_state.invoices_data = []
         st.session_state.num_invoices_to_simulate = 1
+        st.session_state.pop('simulacion_lote', None)
         st.rerun()
\ No newline at end of file
@@ -11,6 +11,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.data.supabase_client import get_supabase_client
+from src.data import db_maintenance
 
 # ============================================================================
 # CONFIGURACIÓN DE PÁGINA
@@ -48,40 +49,13 @@ st.markdown('''<style>
 # ============================================================================
 
 def contar_registros_tabla(supabase, tabla):
-    """Cuenta los registros en una tabla"""
+    """Cuenta los registros en una tabla (conteo en el servidor, sin descargar filas)"""
     try:
-        response = supabase.table(tabla).select('*', count='exact').execute()
-        return response.count if hasattr(response, 'count') else len(response.data)
+        return db_maintenance.count_rows(tabla, supabase)
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-def limpiar_tabla(supabase, tabla):
-    """Limpia todos los registros de una tabla"""
-    try:
-        # Obtener todos los registros
-        response = supabase.table(tabla).select('*').execute()
-        count = len(response.data) if response.data else 0
-        
-        if count == 0:
-            return 0, "Tabla ya vacía"
-        
-        # Borrar todos los registros
-        if tabla == 'propuestas':
-            # Para propuestas, usar proposal_id
-            for record in response.data:
-                supabase.table(tabla).delete().eq('proposal_id', record['proposal_id']).execute()
-        else:
-            # Para otras tablas, usar id
-            for record in response.data:
-                supabase.table(tabla).delete().eq('id', record['id']).execute()
-        
-        return count, "Éxito"
-        
-    except Exception as e:
-        return 0, f"Error: {str(e)}"
-
-
 # ============================================================================
 # ESTADO DE SESIÓN
 # ============================================================================
@@ -99,21 +73,10 @@ if 'limpieza_ejecutada' not in st.session_state:
 # Información de las tablas
 st.header("📊 Estado Actual de las Tablas")
 
-tablas_operacionales = [
-    ('propuestas', 'Propuestas de factoring guardadas'),
-    ('liquidaciones_resumen', 'Resumen de liquidaciones'),
-    ('liquidacion_eventos', 'Eventos de liquidación'),
-    ('desembolsos_resumen', 'Resumen de desembolsos'),
-    ('desembolso_eventos', 'Eventos de desembolso'),
-    ('auditoria_eventos', 'Registro de auditoría')
-]
+# En orden de borrado: tablas hijas antes que propuestas (foreign keys)
+tablas_operacionales = [(tabla, descripcion) for tabla, _, descripcion in db_maintenance.OPERATIONAL_TABLES]
 
-tablas_configuracion = [
-    ('authorized_users', 'Usuarios autorizados del sistema'),
-    ('modules', 'Módulos del sistema'),
-    ('user_module_access', 'Permisos de acceso por usuario'),
-    ('EMISORES.ACEPTANTES', 'Catálogo de empresas (RUC y razones sociales)')
-]
+tablas_configuracion = db_maintenance.CONFIGURATION_TABLES
 
 # Obtener cliente de Supabase
 try:
@@ -202,6 +165,15 @@ try:
         )
         
         st.session_state.confirmacion_limpieza = confirmacion
+
+        col_a, col_b = st.columns(2)
+        with col_a:
+            archivar = st.checkbox("Archivar los registros antes de borrarlos", value=True,
+                                   help=f"Se guardan en {db_maintenance.ARCHIVE_DIR}")
+        with col_b:
+            formato_archivo = st.radio("Formato del archivo", ["jsonl", "parquet"], horizontal=True,
+                                       disabled=not archivar,
+                                       help="Parquet requiere pyarrow; si no está instalado se guarda JSONL")
         
         st.markdown("")
         
@@ -219,22 +191,27 @@ try:
                 st.session_state.limpieza_ejecutada = True
                 
                 with st.spinner("Limpiando base de datos..."):
-                    resultados = []
-                    total_eliminados = 0
-                    
-                    # Limpiar en orden (respetando foreign keys)
-                    for tabla, descripcion in tablas_operacionales:
-                        count, status = limpiar_tabla(supabase, tabla)
-                        total_eliminados += count
-                        resultados.append({
-                            'tabla': tabla,
-                            'registros': count,
-                            'status': status
-                        })
+                    progreso = st.empty()
+
+                    def mostrar_progreso(tabla, eliminados):
+                        progreso.caption(f"`{tabla}`: {eliminados:,} registros eliminados...")
+
+                    # Limpiar en orden (respetando foreign keys), por bloques
+                    limpieza = db_maintenance.clean_operational_tables(
+                        archive=archivar,
+                        archive_format=formato_archivo,
+                        progress=mostrar_progreso
+                    )
+                    resultados = limpieza['results']
+                    total_eliminados = limpieza['total']
+                    progreso.empty()
                     
                     # Mostrar resultados
                     st.success(f"✅ Limpieza completada. Total de registros eliminados: {total_eliminados:,}")
                     
+                    if limpieza['archive_dir']:
+                        st.info(f"🗄️ Registros archivados en: `{limpieza['archive_dir']}`")
+
                     st.markdown("### Detalle de la limpieza:")
                     
                     for resultado in resultados:
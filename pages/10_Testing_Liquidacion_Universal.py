@@ -9,12 +9,12 @@ import datetime
 from datetime import date, timedelta
 import sys
 import os
-import json
 
 # Agregar el directorio raíz al path para imports
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.core.factoring_system import SistemaFactoringCompleto
+from src.data import json_codec
 from src.data.supabase_repository import (
     get_proposal_details_by_id,
     get_liquidacion_eventos,
@@ -142,7 +142,7 @@ def extraer_datos_sistema(ultimo_evento: dict) -> dict:
     """
     Extrae los datos de la liquidación del SISTEMA
     """
-    resultado = json.loads(ultimo_evento.get('resultado_json', '{}'))
+    resultado = json_codec.loads(ultimo_evento.get('resultado_json', '{}'))
     
     # Extraer número de caso del estado
     estado = resultado.get('estado_operacion', 'N/A')
@@ -302,7 +302,7 @@ if st.session_state.facturas_seleccionadas:
         ultimo_evento = eventos[-1]
         
         # Extraer datos de la propuesta
-        recalc_data = json.loads(propuesta.get('recalculate_result_json', '{}'))
+        recalc_data = json_codec.loads(propuesta.get('recalculate_result_json', '{}'))
         capital = recalc_data.get('calculo_con_tasa_encontrada', {}).get('capital', 0.0)
         
         # IMPORTANTE: Las tasas vienen en porcentaje (2.0 = 2%), convertir a decimal
@@ -519,7 +519,7 @@ if st.session_state.facturas_seleccionadas:
         st.markdown("**Componentes del Sistema:**")
         
         # Obtener datos del sistema desde el resultado_json del evento
-        resultado_sistema = json.loads(ultimo_evento.get('resultado_json', '{}'))
+        resultado_sistema = json_codec.loads(ultimo_evento.get('resultado_json', '{}'))
         monto_pagado = resultado_sistema.get('monto_pagado', 0)
         capital_operacion = resultado_sistema.get('capital_operacion', 0)
         delta_capital = sistema.get('delta_capital', 0)
@@ -2,9 +2,9 @@ import sys
 import os
 import json
 from datetime import datetime, timedelta
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 from fastapi.middleware.cors import CORSMiddleware
 
 # --- Configuración de Path para Módulos ---
@@ -15,8 +15,12 @@ from core.factoring_calculator import (
     calcular_desembolso_inicial,
     encontrar_tasa_de_avance,
     procesar_lote_desembolso_inicial,
-    procesar_lote_encontrar_tasa
+    procesar_lote_encontrar_tasa,
+    iterar_lote_desembolso_inicial,
+    iterar_lote_encontrar_tasa
 )
+from core.simulacion_lote import simular_lote, expandir_grilla
+from core.sensibilidad_precios import sensibilidad_desde_condiciones
 from data import supabase_repository as db
 from data.supabase_repository import (
     get_or_create_desembolso_resumen,
@@ -24,11 +28,16 @@ from data.supabase_repository import (
     add_audit_event
 )
 from api.routers import liquidaciones
+from api.streaming import wants_ndjson, ndjson_response, lot_records
+from api.responses import CodecJSONResponse
 
 app = FastAPI(
     title="API de Calculadora de Factoring INANDES",
     description="Provee endpoints para los cálculos de factoring y gestión de operaciones.",
     version="3.1.0",
+    # orjson (data/json_codec.py) encodes the calculator's nested float dicts
+    # several times faster than the stdlib encoder of JSONResponse
+    default_response_class=CodecJSONResponse,
 )
 
 # --- Middleware de CORS ---
@@ -82,10 +91,13 @@ async def desembolsar_lote_endpoint(request: DesembolsarLoteRequest):
 app.include_router(liquidaciones.router, prefix="/liquidaciones", tags=["liquidaciones"])
 
 @app.post("/calcular_desembolso_lote")
-async def calcular_desembolso_lote_endpoint(payload: List[Dict[str, Any]]):
+async def calcular_desembolso_lote_endpoint(payload: List[Dict[str, Any]], http_request: Request):
     """
     Calcula el desembolso inicial para un lote de facturas.
+    Con `Accept: application/x-ndjson` responde una línea por factura y un resumen final (ver api/streaming.py).
     """
+    if wants_ndjson(http_request) and payload:
+        return ndjson_response(lot_records(iterar_lote_desembolso_inicial(payload)))
     try:
         result = procesar_lote_desembolso_inicial(payload)
         return result
@@ -93,16 +105,71 @@ async def calcular_desembolso_lote_endpoint(payload: List[Dict[str, Any]]):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/encontrar_tasa_lote")
-async def encontrar_tasa_lote_endpoint(payload: List[Dict[str, Any]]):
+async def encontrar_tasa_lote_endpoint(payload: List[Dict[str, Any]], http_request: Request):
     """
     Encuentra la tasa de avance para un lote de facturas dado un monto objetivo.
+    Con `Accept: application/x-ndjson` responde una línea por factura y un resumen final (ver api/streaming.py).
     """
+    if wants_ndjson(http_request) and payload:
+        return ndjson_response(lot_records(iterar_lote_encontrar_tasa(payload)))
     try:
         result = procesar_lote_encontrar_tasa(payload)
         return result
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+class SimularLoteRequest(BaseModel):
+    facturas: List[Dict[str, Any]]
+    # Grilla: valores por parámetro (tasa_avance, interes_mensual, plazo_operacion); se evalúa el producto cartesiano
+    grilla: Optional[Dict[str, List[float]]] = None
+    # Alternativa: escenarios explícitos como listas paralelas (None = valor de cada factura)
+    escenarios: Optional[Dict[str, List[Optional[float]]]] = None
+    incluir_detalle: bool = False
+
+@app.post("/simular_lote")
+async def simular_lote_endpoint(request: SimularLoteRequest):
+    """
+    Simula el lote completo (desembolso + búsqueda de tasa) en cada escenario de la grilla.
+    Devuelve resultados columnares: una lista por métrica, un valor por escenario.
+    """
+    try:
+        escenarios = request.escenarios if request.escenarios is not None else expandir_grilla(request.grilla or {})
+        return simular_lote(request.facturas, escenarios, incluir_detalle=request.incluir_detalle)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class SensibilidadPreciosRequest(BaseModel):
+    mfn: Union[float, List[float]]  # MFN de una factura o de cada factura del lote
+    emisor_ruc: Optional[str] = None
+    # Alternativa a emisor_ruc: condiciones en el formato de EMISORES.ACEPTANTES (porcentajes)
+    condiciones: Optional[Dict[str, Any]] = None
+    moneda: str = "PEN"
+    tasa_avance: Optional[float] = None  # Fracción; por defecto la del emisor
+    interes_mensual: Optional[List[float]] = None  # Fracciones; por defecto 0.1% .. 5.0%
+    plazos: Optional[List[int]] = None  # Días; por defecto 1 .. 180
+    estructuras: Optional[List[Dict[str, Any]]] = None
+
+@app.post("/sensibilidad_precios")
+async def sensibilidad_precios_endpoint(request: SensibilidadPreciosRequest):
+    """
+    Grilla de sensibilidad estructura x interés mensual x plazo para cotizar a un emisor.
+    Devuelve matrices [estructura][interes][plazo] listas para un heatmap.
+    """
+    condiciones = request.condiciones
+    if condiciones is None:
+        if not request.emisor_ruc:
+            raise HTTPException(status_code=400, detail="Debe indicar emisor_ruc o condiciones.")
+        condiciones = db.get_financial_conditions_cached(request.emisor_ruc)
+        if not condiciones:
+            raise HTTPException(status_code=404, detail=f"No hay condiciones financieras para el RUC {request.emisor_ruc}.")
+    try:
+        return sensibilidad_desde_condiciones(
+            condiciones, request.mfn, moneda=request.moneda, tasa_avance=request.tasa_avance,
+            tasas_interes=request.interes_mensual, plazos=request.plazos, estructuras=request.estructuras,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # --- Endpoints Antiguos / de Cálculo ---
 
 # ... (resto de los endpoints sin cambios)
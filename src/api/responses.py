@@ -0,0 +1,16 @@
+# src/api/responses.py
+"""
+Default response class of the API: renders with data/json_codec.py (orjson when
+installed). The endpoints return plain dicts without a response_model, so every
+response body goes through this encoder.
+"""
+
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from data import json_codec
+
+class CodecJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps_bytes(content)
@@ -2,7 +2,7 @@ import sys
 import os
 import json
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 
@@ -11,6 +11,7 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 sys.path.insert(0, project_root)
 
 from core.liquidation_calculator import calcular_liquidacion, proyectar_saldo_diario
+from data import json_codec
 from data.supabase_repository import (
     get_proposal_details_by_id,
     get_or_create_liquidacion_resumen,
@@ -21,6 +22,7 @@ from data.supabase_repository import (
     update_proposal_status,
     add_audit_event
 )
+from api.streaming import wants_ndjson, ndjson_response, lot_records, detached
 
 router = APIRouter()
 
@@ -45,156 +47,126 @@ class GetProjectedBalanceRequest(BaseModel):
 
 # --- Endpoints de Gestión de Estado ---
 
-@router.post("/procesar_liquidacion_lote")
-async def procesar_liquidacion_lote_endpoint(request: ProcesarLiquidacionRequest):
-    resultados = []
+def _liquidar_factura(liquidacion: LiquidacionInfo, usuario_id: str, registrar: bool) -> Dict[str, Any]:
+    """
+    Liquidación de una factura del lote. Con `registrar` guarda el evento, el saldo, el nuevo
+    estado y la auditoría; sin él solo simula. Los errores se devuelven como status 'ERROR'.
+    """
+    proposal_id = liquidacion.proposal_id
+    try:
+        # 1. Obtener datos y estado actual
+        datos_operacion = get_proposal_details_by_id(proposal_id)
+        if not datos_operacion:
+            raise HTTPException(status_code=404, detail=f"Propuesta {proposal_id} no encontrada.")
+        
+        estado_anterior = datos_operacion.get('estado', 'DESCONOCIDO')
+        if estado_anterior not in ['DESEMBOLSADA', 'EN PROCESO DE LIQUIDACION']:
+            raise HTTPException(status_code=400, detail=f"Factura {proposal_id} no está en un estado válido para liquidar.")
+
+        # 2. Preparar y ejecutar el cálculo de liquidación (reutilizando lógica anterior)
+        # (Esta sección es una adaptación de la lógica del endpoint /liquidar_factura)
+        fecha_str_original = datos_operacion.get('fecha_pago_calculada')
+        if fecha_str_original:
+            try:
+                fecha_obj = datetime.fromisoformat(fecha_str_original.split('T')[0])
+                datos_operacion['fecha_pago_calculada'] = fecha_obj.strftime('%d-%m-%Y')
+            except (ValueError, TypeError): pass
+        
+        recalc_json_str = datos_operacion.get('recalculate_result_json')
+        if recalc_json_str:
+            try:
+                recalc_data = json_codec.loads(recalc_json_str)
+                calculos = recalc_data.get('calculo_con_tasa_encontrada', {})
+                desglose = recalc_data.get('desglose_final_detallado', {})
+                datos_operacion['capital_calculado'] = calculos.get('capital')
+                datos_operacion['interes_calculado'] = desglose.get('interes', {}).get('monto')
+            except (json.JSONDecodeError, AttributeError): pass
+
+        liquidacion_previa = get_liquidacion_resumen(proposal_id)
+        eventos_liquidacion = get_liquidacion_eventos(proposal_id)
+        fecha_ultimo_evento_str = None
+        if eventos_liquidacion:
+            fecha_ultimo_evento_str = eventos_liquidacion[-1]['fecha_evento']
+
+        if not liquidacion.is_first_payment and liquidacion_previa and liquidacion_previa.get('saldo_actual') is not None:
+            datos_operacion['capital_calculado'] = liquidacion_previa['saldo_actual']
+            if fecha_ultimo_evento_str:
+                datos_operacion['fecha_pago_calculada'] = datetime.fromisoformat(fecha_ultimo_evento_str.split('+')[0]).strftime('%d-%m-%Y')
+
+        params_calculo = {
+            "datos_operacion": datos_operacion,
+            "monto_recibido": liquidacion.monto_recibido,
+            "fecha_pago_real_str": liquidacion.fecha_pago_real,
+            "tasa_interes_compensatoria_pct": liquidacion.tasa_interes_compensatoria_pct,
+            "tasa_interes_moratoria_pct": liquidacion.tasa_interes_moratoria_pct
+        }
+        resultado_calculo = calcular_liquidacion(**params_calculo)
+
+        if not registrar:
+            return {"proposal_id": proposal_id, "status": "SUCCESS", "message": "Simulación de liquidación exitosa.", "resultado_calculo": resultado_calculo}
+
+        # 3. Determinar nuevo estado y guardar todo en una transacción
+        saldo_final = resultado_calculo.get('liquidacion_final', {}).get('saldo_final_a_liquidar', 0)
+        nuevo_estado = 'LIQUIDADA' if saldo_final <= 0 else 'EN PROCESO DE LIQUIDACION'
+
+        # Guardar evento de liquidación
+        liquidacion_resumen_id = get_or_create_liquidacion_resumen(proposal_id, datos_operacion)
+        add_liquidacion_evento(
+            liquidacion_resumen_id=liquidacion_resumen_id,
+            tipo_evento=resultado_calculo.get('tipo_pago', 'Desconocido'),
+            fecha_evento=datetime.strptime(liquidacion.fecha_pago_real, '%d-%m-%Y'),
+            monto_recibido=liquidacion.monto_recibido,
+            dias_diferencia=resultado_calculo.get('dias_diferencia', 0),
+            resultado_json=resultado_calculo
+        )
+        update_liquidacion_resumen_saldo(liquidacion_resumen_id, saldo_final)
+        
+        # Actualizar estado de la propuesta
+        update_proposal_status(proposal_id, nuevo_estado)
+
+        # 4. Registrar evento de auditoría
+        add_audit_event(
+            usuario_id=usuario_id,
+            entidad_id=proposal_id,
+            accion="LIQUIDACION",
+            estado_anterior=estado_anterior,
+            estado_nuevo=nuevo_estado,
+            detalles_adicionales=liquidacion.dict()
+        )
+
+        return {"proposal_id": proposal_id, "status": "SUCCESS", "message": f"Liquidación registrada. Nuevo estado: {nuevo_estado}", "resultado_calculo": resultado_calculo}
+
+    except Exception as e:
+        return {"proposal_id": proposal_id, "status": "ERROR", "message": str(e)}
+
+def _iterar_liquidaciones(request: ProcesarLiquidacionRequest, registrar: bool):
+    """("factura", resultado) por liquidación, en orden, y al final ("resumen", conteos) (ver api/streaming.py)."""
+    exitosas = 0
     for liquidacion in request.liquidaciones:
-        proposal_id = liquidacion.proposal_id
-        try:
-            # 1. Obtener datos y estado actual
-            datos_operacion = get_proposal_details_by_id(proposal_id)
-            if not datos_operacion:
-                raise HTTPException(status_code=404, detail=f"Propuesta {proposal_id} no encontrada.")
-            
-            estado_anterior = datos_operacion.get('estado', 'DESCONOCIDO')
-            if estado_anterior not in ['DESEMBOLSADA', 'EN PROCESO DE LIQUIDACION']:
-                raise HTTPException(status_code=400, detail=f"Factura {proposal_id} no está en un estado válido para liquidar.")
-
-            # 2. Preparar y ejecutar el cálculo de liquidación (reutilizando lógica anterior)
-            # (Esta sección es una adaptación de la lógica del endpoint /liquidar_factura)
-            fecha_str_original = datos_operacion.get('fecha_pago_calculada')
-            if fecha_str_original:
-                try:
-                    fecha_obj = datetime.fromisoformat(fecha_str_original.split('T')[0])
-                    datos_operacion['fecha_pago_calculada'] = fecha_obj.strftime('%d-%m-%Y')
-                except (ValueError, TypeError): pass
-            
-            recalc_json_str = datos_operacion.get('recalculate_result_json')
-            if recalc_json_str:
-                try:
-                    recalc_data = json.loads(recalc_json_str)
-                    calculos = recalc_data.get('calculo_con_tasa_encontrada', {})
-                    desglose = recalc_data.get('desglose_final_detallado', {})
-                    datos_operacion['capital_calculado'] = calculos.get('capital')
-                    datos_operacion['interes_calculado'] = desglose.get('interes', {}).get('monto')
-                except (json.JSONDecodeError, AttributeError): pass
-
-            liquidacion_previa = get_liquidacion_resumen(proposal_id)
-            eventos_liquidacion = get_liquidacion_eventos(proposal_id)
-            fecha_ultimo_evento_str = None
-            if eventos_liquidacion:
-                fecha_ultimo_evento_str = eventos_liquidacion[-1]['fecha_evento']
-
-            if not liquidacion.is_first_payment and liquidacion_previa and liquidacion_previa.get('saldo_actual') is not None:
-                datos_operacion['capital_calculado'] = liquidacion_previa['saldo_actual']
-                if fecha_ultimo_evento_str:
-                    datos_operacion['fecha_pago_calculada'] = datetime.fromisoformat(fecha_ultimo_evento_str.split('+')[0]).strftime('%d-%m-%Y')
-
-            params_calculo = {
-                "datos_operacion": datos_operacion,
-                "monto_recibido": liquidacion.monto_recibido,
-                "fecha_pago_real_str": liquidacion.fecha_pago_real,
-                "tasa_interes_compensatoria_pct": liquidacion.tasa_interes_compensatoria_pct,
-                "tasa_interes_moratoria_pct": liquidacion.tasa_interes_moratoria_pct
-            }
-            resultado_calculo = calcular_liquidacion(**params_calculo)
-
-            # 3. Determinar nuevo estado y guardar todo en una transacción
-            saldo_final = resultado_calculo.get('liquidacion_final', {}).get('saldo_final_a_liquidar', 0)
-            nuevo_estado = 'LIQUIDADA' if saldo_final <= 0 else 'EN PROCESO DE LIQUIDACION'
-
-            # Guardar evento de liquidación
-            liquidacion_resumen_id = get_or_create_liquidacion_resumen(proposal_id, datos_operacion)
-            add_liquidacion_evento(
-                liquidacion_resumen_id=liquidacion_resumen_id,
-                tipo_evento=resultado_calculo.get('tipo_pago', 'Desconocido'),
-                fecha_evento=datetime.strptime(liquidacion.fecha_pago_real, '%d-%m-%Y'),
-                monto_recibido=liquidacion.monto_recibido,
-                dias_diferencia=resultado_calculo.get('dias_diferencia', 0),
-                resultado_json=resultado_calculo
-            )
-            update_liquidacion_resumen_saldo(liquidacion_resumen_id, saldo_final)
-            
-            # Actualizar estado de la propuesta
-            update_proposal_status(proposal_id, nuevo_estado)
-
-            # 4. Registrar evento de auditoría
-            add_audit_event(
-                usuario_id=request.usuario_id,
-                entidad_id=proposal_id,
-                accion="LIQUIDACION",
-                estado_anterior=estado_anterior,
-                estado_nuevo=nuevo_estado,
-                detalles_adicionales=liquidacion.dict()
-            )
-
-            resultados.append({"proposal_id": proposal_id, "status": "SUCCESS", "message": f"Liquidación registrada. Nuevo estado: {nuevo_estado}", "resultado_calculo": resultado_calculo})
-
-        except Exception as e:
-            resultados.append({"proposal_id": proposal_id, "status": "ERROR", "message": str(e)})
-    
-    return {"resultados_del_lote": resultados}
+        resultado = _liquidar_factura(liquidacion, request.usuario_id, registrar)
+        exitosas += resultado["status"] == "SUCCESS"
+        yield "factura", resultado
+    yield "resumen", {"exitosas": exitosas, "errores": len(request.liquidaciones) - exitosas}
+
+def _responder_lote(request: ProcesarLiquidacionRequest, http_request: Request, registrar: bool):
+    eventos = _iterar_liquidaciones(request, registrar)
+    if wants_ndjson(http_request):
+        if registrar:
+            # Registra eventos, saldos, estados y auditoría: el lote se termina de liquidar
+            # aunque el cliente se desconecte a mitad del stream
+            eventos = detached(eventos, name="procesar_liquidacion_lote")
+        return ndjson_response(lot_records(eventos))
+    return {"resultados_del_lote": [dato for tipo, dato in eventos if tipo == "factura"]}
+
+@router.post("/procesar_liquidacion_lote")
+async def procesar_liquidacion_lote_endpoint(request: ProcesarLiquidacionRequest, http_request: Request):
+    """Con `Accept: application/x-ndjson` responde una línea por factura a medida que se liquida."""
+    return _responder_lote(request, http_request, registrar=True)
 
 @router.post("/simular_liquidacion_lote")
-async def simular_liquidacion_lote_endpoint(request: ProcesarLiquidacionRequest):
-    resultados = []
-    for liquidacion in request.liquidaciones:
-        proposal_id = liquidacion.proposal_id
-        try:
-            # 1. Obtener datos y estado actual
-            datos_operacion = get_proposal_details_by_id(proposal_id)
-            if not datos_operacion:
-                raise HTTPException(status_code=404, detail=f"Propuesta {proposal_id} no encontrada.")
-            
-            estado_anterior = datos_operacion.get('estado', 'DESCONOCIDO')
-            if estado_anterior not in ['DESEMBOLSADA', 'EN PROCESO DE LIQUIDACION']:
-                raise HTTPException(status_code=400, detail=f"Factura {proposal_id} no está en un estado válido para liquidar.")
-
-            # 2. Preparar y ejecutar el cálculo de liquidación (reutilizando lógica anterior)
-            # (Esta sección es una adaptación de la lógica del endpoint /liquidar_factura)
-            fecha_str_original = datos_operacion.get('fecha_pago_calculada')
-            if fecha_str_original:
-                try:
-                    fecha_obj = datetime.fromisoformat(fecha_str_original.split('T')[0])
-                    datos_operacion['fecha_pago_calculada'] = fecha_obj.strftime('%d-%m-%Y')
-                except (ValueError, TypeError): pass
-            
-            recalc_json_str = datos_operacion.get('recalculate_result_json')
-            if recalc_json_str:
-                try:
-                    recalc_data = json.loads(recalc_json_str)
-                    calculos = recalc_data.get('calculo_con_tasa_encontrada', {})
-                    desglose = recalc_data.get('desglose_final_detallado', {})
-                    datos_operacion['capital_calculado'] = calculos.get('capital')
-                    datos_operacion['interes_calculado'] = desglose.get('interes', {}).get('monto')
-                except (json.JSONDecodeError, AttributeError): pass
-
-            liquidacion_previa = get_liquidacion_resumen(proposal_id)
-            eventos_liquidacion = get_liquidacion_eventos(proposal_id)
-            fecha_ultimo_evento_str = None
-            if eventos_liquidacion:
-                fecha_ultimo_evento_str = eventos_liquidacion[-1]['fecha_evento']
-
-            if not liquidacion.is_first_payment and liquidacion_previa and liquidacion_previa.get('saldo_actual') is not None:
-                datos_operacion['capital_calculado'] = liquidacion_previa['saldo_actual']
-                if fecha_ultimo_evento_str:
-                    datos_operacion['fecha_pago_calculada'] = datetime.fromisoformat(fecha_ultimo_evento_str.split('+')[0]).strftime('%d-%m-%Y')
-
-            params_calculo = {
-                "datos_operacion": datos_operacion,
-                "monto_recibido": liquidacion.monto_recibido,
-                "fecha_pago_real_str": liquidacion.fecha_pago_real,
-                "tasa_interes_compensatoria_pct": liquidacion.tasa_interes_compensatoria_pct,
-                "tasa_interes_moratoria_pct": liquidacion.tasa_interes_moratoria_pct
-            }
-            resultado_calculo = calcular_liquidacion(**params_calculo)
-
-            resultados.append({"proposal_id": proposal_id, "status": "SUCCESS", "message": "Simulación de liquidación exitosa.", "resultado_calculo": resultado_calculo})
-
-        except Exception as e:
-            resultados.append({"proposal_id": proposal_id, "status": "ERROR", "message": str(e)})
-    
-    return {"resultados_del_lote": resultados}
+async def simular_liquidacion_lote_endpoint(request: ProcesarLiquidacionRequest, http_request: Request):
+    """Con `Accept: application/x-ndjson` responde una línea por factura a medida que se simula."""
+    return _responder_lote(request, http_request, registrar=False)
 
 @router.post("/get_projected_balance")
 async def get_projected_balance_endpoint(request: GetProjectedBalanceRequest):
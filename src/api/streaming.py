@@ -0,0 +1,100 @@
+# src/api/streaming.py
+"""
+Optional NDJSON streaming for lot endpoints.
+
+A client that sends `Accept: application/x-ndjson` gets one JSON object per line
+as each invoice is computed, instead of a single document once the whole lot is
+done:
+
+    {"tipo": "factura", "indice": 0, "resultado": {...}}
+    {"tipo": "factura", "indice": 1, "resultado": {...}}
+    {"tipo": "resumen", "total_facturas": 2, ...lot-level fields (e.g. metodo_comision_elegido)}
+
+Once streaming has started the HTTP status is already 200, so a failure midway
+is reported as a last line {"tipo": "error", "detail": "..."} and the stream ends
+without a 'resumen'. Without the Accept header the endpoints respond as before.
+
+Starlette stops iterating a stream when the client disconnects. Streams whose
+events have side effects (database writes) must be wrapped in `detached()`, so
+the whole lot is processed even if nobody reads the rest of the response.
+"""
+
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from data import json_codec
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def _line(record: Dict[str, Any]) -> bytes:
+    return json_codec.dumps_bytes(record) + b"\n"
+
+def lot_records(events: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """
+    NDJSON records from ("factura", resultado) / ("resumen", {...}) events
+    (core.factoring_calculator.iterar_lote_*).
+    """
+    count = 0
+    for kind, data in events:
+        if kind == "factura":
+            yield {"tipo": "factura", "indice": count, "resultado": data}
+            count += 1
+        else:
+            yield {"tipo": "resumen", "total_facturas": count, **data}
+
+_FIN = object()
+
+def detached(events: Iterable[Any], name: str = "ndjson-detached") -> Iterator[Any]:
+    """
+    Starts consuming `events` to the end on its own thread right away (not on the
+    first read: the client may disconnect before Starlette iterates the body) and
+    returns an iterator that re-yields them as they arrive. If the reader stops,
+    the thread still finishes the work. An exception raised by `events` is
+    re-raised to the reader.
+    """
+    cola: "queue.Queue" = queue.Queue()  # Unbounded: the producer never waits for the reader
+
+    def producir() -> None:
+        try:
+            for evento in events:
+                cola.put(evento)
+        except Exception as e:
+            print(f"[ERROR en detached] {name}: {e}")
+            cola.put(e)
+        finally:
+            cola.put(_FIN)
+
+    def leer() -> Iterator[Any]:
+        while True:
+            evento = cola.get()
+            if evento is _FIN:
+                return
+            if isinstance(evento, Exception):
+                raise evento
+            yield evento
+
+    threading.Thread(target=producir, name=name).start()
+    return leer()
+
+def ndjson_response(records: Iterable[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Streams `records` as NDJSON. A synchronous iterable is consumed in Starlette's
+    threadpool, so blocking work inside it (calculations, database calls) does not
+    stall the event loop.
+    """
+    def body() -> Iterator[bytes]:
+        try:
+            for record in records:
+                yield _line(record)
+        except Exception as e:
+            print(f"[ERROR en ndjson_response]: {e}")
+            yield _line({"tipo": "error", "detail": str(e)})
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
@@ -18,7 +18,14 @@ def procesar_lote_desembolso_inicial(lote_datos: list) -> dict:
     """
     if not lote_datos:
         return {"error": "El lote de datos no puede estar vacío."}
+    return _reunir_lote(iterar_lote_desembolso_inicial(lote_datos))
 
+def iterar_lote_desembolso_inicial(lote_datos: list):
+    """
+    Versión incremental de procesar_lote_desembolso_inicial (respuestas NDJSON): produce
+    ("factura", resultado) por cada factura, en orden, y al final ("resumen", {...}) con la
+    decisión de comisión del lote.
+    """
     # FASE 1: Decisión Agregada sobre la Comisión (Elegir el MAYOR)
     capital_total_agregado = sum(d.get("mfn", 0) * d.get("tasa_avance", 0) for d in lote_datos)
     comision_fija_total = sum(d.get("comision_minima_aplicable", 0) for d in lote_datos)
@@ -27,7 +34,7 @@ def procesar_lote_desembolso_inicial(lote_datos: list) -> dict:
     metodo_de_comision_elegido = "PORCENTAJE" if comision_porcentual_total > comision_fija_total else "FIJO_PRORRATEADO"
 
     # FASE 2: Cálculo Individual con la Decisión ya Tomada
-    resultados_finales = []
+    total_comision_corregido = 0
     for datos_factura in lote_datos:
         capital_individual = datos_factura.get("mfn", 0) * datos_factura.get("tasa_avance", 0)
         
@@ -40,17 +47,26 @@ def procesar_lote_desembolso_inicial(lote_datos: list) -> dict:
             comision_estructuracion_fija=comision_para_esta_factura,
             **datos_factura
         )
-        resultados_finales.append(resultado_factura)
+        total_comision_corregido += resultado_factura['comision_estructuracion']
+        yield "factura", resultado_factura
         
     # FASE 3: Corrección de Totales
-    total_comision_corregido = sum(c['comision_estructuracion'] for c in resultados_finales)
-
-    return {
+    yield "resumen", {
         "metodo_comision_elegido": metodo_de_comision_elegido,
         "comision_estructuracion_total_corregida": round(total_comision_corregido, 2),
-        "resultados_por_factura": resultados_finales
     }
 
+def _reunir_lote(eventos) -> dict:
+    """Respuesta completa de un lote a partir de los eventos de iterar_lote_*."""
+    resultados_finales = []
+    resumen = {}
+    for tipo, dato in eventos:
+        if tipo == "factura":
+            resultados_finales.append(dato)
+        else:
+            resumen = dato
+    return {**resumen, "resultados_por_factura": resultados_finales}
+
 def _calcular_desglose_factura(comision_estructuracion_fija: float, **kwargs) -> dict:
     """Calcula los detalles de UNA factura. Asume que la comisión ya fue resuelta."""
     capital = kwargs["mfn"] * kwargs["tasa_avance"]
@@ -94,7 +110,14 @@ def procesar_lote_encontrar_tasa(lote_datos: list) -> dict:
     """
     if not lote_datos:
         return {"error": "El lote de datos no puede estar vacío."}
+    return _reunir_lote(iterar_lote_encontrar_tasa(lote_datos))
 
+def iterar_lote_encontrar_tasa(lote_datos: list):
+    """
+    Versión incremental de procesar_lote_encontrar_tasa (respuestas NDJSON): produce
+    ("factura", resultado) por cada factura una vez tomada la decisión del lote, y al final
+    ("resumen", {...}) con esa decisión.
+    """
     # FASE 1: Calcular Capitales Necesarios para ambos escenarios
     capitales_A = [] # Escenario A: Comisión por Porcentaje
     capitales_B = [] # Escenario B: Comisión Fija
@@ -110,7 +133,6 @@ def procesar_lote_encontrar_tasa(lote_datos: list) -> dict:
     metodo_de_comision_elegido = "PORCENTAJE" if comision_total_A > comision_total_B else "FIJO_PRORRATEADO"
 
     # FASE 3: Cálculo Final Individual con la Decisión ya Tomada
-    resultados_finales = []
     for i, datos_factura in enumerate(lote_datos):
         capital_necesario = capitales_A[i] if metodo_de_comision_elegido == "PORCENTAJE" else capitales_B[i]
         
@@ -125,12 +147,9 @@ def procesar_lote_encontrar_tasa(lote_datos: list) -> dict:
             comision_estructuracion_final=comision_final_factura,
             **datos_factura
         )
-        resultados_finales.append(resultado_factura)
+        yield "factura", resultado_factura
 
-    return {
-        "metodo_comision_elegido": metodo_de_comision_elegido,
-        "resultados_por_factura": resultados_finales
-    }
+    yield "resumen", {"metodo_comision_elegido": metodo_de_comision_elegido}
 
 def _resolver_capital_dual(**kwargs) -> tuple[float, float]:
     """Resuelve el capital necesario para un monto objetivo bajo ambos esquemas de comisión."""
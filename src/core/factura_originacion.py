@@ -0,0 +1,144 @@
+# src/core/factura_originacion.py
+"""
+Registros compactos de la sesión de Originación.
+
+Cada factura del lote vivía en st.session_state como un dict libre (~30 claves)
+más dos resultados de cálculo anidados (initial_calc_result / recalculate_result:
+decenas de dicts y floats por factura), y cada archivo cargado como un UploadedFile
+con sus bytes. Con lotes de 100+ facturas y varios operadores eso multiplica la RAM
+del servidor de Streamlit.
+
+- FacturaOriginacion: dataclass con __slots__ (sin __dict__ por instancia). Los
+  resultados de cálculo se guardan como JSON compacto y se decodifican al leerlos.
+  Se comporta como un dict (inv['campo'], inv.get, inv.copy()...), así que
+  save_proposal, aggregate_invoices, los generadores de PDF y las integraciones
+  Cavali la reciben sin cambios.
+- ArchivoCargado: nombre y SHA-256 de un PDF; los bytes están en el spill store
+  (src/services/spill_store.py).
+"""
+
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..data import json_codec
+
+def _con_slots(cls):
+    """dataclass(slots=True) para Python 3.9 (runtime.txt): recrea la clase con __slots__."""
+    nombres = tuple(f.name for f in fields(cls))
+    ns = {k: v for k, v in cls.__dict__.items() if k not in nombres and k not in ('__dict__', '__weakref__')}
+    ns['__slots__'] = nombres
+    return type(cls)(cls.__name__, cls.__bases__, ns)
+
+def _a_json(valor: Optional[Dict[str, Any]]) -> Optional[str]:
+    return json_codec.dumps(valor) if valor is not None else None
+
+def _de_json(texto: Optional[str]) -> Optional[Dict[str, Any]]:
+    return json_codec.loads(texto) if texto else None
+
+@_con_slots
+@dataclass
+class ArchivoCargado:
+    """PDF cargado en un grupo: los bytes se leen con get_spill_store().get(digest)."""
+    nombre: str
+    digest: str
+    tamano: int = 0
+
+# Claves de dict -> campo JSON del registro
+_CLAVES_JSON = {'initial_calc_result': 'initial_calc_json', 'recalculate_result': 'recalculate_json'}
+
+@_con_slots
+@dataclass(eq=False)
+class FacturaOriginacion(MutableMapping):
+    """Factura de un lote en Originación. Acepta acceso por clave como el dict que reemplaza."""
+    # Metadatos
+    group_id: int = 1
+    parsed_pdf_name: str = ''
+    file_digest: str = ''
+    # Involucrados y montos
+    emisor_ruc: str = ''
+    emisor_nombre: str = ''
+    aceptante_ruc: str = ''
+    aceptante_nombre: str = ''
+    numero_factura: str = ''
+    fecha_emision_factura: str = ''
+    monto_total_factura: float = 0.0
+    monto_neto_factura: float = 0.0
+    moneda_factura: str = 'PEN'
+    cuotas: List[Dict[str, Any]] = field(default_factory=list)
+    detraccion_porcentaje: float = 0.0
+    # Fechas y plazos
+    fecha_desembolso_factoring: str = ''
+    fecha_pago_calculada: str = ''
+    plazo_credito_dias: int = 0
+    plazo_operacion_calculado: int = 0
+    fecha_error: bool = False
+    dias_minimos_interes_individual: int = 15
+    # Tasas y comisiones (en %)
+    tasa_de_avance: float = 0.0
+    interes_mensual: float = 0.0
+    interes_moratorio: float = 0.0
+    comision_afiliacion_pen: float = 0.0
+    comision_afiliacion_usd: float = 0.0
+    # Resultados de cálculo (JSON compacto; ver initial_calc_result / recalculate_result)
+    initial_calc_json: Optional[str] = None
+    recalculate_json: Optional[str] = None
+    # Datos agregados al generar documentos y guardar
+    comision_de_estructuracion_global: Optional[float] = None
+    detraccion_monto: Optional[float] = None
+    contract_number: Optional[str] = None
+    anexo_number: Optional[str] = None
+    lote_id: Optional[str] = None
+    drive_link: Optional[str] = None
+    has_xml_match: bool = False
+
+    @property
+    def initial_calc_result(self) -> Optional[Dict[str, Any]]:
+        return _de_json(self.initial_calc_json)
+
+    @initial_calc_result.setter
+    def initial_calc_result(self, valor: Optional[Dict[str, Any]]):
+        self.initial_calc_json = _a_json(valor)
+
+    @property
+    def recalculate_result(self) -> Optional[Dict[str, Any]]:
+        """Resultado de la búsqueda de tasa. Cada lectura decodifica una copia nueva."""
+        return _de_json(self.recalculate_json)
+
+    @recalculate_result.setter
+    def recalculate_result(self, valor: Optional[Dict[str, Any]]):
+        self.recalculate_json = _a_json(valor)
+
+    @property
+    def tiene_resultado(self) -> bool:
+        return bool(self.recalculate_json)
+
+    # --- Interfaz de dict ---
+    def _atributo(self, clave: str) -> str:
+        if clave in _CLAVES_JSON:
+            return clave
+        if clave in self.__slots__ and clave not in _CLAVES_JSON.values():
+            return clave
+        raise KeyError(clave)
+
+    def __getitem__(self, clave: str) -> Any:
+        return getattr(self, self._atributo(clave))
+
+    def __setitem__(self, clave: str, valor: Any) -> None:
+        setattr(self, self._atributo(clave), valor)
+
+    def __delitem__(self, clave: str) -> None:
+        raise KeyError(f"Los campos de FacturaOriginacion no se pueden eliminar: {clave}")
+
+    def __iter__(self) -> Iterator[str]:
+        for nombre in self.__slots__:
+            yield next((k for k, v in _CLAVES_JSON.items() if v == nombre), nombre)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def copy(self) -> Dict[str, Any]:
+        """Dict plano con los resultados decodificados (p. ej. para save_proposal o las plantillas)."""
+        return dict(self.items())
+
+    to_dict = copy
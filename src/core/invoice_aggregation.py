@@ -0,0 +1,110 @@
+# src/core/invoice_aggregation.py
+"""
+Single-pass aggregation of invoice financials.
+
+Reports and tables need the same amounts from every invoice (monto neto, capital,
+intereses, comisiones, IGV, abono...), most of them buried in the nested
+'recalculate_result' dict. This module walks the invoice list once, pulls every
+field into a columnar structure (dict of equal-length lists, usable directly by
+st.dataframe / pandas) and accumulates the totals, overall and per currency.
+"""
+
+from typing import List, Dict, Any, Tuple
+
+# Column name -> ('invoice' | 'busqueda' | 'calculos' | 'desglose', key).
+# 'desglose' entries are {'monto': ..., 'porcentaje': ...} dicts; the 'monto' is used.
+INVOICE_FIELDS: Dict[str, Tuple[str, str]] = {
+    'monto_total_factura': ('invoice', 'monto_total_factura'),
+    'detraccion_monto': ('invoice', 'detraccion_monto'),
+    'monto_neto_factura': ('invoice', 'monto_neto_factura'),
+    'tasa_avance': ('busqueda', 'tasa_avance_encontrada'),
+    'margen_seguridad': ('desglose', 'margen_seguridad'),
+    'capital': ('calculos', 'capital'),
+    'intereses': ('desglose', 'interes'),
+    'igv_interes': ('calculos', 'igv_interes'),
+    'comision_estructuracion': ('desglose', 'comision_estructuracion'),
+    'igv_comision_estructuracion': ('calculos', 'igv_comision_estructuracion'),
+    'comision_afiliacion': ('desglose', 'comision_afiliacion'),
+    'igv_afiliacion': ('calculos', 'igv_afiliacion'),
+    'igv_total': ('desglose', 'igv_total'),
+    'monto_desembolsar': ('desglose', 'abono'),
+}
+
+# Rates are averaged (weighted by monto neto), not summed
+_NON_ADDITIVE_FIELDS = {'tasa_avance'}
+SUMMED_FIELDS = [name for name in INVOICE_FIELDS if name not in _NON_ADDITIVE_FIELDS]
+
+def _number(value: Any) -> float:
+    """Amount as float: DB rows bring numeric strings ('1234.50') or Decimal. None/'' count as 0."""
+    if value is None or value == '':
+        return 0.0
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+def _empty_totals() -> Dict[str, float]:
+    totals = {name: 0.0 for name in SUMMED_FIELDS}
+    totals['_tasa_avance_ponderada'] = 0.0
+    totals['cantidad'] = 0
+    return totals
+
+def _finalize_totals(totals: Dict[str, float]) -> Dict[str, float]:
+    weighted = totals.pop('_tasa_avance_ponderada')
+    neto = totals['monto_neto_factura']
+    totals['tasa_avance_ponderada'] = (weighted / neto) if neto > 0 else 0
+    totals['igv_operacion'] = totals['igv_interes'] + totals['igv_comision_estructuracion'] + totals['igv_afiliacion']
+    totals['comisiones'] = totals['comision_estructuracion'] + totals['comision_afiliacion']
+    return totals
+
+def aggregate_invoices(invoices_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Walks the invoices once and returns:
+        {
+            'columns': {'numero_factura': [...], 'moneda': [...], 'capital': [...], ...},
+            'totals': {'capital': ..., 'tasa_avance_ponderada': ..., 'cantidad': n, ...},
+            'totals_by_currency': {'PEN': {...}, 'USD': {...}}
+        }
+    Missing or non-numeric amounts count as 0.
+    """
+    columns: Dict[str, List[Any]] = {'numero_factura': [], 'moneda': []}
+    columns.update({name: [] for name in INVOICE_FIELDS})
+    totals = _empty_totals()
+    totals_by_currency: Dict[str, Dict[str, float]] = {}
+
+    for inv in invoices_data:
+        recalc = inv.get('recalculate_result') or {}
+        sources = {
+            'invoice': inv,
+            'busqueda': recalc.get('resultado_busqueda') or {},
+            'calculos': recalc.get('calculo_con_tasa_encontrada') or {},
+            'desglose': recalc.get('desglose_final_detallado') or {},
+        }
+        moneda = inv.get('moneda_factura') or 'PEN'
+        currency_totals = totals_by_currency.get(moneda)
+        if currency_totals is None:
+            currency_totals = totals_by_currency[moneda] = _empty_totals()
+
+        columns['numero_factura'].append(inv.get('numero_factura'))
+        columns['moneda'].append(moneda)
+
+        for name, (source, key) in INVOICE_FIELDS.items():
+            value = sources[source].get(key)
+            if source == 'desglose':
+                value = (value or {}).get('monto')
+            value = _number(value)
+            columns[name].append(value)
+            if name not in _NON_ADDITIVE_FIELDS:
+                totals[name] += value
+                currency_totals[name] += value
+
+        weighted = columns['monto_neto_factura'][-1] * columns['tasa_avance'][-1]
+        for bucket in (totals, currency_totals):
+            bucket['_tasa_avance_ponderada'] += weighted
+            bucket['cantidad'] += 1
+
+    return {
+        'columns': columns,
+        'totals': _finalize_totals(totals),
+        'totals_by_currency': {moneda: _finalize_totals(t) for moneda, t in totals_by_currency.items()},
+    }
@@ -0,0 +1,276 @@
+# src/core/lote_originacion.py
+"""
+Modelo incremental del lote de Originación.
+
+El cálculo de un lote (CalculationClient.calcular_lote) son dos pasadas de
+factoring_calculator con una decisión de comisión por lote en cada una:
+
+    item_i        <- entradas de la factura i + condiciones del lote
+                     + capital total de su moneda (prorrateo de mínima y afiliación)
+    metodo_1      <- capital total, comisión mínima total, % de la primera factura
+    inicial_i     <- item_i, metodo_1         (_calcular_desglose_factura)
+    objetivo_i    <- inicial_i                (abono teórico redondeado)
+    capitales_i   <- item_i, objetivo_i       (_resolver_capital_dual)
+    metodo_2      <- suma de capitales A, comisión mínima total
+    final_i       <- item_i, objetivo_i, capitales_i, metodo_2
+
+Antes, cualquier edición (p. ej. el interés de una factura) recalculaba el lote
+completo. LoteOriginacion guarda los valores intermedios y, con las dependencias
+de DEPENDENCIAS_FACTURA / DEPENDENCIAS_LOTE, solo rehace lo que cambió: el item de
+las facturas afectadas, cada decisión de comisión solo si cambian sus entradas, y
+el resto del lote solo si una decisión cambia de método. El resultado de cada
+recálculo es un CambiosLote (facturas recalculadas, métodos y abonos antes/después)
+para que la UI actualice solo esas facturas.
+
+Los números son los de procesar_lote_desembolso_inicial + procesar_lote_encontrar_tasa
+(mismas funciones por factura, mismas sumas en el mismo orden).
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from . import factoring_calculator
+
+IGV_PCT = 0.18
+REDONDEO_OBJETIVO = 10
+
+# Campo de la factura -> alcance de un cambio:
+#   'factura': solo esa factura.
+#   'moneda': todas las facturas de su moneda (cambia el capital con que se prorratean
+#             la comisión mínima y la afiliación). Un cambio de moneda afecta a ambas.
+DEPENDENCIAS_FACTURA = {
+    'monto_neto_factura': 'moneda',
+    'tasa_de_avance': 'moneda',
+    'moneda_factura': 'moneda',
+    'interes_mensual': 'factura',
+    'interes_moratorio': 'factura',
+    'plazo_operacion_calculado': 'factura',
+    'dias_minimos_interes_individual': 'factura',
+}
+CAMPOS_FACTURA = tuple(DEPENDENCIAS_FACTURA)
+
+# Condición del lote (unidades de la página: % y montos) -> 'lote' o la moneda afectada
+DEPENDENCIAS_LOTE = {
+    'comision_estructuracion_pct': 'lote',
+    'aplicar_comision_afiliacion': 'lote',
+    'comision_minima_pen': 'PEN',
+    'comision_minima_usd': 'USD',
+    'comision_afiliacion_pen': 'PEN',
+    'comision_afiliacion_usd': 'USD',
+}
+
+_MONEDAS = ('PEN', 'USD')
+
+def _moneda(entrada: Tuple[Any, ...]) -> str:
+    return 'PEN' if entrada[CAMPOS_FACTURA.index('moneda_factura')] == 'PEN' else 'USD'
+
+def _capital(entrada: Tuple[Any, ...]) -> float:
+    valores = dict(zip(CAMPOS_FACTURA, entrada))
+    return valores['monto_neto_factura'] * (valores['tasa_de_avance'] / 100)
+
+def _construir_item(entrada: Tuple[Any, ...], condiciones: Dict[str, Any], capital: float, capital_moneda: float) -> Dict[str, Any]:
+    """Ítem de factoring_calculator para una factura (tasas de % a fracción, comisiones prorrateadas)."""
+    valores = dict(zip(CAMPOS_FACTURA, entrada))
+    sufijo = 'pen' if valores['moneda_factura'] == 'PEN' else 'usd'
+    participacion = capital / capital_moneda if capital_moneda > 0 else 0
+    return {
+        "plazo_operacion": max(valores['plazo_operacion_calculado'] or 0, valores['dias_minimos_interes_individual'] or 0),
+        "mfn": valores['monto_neto_factura'],
+        "tasa_avance": valores['tasa_de_avance'] / 100,
+        "interes_mensual": valores['interes_mensual'] / 100,
+        "interes_moratorio_mensual": valores['interes_moratorio'] / 100,
+        "comision_estructuracion_pct": condiciones['comision_estructuracion_pct'] / 100,
+        "comision_minima_aplicable": condiciones[f'comision_minima_{sufijo}'] * participacion,
+        "igv_pct": IGV_PCT,
+        "comision_afiliacion_aplicable": condiciones[f'comision_afiliacion_{sufijo}'] * participacion,
+        "aplicar_comision_afiliacion": condiciones['aplicar_comision_afiliacion'],
+    }
+
+def _entradas(facturas: Sequence[Any]) -> List[Tuple[Any, ...]]:
+    return [tuple(f[c] for c in CAMPOS_FACTURA) for f in facturas]
+
+def _condiciones(condiciones: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: condiciones[k] for k in DEPENDENCIAS_LOTE}
+
+def construir_payload(facturas: Sequence[Any], condiciones: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Payload completo del lote para CalculationClient.calcular_lote (transporte HTTP)."""
+    entradas = _entradas(facturas)
+    condiciones = _condiciones(condiciones)
+    capitales = [_capital(e) for e in entradas]
+    totales = {m: sum(c for c, e in zip(capitales, entradas) if _moneda(e) == m) for m in _MONEDAS}
+    return [_construir_item(e, condiciones, c, totales[_moneda(e)]) for e, c in zip(entradas, capitales)]
+
+@dataclass
+class CambiosLote:
+    """Diferencia de un recálculo, para que la UI actualice solo lo que cambió."""
+    # índice -> {'initial_calc_result': ..., 'recalculate_result': ...} (solo los recalculados)
+    resultados: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    # (antes, después) del método de comisión de cada pasada, si cambió
+    metodo_desembolso: Optional[Tuple[Optional[str], str]] = None
+    metodo_tasa: Optional[Tuple[Optional[str], str]] = None
+    # índice -> (abono antes, abono después), solo si cambió
+    abonos: Dict[int, Tuple[Optional[float], float]] = field(default_factory=dict)
+    completo: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.resultados)
+
+    @property
+    def recalculadas(self) -> List[int]:
+        return sorted(self.resultados)
+
+    def aplicar(self, facturas: Sequence[Any]) -> None:
+        """Escribe los resultados recalculados en las facturas (dicts o FacturaOriginacion)."""
+        for idx, resultados in self.resultados.items():
+            for clave, valor in resultados.items():
+                facturas[idx][clave] = valor
+
+class LoteOriginacion:
+    """Valores intermedios del cálculo de un lote; recalcula solo lo afectado por cada cambio."""
+
+    def __init__(self, redondeo_objetivo: float = REDONDEO_OBJETIVO):
+        self.redondeo_objetivo = redondeo_objetivo
+        self._reiniciar()
+
+    def _reiniciar(self) -> None:
+        self._entradas: List[Tuple[Any, ...]] = []
+        self._condiciones: Optional[Dict[str, Any]] = None
+        self._capitales: List[float] = []
+        self._capital_moneda: Dict[str, float] = {}
+        self._items: List[Dict[str, Any]] = []
+        self._objetivos: List[Optional[float]] = []
+        self._capitales_dual: List[Tuple[float, float]] = []
+        self._abonos: List[Optional[float]] = []
+        self.metodo_desembolso: Optional[str] = None
+        self.metodo_tasa: Optional[str] = None
+
+    def _facturas_afectadas(self, entradas: List[Tuple[Any, ...]], condiciones: Dict[str, Any]) -> Tuple[Set[int], Set[str]]:
+        """(facturas cuyo item hay que rehacer, monedas cuyo capital total cambió)."""
+        n = len(entradas)
+        if n != len(self._entradas) or self._condiciones is None:
+            return set(range(n)), set(_MONEDAS)
+
+        sucias, monedas_reparto, monedas_condicion = set(), set(), set()
+        for i, (nueva, anterior) in enumerate(zip(entradas, self._entradas)):
+            if nueva == anterior:
+                continue
+            sucias.add(i)
+            for campo, a, b in zip(CAMPOS_FACTURA, nueva, anterior):
+                if a != b and DEPENDENCIAS_FACTURA[campo] == 'moneda':
+                    monedas_reparto.update((_moneda(nueva), _moneda(anterior)))
+
+        for clave, alcance in DEPENDENCIAS_LOTE.items():
+            if condiciones[clave] != self._condiciones[clave]:
+                if alcance == 'lote':
+                    return set(range(n)), monedas_reparto
+                monedas_condicion.add(alcance)
+
+        monedas = monedas_reparto | monedas_condicion
+        if monedas:
+            sucias.update(i for i, e in enumerate(entradas) if _moneda(e) in monedas)
+        return sucias, monedas_reparto
+
+    def recalcular(self, facturas: Sequence[Any], condiciones: Dict[str, Any], forzar: bool = False) -> CambiosLote:
+        """
+        Lleva el modelo al estado de `facturas` y `condiciones` y devuelve lo que cambió.
+
+        Args:
+            facturas: Facturas del lote (FacturaOriginacion o dicts con CAMPOS_FACTURA), ya validadas.
+            condiciones: Claves de DEPENDENCIAS_LOTE (comisión en %, montos por moneda).
+            forzar: Recalcula el lote completo (botón "Calcular").
+        """
+        if forzar:
+            self._reiniciar()
+        entradas = _entradas(facturas)
+        condiciones = _condiciones(condiciones)
+        completo = len(entradas) != len(self._entradas) or self._condiciones is None
+        cambios = CambiosLote(completo=completo)
+        if not entradas:
+            self._reiniciar()
+            return cambios
+
+        sucias, monedas_reparto = self._facturas_afectadas(entradas, condiciones)
+        if completo:
+            self._reiniciar()
+            n = len(entradas)
+            self._capitales = [0.0] * n
+            self._items = [{}] * n
+            self._objetivos = [None] * n
+            self._capitales_dual = [(0.0, 0.0)] * n
+            self._abonos = [None] * n
+        self._entradas, self._condiciones = entradas, condiciones
+        if not sucias:
+            return cambios
+
+        # 1. Items (prorrateo por moneda): solo las facturas afectadas
+        for i in sucias:
+            self._capitales[i] = _capital(entradas[i])
+        for moneda in monedas_reparto:
+            self._capital_moneda[moneda] = sum(c for c, e in zip(self._capitales, entradas) if _moneda(e) == moneda)
+        items_cambiados = set()
+        for i in sucias:
+            item = _construir_item(entradas[i], condiciones, self._capitales[i], self._capital_moneda.get(_moneda(entradas[i]), 0.0))
+            if completo or item != self._items[i]:
+                self._items[i] = item
+                items_cambiados.add(i)
+        if not items_cambiados:
+            return cambios
+
+        items = self._items
+        pct_lote = items[0].get("comision_estructuracion_pct", 0)
+        comision_fija_total = sum(d.get("comision_minima_aplicable", 0) for d in items)
+
+        # 2. Desembolso inicial: decisión de comisión del lote (procesar_lote_desembolso_inicial)
+        capital_total = sum(d.get("mfn", 0) * d.get("tasa_avance", 0) for d in items)
+        metodo = "PORCENTAJE" if capital_total * pct_lote > comision_fija_total else "FIJO_PRORRATEADO"
+        rehacer = items_cambiados
+        if metodo != self.metodo_desembolso:
+            cambios.metodo_desembolso = (self.metodo_desembolso, metodo)
+            self.metodo_desembolso = metodo
+            rehacer = set(range(len(items)))
+
+        rehacer_dual = set()
+        for i in rehacer:
+            item = items[i]
+            if metodo == "PORCENTAJE":
+                comision = item.get("mfn", 0) * item.get("tasa_avance", 0) * item.get("comision_estructuracion_pct", 0)
+            else:
+                comision = item.get("comision_minima_aplicable", 0)
+            inicial = factoring_calculator._calcular_desglose_factura(comision_estructuracion_fija=comision, **item)
+            cambios.resultados[i] = {'initial_calc_result': inicial}
+            objetivo = (inicial.get('abono_real_teorico', 0) // self.redondeo_objetivo) * self.redondeo_objetivo
+            if i in items_cambiados or objetivo != self._objetivos[i]:
+                self._objetivos[i] = objetivo
+                rehacer_dual.add(i)
+
+        # 3. Búsqueda de tasa: capitales de ambos esquemas solo donde cambió el item o el objetivo
+        for i in rehacer_dual:
+            self._capitales_dual[i] = factoring_calculator._resolver_capital_dual(**self._item_tasa(i))
+
+        comision_total_a = sum(a for a, _ in self._capitales_dual) * pct_lote
+        metodo = "PORCENTAJE" if comision_total_a > comision_fija_total else "FIJO_PRORRATEADO"
+        rehacer = rehacer_dual
+        if metodo != self.metodo_tasa:
+            cambios.metodo_tasa = (self.metodo_tasa, metodo)
+            self.metodo_tasa = metodo
+            rehacer = set(range(len(items)))
+
+        for i in rehacer:
+            capital_a, capital_b = self._capitales_dual[i]
+            capital = capital_a if metodo == "PORCENTAJE" else capital_b
+            comision = capital * pct_lote if metodo == "PORCENTAJE" else items[i].get("comision_minima_aplicable", 0)
+            final = factoring_calculator._construir_respuesta_tasa_encontrada(
+                capital_necesario=capital, comision_estructuracion_final=comision, **self._item_tasa(i)
+            )
+            cambios.resultados.setdefault(i, {})['recalculate_result'] = final
+            abono = final.get('desglose_final_detallado', {}).get('abono', {}).get('monto')
+            if abono != self._abonos[i]:
+                cambios.abonos[i] = (self._abonos[i], abono)
+                self._abonos[i] = abono
+        return cambios
+
+    def _item_tasa(self, i: int) -> Dict[str, Any]:
+        item = dict(self._items[i])
+        item['monto_objetivo'] = self._objetivos[i]
+        item.pop('tasa_avance', None)  # La búsqueda la encuentra
+        return item
@@ -0,0 +1,170 @@
+# src/core/sensibilidad_precios.py
+"""
+Grilla de sensibilidad de precios para la mesa comercial.
+
+Antes de cotizar se quiere ver el abono y el margen de un lote sobre toda una
+grilla interés mensual x plazo x estructura de comisión. Cada celda es el flujo
+completo de originación (desembolso inicial -> monto objetivo redondeado ->
+_resolver_capital_dual -> _construir_respuesta_tasa_encontrada), y la grilla
+entera (p. ej. 3 x 50 x 180 = 27.000 celdas) se evalúa en una sola llamada
+vectorizada a simulacion_lote.evaluar_lote_vectorizado.
+
+Las condiciones base vienen de EMISORES.ACEPTANTES (get_financial_conditions, en
+porcentaje). Los resultados se cachean por (condiciones del emisor, grilla): la
+misma consulta para el mismo emisor no se recalcula.
+
+Las matrices devueltas tienen forma [estructura][interes][plazo] (listas anidadas),
+listas para un heatmap (z=matriz[c], y=ejes['interes_mensual'], x=ejes['plazo_operacion']).
+"""
+
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .simulacion_lote import evaluar_lote_vectorizado
+
+IGV_PCT = 0.18
+# Ejes por defecto: 0.10% .. 5.00% mensual (50 valores) y 1 .. 180 días
+INTERES_MENSUAL_DEFECTO = tuple(round(0.001 * i, 4) for i in range(1, 51))
+PLAZOS_DEFECTO = tuple(range(1, 181))
+MAX_CELDAS_SENSIBILIDAD = 2_000_000  # estructuras x intereses x plazos x facturas
+SENSIBILIDAD_CACHE_SIZE = 64
+
+METRICAS_SENSIBILIDAD = (
+    'abono_real', 'abono_pct', 'margen_seguridad', 'tasa_avance_encontrada',
+    'capital', 'interes', 'comision_estructuracion', 'metodo_comision',
+)
+
+def _float(valor: Any) -> float:
+    try:
+        return float(valor or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def estructuras_desde_condiciones(condiciones: Dict[str, Any], moneda: str = 'PEN') -> List[Dict[str, Any]]:
+    """
+    Tres estructuras de comisión a partir de las condiciones del emisor (columnas de
+    EMISORES.ACEPTANTES, porcentajes en %): las del emisor, sin afiliación y sin mínimo.
+    Cada estructura: {'nombre', 'comision_estructuracion_pct' (fracción), 'comision_minima', 'comision_afiliacion'}.
+    """
+    sufijo = '_usd' if str(moneda).upper() == 'USD' else '_pen'
+    pct = _float(condiciones.get('comision_estructuracion_pct')) / 100
+    minima = _float(condiciones.get(f'comision_estructuracion{sufijo}'))
+    afiliacion = _float(condiciones.get(f'comision_afiliacion{sufijo}'))
+    return [
+        {'nombre': 'Condiciones del emisor', 'comision_estructuracion_pct': pct,
+         'comision_minima': minima, 'comision_afiliacion': afiliacion},
+        {'nombre': 'Sin afiliación', 'comision_estructuracion_pct': pct,
+         'comision_minima': minima, 'comision_afiliacion': 0.0},
+        {'nombre': 'Sin comisión mínima', 'comision_estructuracion_pct': pct,
+         'comision_minima': 0.0, 'comision_afiliacion': afiliacion},
+    ]
+
+def _clave_estructuras(estructuras: Sequence[Dict[str, Any]]) -> Tuple[tuple, ...]:
+    return tuple(
+        (str(e.get('nombre') or f"Estructura {i + 1}"), _float(e.get('comision_estructuracion_pct')),
+         _float(e.get('comision_minima')), _float(e.get('comision_afiliacion')))
+        for i, e in enumerate(estructuras)
+    )
+
+def calcular_grilla_sensibilidad(mfn: Any, tasa_avance: float, estructuras: Sequence[Dict[str, Any]],
+                                 tasas_interes: Optional[Sequence[float]] = None,
+                                 plazos: Optional[Sequence[int]] = None,
+                                 dias_minimos: int = 0, igv_pct: float = IGV_PCT,
+                                 redondeo_objetivo: float = 10) -> Dict[str, Any]:
+    """
+    Evalúa el lote en cada celda estructura x interés mensual x plazo.
+
+    Args:
+        mfn: Monto neto de una factura, o lista con el de cada factura del lote. Las comisiones
+             mínima y de afiliación de cada estructura se prorratean por capital (= por MFN,
+             ya que la tasa de avance es común), como en Originación.
+        tasa_avance: Fracción (0.9 = 90%).
+        estructuras: Ver estructuras_desde_condiciones.
+        tasas_interes: Interés mensual en fracción (0.02 = 2%). Por defecto INTERES_MENSUAL_DEFECTO.
+        plazos: Días de operación. Por defecto PLAZOS_DEFECTO. Se aplica max(plazo, dias_minimos).
+
+    Returns:
+        {'ejes': {'estructura', 'interes_mensual', 'plazo_operacion'}, 'forma': [C, I, P],
+         'mfn_total': float, 'matrices': {metrica: [[[...]]]}} (ver METRICAS_SENSIBILIDAD).
+        El resultado se comparte entre llamadas idénticas (caché): no modificarlo.
+    """
+    mfn_lote = tuple(float(m) for m in (mfn if isinstance(mfn, (list, tuple)) else [mfn]))
+    if not mfn_lote or any(m <= 0 for m in mfn_lote):
+        raise ValueError("MFN no puede ser cero.")
+    if not 0 < float(tasa_avance) <= 1:
+        raise ValueError("La tasa de avance debe estar entre 0 y 1 (fracción).")
+    if not estructuras:
+        raise ValueError("Debe indicar al menos una estructura de comisión.")
+    tasas = tuple(float(t) for t in (tasas_interes or INTERES_MENSUAL_DEFECTO))
+    dias = tuple(int(p) for p in (plazos or PLAZOS_DEFECTO))
+    if any(p < 0 for p in dias):
+        raise ValueError("Los plazos no pueden ser negativos.")
+    celdas = len(estructuras) * len(tasas) * len(dias) * len(mfn_lote)
+    if celdas > MAX_CELDAS_SENSIBILIDAD:
+        raise ValueError(f"La grilla excede el máximo de {MAX_CELDAS_SENSIBILIDAD:,} celdas.")
+
+    return _grilla_cacheada(mfn_lote, float(tasa_avance), _clave_estructuras(estructuras), tasas, dias,
+                            int(dias_minimos or 0), float(igv_pct), float(redondeo_objetivo))
+
+@lru_cache(maxsize=SENSIBILIDAD_CACHE_SIZE)
+def _grilla_cacheada(mfn_lote: Tuple[float, ...], tasa_avance: float, estructuras: Tuple[tuple, ...],
+                     tasas: Tuple[float, ...], dias: Tuple[int, ...], dias_minimos: int,
+                     igv_pct: float, redondeo_objetivo: float) -> Dict[str, Any]:
+    mfn = np.array(mfn_lote)                          # (N,)
+    participacion = mfn / mfn.sum()
+    pct = np.array([e[1] for e in estructuras])[:, None, None, None]                       # (C,1,1,1)
+    minima = np.array([e[2] for e in estructuras])[:, None, None, None] * participacion   # (C,1,1,N)
+    afiliacion = np.array([e[3] for e in estructuras])[:, None, None, None] * participacion
+    interes_mensual = np.array(tasas)[None, :, None, None]                                  # (1,I,1,1)
+    plazo = np.maximum(np.array(dias, dtype=float), dias_minimos)[None, None, :, None]      # (1,1,P,1)
+
+    r = evaluar_lote_vectorizado(mfn, tasa_avance, interes_mensual, plazo, pct, minima,
+                                 afiliacion, igv_pct, redondeo_objetivo)
+
+    mfn_total = float(mfn.sum())
+    capital = r['capital'].sum(axis=-1)
+    abono = r['abono_real'].sum(axis=-1)
+    matrices = {
+        'abono_real': np.round(abono, 2),
+        'abono_pct': np.round(abono / mfn_total * 100, 3),
+        'margen_seguridad': np.round(r['margen_seguridad'].sum(axis=-1), 2),
+        'tasa_avance_encontrada': np.round(capital / mfn_total, 6),
+        'capital': np.round(capital, 2),
+        'interes': np.round(r['interes'].sum(axis=-1), 2),
+        'comision_estructuracion': np.round(r['comision_estructuracion'].sum(axis=-1), 2),
+        'metodo_comision': np.where(r['usa_porcentaje'], 'PORCENTAJE', 'FIJO_PRORRATEADO'),
+    }
+    return {
+        'ejes': {
+            'estructura': [e[0] for e in estructuras],
+            'interes_mensual': list(tasas),
+            'plazo_operacion': list(dias),
+        },
+        'forma': [len(estructuras), len(tasas), len(dias)],
+        'mfn_total': round(mfn_total, 2),
+        'tasa_avance': tasa_avance,
+        'matrices': {k: v.tolist() for k, v in matrices.items()},
+    }
+
+def sensibilidad_desde_condiciones(condiciones: Dict[str, Any], mfn: Any, moneda: str = 'PEN',
+                                   tasa_avance: Optional[float] = None,
+                                   tasas_interes: Optional[Sequence[float]] = None,
+                                   plazos: Optional[Sequence[int]] = None,
+                                   estructuras: Optional[Sequence[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Grilla de sensibilidad con las condiciones de un emisor (fila de get_financial_conditions).
+    Lo no indicado sale de las condiciones: tasa de avance, días mínimos de interés y las
+    tres estructuras de estructuras_desde_condiciones.
+    """
+    if tasa_avance is None:
+        tasa_avance = _float(condiciones.get('tasa_avance')) / 100
+    resultado = calcular_grilla_sensibilidad(
+        mfn, tasa_avance, estructuras or estructuras_desde_condiciones(condiciones, moneda),
+        tasas_interes=tasas_interes, plazos=plazos,
+        dias_minimos=int(_float(condiciones.get('dias_minimos_interes'))),
+    )
+    sufijo = '_usd' if str(moneda).upper() == 'USD' else '_pen'
+    interes_emisor = _float(condiciones.get(f'interes_mensual{sufijo}')) / 100
+    return {**resultado, 'moneda': str(moneda).upper(), 'interes_mensual_emisor': interes_emisor or None}
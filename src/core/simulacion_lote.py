@@ -0,0 +1,193 @@
+# src/core/simulacion_lote.py
+"""
+Simulación vectorizada de un lote de facturas sobre una grilla de escenarios.
+
+Reproduce, para cada escenario (tasa de avance, interés mensual, plazo), el mismo
+flujo que Originación/Calculadora hacen con factoring_calculator:
+
+    1. procesar_lote_desembolso_inicial  -> abono teórico con la tasa de avance dada
+    2. monto objetivo = abono teórico redondeado hacia abajo a múltiplos de 10
+    3. procesar_lote_encontrar_tasa      -> tasa de avance que da ese monto objetivo
+
+con la decisión de comisión (PORCENTAJE vs FIJO_PRORRATEADO) tomada por lote en
+cada escenario. En lugar de un bucle Python por escenario y factura, todo se
+calcula con arreglos numpy de forma (escenarios, facturas), de modo que cientos
+de escenarios se evalúan en milisegundos.
+
+El resultado es columnar (listas paralelas), listo para un DataFrame o un gráfico.
+"""
+
+import itertools
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Parámetros que un escenario puede variar (el resto viene de cada factura)
+PARAMETROS_ESCENARIO = ('tasa_avance', 'interes_mensual', 'plazo_operacion')
+MAX_CELDAS_SIMULACION = 2_000_000  # escenarios x facturas
+
+def expandir_grilla(grilla: Dict[str, List[float]]) -> Dict[str, List[Optional[float]]]:
+    """
+    Producto cartesiano de los valores de cada parámetro. Los parámetros ausentes
+    (o con lista vacía) quedan en None: cada factura usa su propio valor.
+        {'tasa_avance': [0.9, 0.95], 'plazo_operacion': [30, 60]}
+        -> 4 escenarios {'tasa_avance': [0.9, 0.9, 0.95, 0.95], 'interes_mensual': [None]*4, 'plazo_operacion': [30, 60, 30, 60]}
+    """
+    desconocidos = set(grilla) - set(PARAMETROS_ESCENARIO)
+    if desconocidos:
+        raise ValueError(f"Parámetros de escenario no soportados: {', '.join(sorted(desconocidos))}")
+    ejes = [list(grilla.get(p) or [None]) for p in PARAMETROS_ESCENARIO]
+    combinaciones = list(itertools.product(*ejes))
+    return {p: [c[i] for c in combinaciones] for i, p in enumerate(PARAMETROS_ESCENARIO)}
+
+def _columna_factura(facturas: List[Dict[str, Any]], clave: str, defecto: float = 0.0) -> np.ndarray:
+    return np.array([float(f.get(clave, defecto) or 0.0) for f in facturas], dtype=float)
+
+def _matriz_parametro(valores_escenario: List[Optional[float]], valores_factura: np.ndarray) -> np.ndarray:
+    """(S, N): el valor del escenario si está definido, si no el de la factura."""
+    escenario = np.array([np.nan if v is None else float(v) for v in valores_escenario], dtype=float)[:, None]
+    return np.where(np.isnan(escenario), valores_factura[None, :], escenario)
+
+def _redondear(arr: np.ndarray, decimales: int = 2) -> list:
+    return np.round(arr, decimales).tolist()
+
+def evaluar_lote_vectorizado(mfn, tasa_avance, interes_mensual, plazo, pct, comision_minima,
+                             afiliacion, igv, redondeo_objetivo: float = 10) -> Dict[str, np.ndarray]:
+    """
+    Núcleo vectorizado: todos los argumentos son arreglos que se difunden (broadcast)
+    a una forma común (..., N), donde el último eje son las facturas de un lote y los
+    ejes anteriores son escenarios. La decisión de comisión se toma por lote
+    (sumando sobre el último eje), como en factoring_calculator.
+
+    Devuelve arreglos (..., N) por factura, salvo 'usa_porcentaje' que es (...).
+    """
+    arrays = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in
+                                   (mfn, tasa_avance, interes_mensual, plazo, pct, comision_minima, afiliacion, igv)))
+    mfn, tasa_avance, interes_mensual, plazo, pct, comision_minima, afiliacion, igv = arrays
+    pct_lote = pct[..., :1]  # Como en factoring_calculator: el % del lote es el de la primera factura
+    igv_afiliacion = afiliacion * igv
+
+    factor_interes = (1 + interes_mensual / 30) ** plazo - 1
+    comision_fija_total = comision_minima.sum(axis=-1)
+
+    # FASE 1: desembolso inicial con la tasa de avance del escenario (procesar_lote_desembolso_inicial)
+    capital_inicial = mfn * tasa_avance
+    usa_porcentaje_inicial = (capital_inicial.sum(axis=-1) * pct_lote[..., 0]) > comision_fija_total
+    comision_inicial = np.where(usa_porcentaje_inicial[..., None], capital_inicial * pct, comision_minima)
+    interes_inicial = capital_inicial * factor_interes
+    abono_teorico = (capital_inicial - interes_inicial * (1 + igv) - comision_inicial * (1 + igv)
+                     - afiliacion - igv_afiliacion)
+
+    # FASE 2: monto objetivo (sobre el abono ya redondeado a centavos, como en CalculationClient.calcular_lote)
+    monto_objetivo = np.floor(np.round(abono_teorico, 2) / redondeo_objetivo) * redondeo_objetivo
+
+    # FASE 3: capital necesario bajo ambos esquemas (_resolver_capital_dual) y decisión por lote
+    costo_fijo_afiliacion = afiliacion * (1 + igv)
+    denominador_a = 1 - (factor_interes + pct) * (1 + igv)
+    denominador_b = 1 - factor_interes * (1 + igv)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        capital_a = np.where(denominador_a > 0, (monto_objetivo + costo_fijo_afiliacion) / denominador_a, 0.0)
+        capital_b = np.where(denominador_b > 0,
+                             (monto_objetivo + comision_minima * (1 + igv) + costo_fijo_afiliacion) / denominador_b, 0.0)
+    usa_porcentaje = (capital_a.sum(axis=-1) * pct_lote[..., 0]) > comision_fija_total
+    capital = np.where(usa_porcentaje[..., None], capital_a, capital_b)
+    comision = np.where(usa_porcentaje[..., None], capital * pct_lote, comision_minima)
+
+    # FASE 4: desglose final (_construir_respuesta_tasa_encontrada)
+    interes = capital * factor_interes
+    igv_interes = interes * igv
+    igv_comision = comision * igv
+    abono_real = capital - interes - igv_interes - comision - igv_comision - afiliacion - igv_afiliacion
+
+    return {
+        'usa_porcentaje': usa_porcentaje,
+        'monto_objetivo': monto_objetivo,
+        'capital': capital,
+        'interes': interes,
+        'comision_estructuracion': comision,
+        'comision_afiliacion': afiliacion,
+        'igv_total': igv_interes + igv_comision + igv_afiliacion,
+        'abono_real': abono_real,
+        'margen_seguridad': mfn - capital,
+    }
+
+def simular_lote(facturas: List[Dict[str, Any]], escenarios: Dict[str, List[Optional[float]]],
+                 incluir_detalle: bool = False, redondeo_objetivo: float = 10) -> Dict[str, Any]:
+    """
+    Evalúa el lote completo en cada escenario.
+
+    Args:
+        facturas: Ítems con las claves de factoring_calculator (mfn, tasa_avance, interes_mensual,
+                  plazo_operacion, comision_estructuracion_pct, comision_minima_aplicable, igv_pct,
+                  comision_afiliacion_aplicable, aplicar_comision_afiliacion).
+        escenarios: Listas paralelas por parámetro de PARAMETROS_ESCENARIO (ver expandir_grilla);
+                    None en una posición = usar el valor de cada factura.
+        incluir_detalle: Si True, agrega 'por_factura' con matrices [escenario][factura].
+        redondeo_objetivo: Múltiplo al que se redondea hacia abajo el monto objetivo.
+
+    Returns:
+        {
+            'n_escenarios': S, 'n_facturas': N,
+            'escenarios': {'tasa_avance': [...], 'interes_mensual': [...], 'plazo_operacion': [...]},
+            'resultados': {'metodo_comision': [...], 'capital': [...], 'interes': [...], 'igv_total': [...],
+                           'comision_estructuracion': [...], 'comision_afiliacion': [...],
+                           'monto_objetivo': [...], 'abono_real': [...], 'abono_pct': [...],
+                           'margen_seguridad': [...], 'tasa_avance_encontrada': [...]},
+            'por_factura': {...}   # solo con incluir_detalle
+        }
+    """
+    if not facturas:
+        raise ValueError("El lote de datos no puede estar vacío.")
+    n_escenarios = max((len(v) for v in escenarios.values() if v), default=0)
+    if n_escenarios == 0:
+        raise ValueError("Debe indicar al menos un escenario.")
+    if any(len(escenarios.get(p) or [None] * n_escenarios) != n_escenarios for p in PARAMETROS_ESCENARIO):
+        raise ValueError("Todas las listas de escenarios deben tener la misma longitud.")
+    if n_escenarios * len(facturas) > MAX_CELDAS_SIMULACION:
+        raise ValueError(f"La simulación excede el máximo de {MAX_CELDAS_SIMULACION:,} celdas (escenarios x facturas).")
+
+    mfn = _columna_factura(facturas, 'mfn')
+    if np.any(mfn <= 0):
+        raise ValueError("MFN no puede ser cero.")
+    igv = _columna_factura(facturas, 'igv_pct', 0.18)
+    pct = _columna_factura(facturas, 'comision_estructuracion_pct')
+    comision_minima = _columna_factura(facturas, 'comision_minima_aplicable')
+    aplica_afiliacion = np.array([bool(f.get('aplicar_comision_afiliacion', False)) for f in facturas])
+    afiliacion = np.where(aplica_afiliacion, _columna_factura(facturas, 'comision_afiliacion_aplicable'), 0.0)
+
+    tasa_avance = _matriz_parametro(escenarios.get('tasa_avance') or [None] * n_escenarios, _columna_factura(facturas, 'tasa_avance'))
+    interes_mensual = _matriz_parametro(escenarios.get('interes_mensual') or [None] * n_escenarios, _columna_factura(facturas, 'interes_mensual'))
+    plazo = _matriz_parametro(escenarios.get('plazo_operacion') or [None] * n_escenarios, _columna_factura(facturas, 'plazo_operacion'))
+
+    r = evaluar_lote_vectorizado(mfn, tasa_avance, interes_mensual, plazo, pct, comision_minima,
+                                 afiliacion, igv, redondeo_objetivo)
+    capital, interes, comision, abono_real = r['capital'], r['interes'], r['comision_estructuracion'], r['abono_real']
+    margen, igv_total, monto_objetivo, usa_porcentaje = r['margen_seguridad'], r['igv_total'], r['monto_objetivo'], r['usa_porcentaje']
+
+    mfn_total = mfn.sum()
+    resultado = {
+        'n_escenarios': n_escenarios,
+        'n_facturas': len(facturas),
+        'escenarios': {p: list(escenarios.get(p) or [None] * n_escenarios) for p in PARAMETROS_ESCENARIO},
+        'resultados': {
+            'metodo_comision': np.where(usa_porcentaje, 'PORCENTAJE', 'FIJO_PRORRATEADO').tolist(),
+            'capital': _redondear(capital.sum(axis=1)),
+            'interes': _redondear(interes.sum(axis=1)),
+            'igv_total': _redondear(igv_total.sum(axis=1)),
+            'comision_estructuracion': _redondear(comision.sum(axis=1)),
+            'comision_afiliacion': _redondear(np.broadcast_to(afiliacion.sum(), (n_escenarios,))),
+            'monto_objetivo': _redondear(monto_objetivo.sum(axis=1)),
+            'abono_real': _redondear(abono_real.sum(axis=1)),
+            'abono_pct': _redondear(abono_real.sum(axis=1) / mfn_total * 100, 3),
+            'margen_seguridad': _redondear(margen.sum(axis=1)),
+            'tasa_avance_encontrada': _redondear(capital.sum(axis=1) / mfn_total, 6),
+        },
+    }
+    if incluir_detalle:
+        resultado['por_factura'] = {
+            'capital': _redondear(capital),
+            'abono_real': _redondear(abono_real),
+            'monto_objetivo': _redondear(monto_objetivo),
+            'tasa_avance_encontrada': _redondear(capital / mfn, 6),
+        }
+    return resultado
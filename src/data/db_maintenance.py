@@ -0,0 +1,174 @@
+# src/data/db_maintenance.py
+"""
+Maintenance operations for cleaning the operational tables (used by
+pages/09_Limpieza_Base_Datos.py).
+
+- Counts are computed by the server (count='exact', head=True): no rows travel.
+- Deletes run in chunks: one page of keys is read in key order, and exactly those
+  keys are deleted (key IN (...), DELETE_KEYS_PER_REQUEST per request). Tens of
+  thousands of rows take tens of requests instead of one request per row, and a
+  row inserted meanwhile is never deleted without having been archived.
+- Tables are cleaned children-first (OPERATIONAL_TABLES order) so foreign keys
+  from events/summaries to propuestas are never violated.
+- Optionally every chunk is archived before it is deleted, streamed to a local
+  JSONL file (and converted to Parquet at the end if pyarrow is installed).
+"""
+
+import os
+import json
+import datetime as dt
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+from .supabase_client import get_supabase_client
+
+# (table, key column, description), in FK-safe deletion order: children before parents
+OPERATIONAL_TABLES: List[Tuple[str, str, str]] = [
+    ('liquidacion_eventos', 'id', 'Eventos de liquidación'),
+    ('liquidaciones_resumen', 'id', 'Resumen de liquidaciones'),
+    ('desembolso_eventos', 'id', 'Eventos de desembolso'),
+    ('desembolsos_resumen', 'id', 'Resumen de desembolsos'),
+    ('auditoria_eventos', 'id', 'Registro de auditoría'),
+    ('propuestas', 'proposal_id', 'Propuestas de factoring guardadas'),
+]
+
+CONFIGURATION_TABLES: List[Tuple[str, str]] = [
+    ('authorized_users', 'Usuarios autorizados del sistema'),
+    ('modules', 'Módulos del sistema'),
+    ('user_module_access', 'Permisos de acceso por usuario'),
+    ('EMISORES.ACEPTANTES', 'Catálogo de empresas (RUC y razones sociales)'),
+]
+
+DEFAULT_CHUNK_SIZE = 1000  # PostgREST returns at most 1000 rows per request by default
+DELETE_KEYS_PER_REQUEST = 200  # Keys go in the URL (key=in.(...)): keep it well under proxy limits
+ARCHIVE_DIR = os.getenv(
+    "DB_ARCHIVE_DIR",
+    os.path.join(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')), '.archive')
+)
+
+def count_rows(table: str, supabase=None) -> int:
+    """Server-side row count (HEAD request, no data transferred)."""
+    supabase = supabase or get_supabase_client()
+    response = supabase.table(table).select('*', count='exact', head=True).execute()
+    return response.count or 0
+
+def _archive_file(archive_dir: str, table: str) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    return os.path.join(archive_dir, f"{table}.jsonl")
+
+def _jsonl_to_parquet(jsonl_path: str) -> Optional[str]:
+    """Converts an archive to Parquet if pyarrow is available. Returns the path or None."""
+    try:
+        from pyarrow import json as pa_json
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    if os.path.getsize(jsonl_path) == 0:
+        return None
+    parquet_path = jsonl_path[:-len('.jsonl')] + '.parquet'
+    pq.write_table(pa_json.read_json(jsonl_path), parquet_path)
+    os.remove(jsonl_path)
+    return parquet_path
+
+def delete_table_rows(table: str, key_column: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      archive_path: Optional[str] = None,
+                      progress: Optional[Callable[[str, int], None]] = None,
+                      supabase=None) -> int:
+    """
+    Deletes every row of `table` in key-ordered chunks and returns how many were deleted.
+
+    Each round reads the next `chunk_size` keys (or whole rows when archiving), appends
+    them to `archive_path` (JSONL) and deletes exactly those keys.
+    `progress(table, deleted_so_far)` is called after every chunk.
+
+    Raises RuntimeError if a chunk is not completely deleted (e.g. RLS or missing
+    permissions: PostgREST answers 200 with 0 rows affected), instead of selecting,
+    archiving and "deleting" the same chunk forever.
+    """
+    supabase = supabase or get_supabase_client()
+    columns = '*' if archive_path else key_column
+    deleted = 0
+    archive = open(archive_path, 'a', encoding='utf-8') if archive_path else None
+    try:
+        while True:
+            response = supabase.table(table).select(columns).order(key_column).limit(chunk_size).execute()
+            rows = response.data or []
+            if not rows:
+                return deleted
+
+            if archive:
+                for row in rows:
+                    archive.write(json.dumps(row, default=str, ensure_ascii=False))
+                    archive.write('\n')
+                # The chunk must be on disk before it is deleted from the database
+                archive.flush()
+                os.fsync(archive.fileno())
+
+            keys = [row[key_column] for row in rows]
+            chunk_deleted = 0
+            for i in range(0, len(keys), DELETE_KEYS_PER_REQUEST):
+                response = supabase.table(table).delete(count='exact', returning='minimal') \
+                    .in_(key_column, keys[i:i + DELETE_KEYS_PER_REQUEST]).execute()
+                chunk_deleted += response.count if response.count is not None else len(response.data or [])
+            deleted += chunk_deleted
+            if progress:
+                progress(table, deleted)
+            if chunk_deleted != len(keys):
+                raise RuntimeError(
+                    f"{table}: se eliminaron {chunk_deleted} de {len(keys)} filas de {key_column} "
+                    f"{keys[0]}..{keys[-1]} (¿RLS o permisos insuficientes?)"
+                )
+    finally:
+        if archive:
+            archive.close()
+
+def clean_operational_tables(chunk_size: int = DEFAULT_CHUNK_SIZE, archive: bool = False,
+                             archive_format: str = 'jsonl',
+                             progress: Optional[Callable[[str, int], None]] = None,
+                             tables: Optional[List[Tuple[str, str, str]]] = None) -> Dict[str, Any]:
+    """
+    Cleans the operational tables in FK-safe order.
+
+    Args:
+        chunk_size: Rows per read/delete round.
+        archive: If True, rows are saved under ARCHIVE_DIR/<timestamp>/<table>.jsonl first.
+        archive_format: 'jsonl' or 'parquet' (parquet needs pyarrow; falls back to jsonl).
+        progress: Callback (table, deleted_so_far).
+        tables: Subset of OPERATIONAL_TABLES (same tuple format); defaults to all.
+
+    Returns:
+        {'results': [{'tabla', 'registros', 'status', 'archivo'}], 'total': n, 'archive_dir': path|None}
+
+    Stops at the first failing table: later tables may reference it.
+    """
+    supabase = get_supabase_client()
+    archive_dir = os.path.join(ARCHIVE_DIR, dt.datetime.now().strftime('%Y%m%d_%H%M%S')) if archive else None
+    results = []
+    total = 0
+    failed = False
+
+    for table, key_column, _ in tables or OPERATIONAL_TABLES:
+        if failed:
+            results.append({'tabla': table, 'registros': 0, 'status': "Omitida (falló una tabla anterior)", 'archivo': None})
+            continue
+        archive_path = _archive_file(archive_dir, table) if archive_dir else None
+        deleted_so_far = {'n': 0}
+
+        def track(tabla: str, n: int) -> None:
+            deleted_so_far['n'] = n
+            if progress:
+                progress(tabla, n)
+
+        try:
+            count = delete_table_rows(table, key_column, chunk_size=chunk_size,
+                                      archive_path=archive_path, progress=track, supabase=supabase)
+            if archive_path and archive_format == 'parquet':
+                archive_path = _jsonl_to_parquet(archive_path) or archive_path
+            results.append({'tabla': table, 'registros': count, 'status': "Éxito", 'archivo': archive_path})
+            total += count
+        except Exception as e:
+            print(f"[ERROR en clean_operational_tables] {table}: {e}")
+            results.append({'tabla': table, 'registros': deleted_so_far['n'], 'status': f"Error: {str(e)}", 'archivo': archive_path})
+            total += deleted_so_far['n']
+            failed = True
+
+    return {'results': results, 'total': total, 'archive_dir': archive_dir}
@@ -0,0 +1,74 @@
+# src/data/json_codec.py
+"""
+JSON encode/decode for stored blobs and API payloads.
+
+recalculate_result_json, resultado_json and detalles_adicionales are encoded on
+every save and decoded on every page view, and each API response goes through a
+JSON encoder. This module uses orjson when installed (several times faster than
+the stdlib on the calculator's nested float dicts) and falls back to `json`
+otherwise, with the same output for the data we store:
+
+- dumps(obj) -> str (for text columns), dumps_bytes(obj) -> bytes (HTTP bodies).
+  Compact, UTF-8 (non-ASCII is not escaped). NaN/Infinity are encoded as null,
+  because Postgres jsonb and browsers reject them.
+- loads(data) accepts str or bytes. Errors are json.JSONDecodeError (orjson's
+  error subclasses it), so existing `except json.JSONDecodeError` keep working.
+- Values that are not plain JSON types (dates, Decimal, numpy scalars, float
+  subclasses...) go through _default: numeric types as numbers, the rest as str().
+"""
+
+import json
+import math
+from decimal import Decimal
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib path is slower but equivalent
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+def _default(obj: Any) -> Any:
+    if hasattr(obj, 'tolist'):  # numpy scalars and arrays
+        return obj.tolist()
+    if isinstance(obj, (int, float, Decimal)):  # Subclasses (IntEnum, numpy.float64...)
+        return float(obj) if isinstance(obj, (float, Decimal)) else int(obj)
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode('utf-8')
+
+    def loads(data: Union[str, bytes, bytearray]) -> Any:
+        return orjson.loads(data)
+else:
+    def _sin_nan(obj: Any) -> Any:
+        if isinstance(obj, float) and not math.isfinite(obj):
+            return None
+        if isinstance(obj, dict):
+            return {k: _sin_nan(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [_sin_nan(v) for v in obj]
+        return obj
+
+    def dumps(obj: Any) -> str:
+        try:
+            return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+        except ValueError:  # NaN/Infinity somewhere: same output as orjson (null)
+            return json.dumps(_sin_nan(obj), default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return dumps(obj).encode('utf-8')
+
+    def loads(data: Union[str, bytes, bytearray]) -> Any:
+        return json.loads(data)
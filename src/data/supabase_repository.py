@@ -1,12 +1,16 @@
 # src/data/supabase_repository.py
 
 import os
+import re
 import json
+import time
+import threading
 import datetime as dt
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 
 # Internal imports
 from .supabase_client import get_supabase_client
+from . import json_codec
 
 # --- Type Aliases for Clarity ---
 Proposal = Dict[str, Any]
@@ -31,6 +35,69 @@ def _convert_to_numeric(value: Any) -> Optional[float]:
     except (ValueError, TypeError):
         return None
 
+# --- Change Tokens ---
+# Per-table version counters in the data_versions table, bumped by statement-level
+# triggers on every write (migrations/add_data_versions.sql), so writes made by the API
+# or by other sessions also invalidate page caches. One cheap read serves all tables
+# for DATA_VERSION_TTL_SECONDS; this process' own writes additionally bump a local
+# counter, so they are visible on the very next rerun.
+DATA_VERSION_TTL_SECONDS = 2.0
+DATA_VERSION_RETRY_SECONDS = 60.0  # If data_versions is missing (migration not applied)
+
+_local_versions: Dict[str, int] = {}
+_remote_versions: Dict[str, Any] = {'values': {}, 'loaded_at': 0.0, 'ttl': DATA_VERSION_TTL_SECONDS}
+_versions_lock = threading.Lock()
+
+def get_data_versions(force_refresh: bool = False) -> Dict[str, int]:
+    """{table_name: version} from data_versions (cached; empty if the table is unavailable)."""
+    cache = _remote_versions
+    if not force_refresh and time.monotonic() - cache['loaded_at'] < cache['ttl']:
+        return cache['values']
+    with _versions_lock:
+        if force_refresh or time.monotonic() - cache['loaded_at'] >= cache['ttl']:
+            try:
+                rows = get_supabase_client().table('data_versions').select('table_name, version').execute().data or []
+                cache['values'] = {row['table_name']: int(row['version'] or 0) for row in rows}
+                cache['ttl'] = DATA_VERSION_TTL_SECONDS
+            except Exception as e:
+                print(f"[ERROR en get_data_versions]: {e}")
+                cache['ttl'] = DATA_VERSION_RETRY_SECONDS  # Local tokens only until the next retry
+            cache['loaded_at'] = time.monotonic()
+    return cache['values']
+
+def get_data_version(*tables: str) -> tuple:
+    """
+    Change token for one or more tables: equal tokens mean no known write in between.
+    Hashable, to be passed as an argument of cached functions (st.cache_data).
+    """
+    remote = get_data_versions()
+    return tuple((remote.get(table, 0), _local_versions.get(table, 0)) for table in tables)
+
+def _bump_data_version(table: str) -> None:
+    with _versions_lock:
+        _local_versions[table] = _local_versions.get(table, 0) + 1
+
+def invalidate_data_versions() -> None:
+    """Forces the next token read to query data_versions (e.g. after a write done by the API)."""
+    _remote_versions['loaded_at'] = 0.0
+
+# --- Change Listeners ---
+# In-process notifications of row changes made through this repository
+# (services/change_feed uses them to push updates to open pages).
+_change_listeners: List[Callable[[str, str, Dict[str, Any]], None]] = []
+
+def add_change_listener(callback: Callable[[str, str, Dict[str, Any]], None]) -> None:
+    """Registers callback(table, event_type, record), called after INSERT/UPDATE writes."""
+    if callback not in _change_listeners:
+        _change_listeners.append(callback)
+
+def _notify_change(table: str, event_type: str, record: Dict[str, Any]) -> None:
+    for callback in list(_change_listeners):
+        try:
+            callback(table, event_type, record)
+        except Exception as e:
+            print(f"[ERROR en _notify_change] {table}: {e}")
+
 # --- Public Repository Functions ---
 
 # --- Functions for Operations Module (Original `supabase_handler`) ---
@@ -56,8 +123,11 @@ def save_proposal(session_data: Proposal, identificador_lote: str) -> tuple[bool
     supabase = get_supabase_client()
     try:
         recalculate_result_full = session_data.get('recalculate_result')
+        if recalculate_result_full:
+            # Persist Group ID within JSON for Reporting (encoded once, with it)
+            recalculate_result_full['group_id'] = session_data.get('group_id')
         data_to_insert = {
-            'recalculate_result_json': json.dumps(recalculate_result_full) if recalculate_result_full else None,
+            'recalculate_result_json': json_codec.dumps(recalculate_result_full) if recalculate_result_full else None,
             'emisor_nombre': session_data.get('emisor_nombre'),
             'emisor_ruc': session_data.get('emisor_ruc'),
             'aceptante_nombre': session_data.get('aceptante_nombre'),
@@ -84,20 +154,18 @@ def save_proposal(session_data: Proposal, identificador_lote: str) -> tuple[bool
             capital = recalculate_result_full.get('calculo_con_tasa_encontrada', {}).get('capital')
             data_to_insert['capital_calculado'] = _convert_to_numeric(capital)
 
-        # Persist Group ID within JSON for Reporting
-        if recalculate_result_full:
-            recalculate_result_full['group_id'] = session_data.get('group_id')
-            data_to_insert['recalculate_result_json'] = json.dumps(recalculate_result_full)
-
         emisor_nombre_id = str(data_to_insert.get('emisor_nombre', 'SIN_NOMBRE')).replace(' ', '_').replace('.', '')
         numero_factura = str(data_to_insert.get('numero_factura', 'SIN_FACTURA'))
         fecha_propuesta = dt.datetime.now().strftime('%Y%m%d')
         data_to_insert['proposal_id'] = f"{emisor_nombre_id}-{numero_factura}-{fecha_propuesta}"
 
-        print(f"DEBUG: Data being sent to Supabase -> {json.dumps(data_to_insert, indent=4, default=str)}")
+        # Without the result blob: re-encoding it with indent just for the log cost more than the insert
+        print(f"DEBUG: Data being sent to Supabase -> { {k: v for k, v in data_to_insert.items() if k != 'recalculate_result_json'} }")
         response = supabase.table('propuestas').insert(data_to_insert).execute()
         if hasattr(response, 'error') and response.error:
             raise Exception(response.error.message)
+        _bump_data_version('propuestas')
+        _notify_change('propuestas', 'INSERT', response.data[0] if response.data else data_to_insert)
 
         return True, f"Propuesta con ID {data_to_insert['proposal_id']} guardada exitosamente."
 
@@ -167,6 +235,107 @@ def get_approved_proposals_for_disbursement() -> List[Proposal]:
         print(f"[ERROR en get_approved_proposals_for_disbursement]: {e}")
         return []
 
+# --- Proposal Queues (Aprobación / Desembolso) ---
+# The queue pages only show a handful of columns: the lote index travels without the
+# JSON blobs, and recalculate_result_json is fetched only for the lotes of the page
+# being shown (and reduced to its abono amount right away).
+QUEUE_LOTE_COLUMNS = 'proposal_id, identificador_lote, emisor_nombre'
+QUEUE_COLUMNS = (
+    'proposal_id, identificador_lote, emisor_nombre, emisor_ruc, aceptante_nombre, numero_factura, '
+    'monto_neto_factura, moneda_factura, anexo_number, contract_number, recalculate_result_json'
+)
+QUEUE_COLUMN_NAMES = tuple(col.strip() for col in QUEUE_COLUMNS.split(','))
+QUEUE_PAGE_SIZE = 1000
+
+def proposal_date_key(proposal_id: str) -> str:
+    """YYYYMMDD suffix of a proposal_id ('' if missing): the DB has no reliable created_at."""
+    suffix = str(proposal_id or '').rsplit('-', 1)[-1]
+    return suffix if len(suffix) == 8 and suffix.isdigit() else ''
+
+def _monto_desembolsar(recalculate_result_json: Any) -> float:
+    """Abono amount stored in recalculate_result_json (text or dict)."""
+    try:
+        data = recalculate_result_json if isinstance(recalculate_result_json, dict) else json_codec.loads(recalculate_result_json or '{}')
+        return float(data.get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0.0) or 0.0)
+    except (json.JSONDecodeError, AttributeError, TypeError, ValueError):
+        return 0.0
+
+def get_queue_lotes(estado: str) -> List[Dict[str, Any]]:
+    """
+    Lotes with proposals in `estado`, newest first:
+    [{'identificador_lote', 'emisor_nombre', 'n_facturas', 'fecha'}].
+    Only the three narrow QUEUE_LOTE_COLUMNS are read (paged by QUEUE_PAGE_SIZE).
+    """
+    supabase = get_supabase_client()
+    lotes: Dict[str, Dict[str, Any]] = {}
+    try:
+        start = 0
+        while True:
+            response = supabase.table('propuestas').select(QUEUE_LOTE_COLUMNS).eq('estado', estado).order(
+                'proposal_id'
+            ).range(start, start + QUEUE_PAGE_SIZE - 1).execute()
+            page = response.data or []
+            for row in page:
+                lote_id = row.get('identificador_lote') or 'Sin Lote'
+                lote = lotes.setdefault(lote_id, {
+                    'identificador_lote': lote_id,
+                    'emisor_nombre': row.get('emisor_nombre') or 'N/A',
+                    'n_facturas': 0,
+                    'fecha': '',
+                })
+                lote['n_facturas'] += 1
+                lote['fecha'] = max(lote['fecha'], proposal_date_key(row.get('proposal_id')))
+            if len(page) < QUEUE_PAGE_SIZE:
+                break
+            start += QUEUE_PAGE_SIZE
+    except Exception as e:
+        print(f"[ERROR en get_queue_lotes]: {e}")
+        return []
+    return sorted(lotes.values(), key=lambda l: (l['fecha'], l['identificador_lote']), reverse=True)
+
+def get_queue_proposals(estado: str, lote_ids: List[str]) -> List[Proposal]:
+    """
+    Proposals in `estado` for the given lotes, with QUEUE_COLUMNS only. The JSON blob
+    is replaced by 'monto_desembolsar' (abono of the recalculation). Paged by
+    QUEUE_PAGE_SIZE: a single request is capped by PostgREST's max rows.
+    """
+    if not lote_ids:
+        return []
+    supabase = get_supabase_client()
+    real_ids = [l for l in lote_ids if l != 'Sin Lote']
+
+    def page_query(start: int):
+        query = supabase.table('propuestas').select(QUEUE_COLUMNS).eq('estado', estado)
+        if 'Sin Lote' in lote_ids:
+            filters = ['identificador_lote.is.null']
+            if real_ids:
+                filters.append(f"identificador_lote.in.({','.join(json.dumps(l) for l in real_ids)})")
+            query = query.or_(','.join(filters))
+        else:
+            query = query.in_('identificador_lote', real_ids)
+        return query.order('identificador_lote').order('proposal_id').range(start, start + QUEUE_PAGE_SIZE - 1)
+
+    rows = []
+    try:
+        start = 0
+        while True:
+            page = page_query(start).execute().data or []
+            rows.extend(page)
+            if len(page) < QUEUE_PAGE_SIZE:
+                break
+            start += QUEUE_PAGE_SIZE
+    except Exception as e:
+        print(f"[ERROR en get_queue_proposals]: {e}")
+        return []
+    return [to_queue_row(row) for row in rows]
+
+def to_queue_row(record: Dict[str, Any]) -> Proposal:
+    """Reduces a 'propuestas' row (query result or pushed change) to the queue columns."""
+    row = {col: record.get(col) for col in QUEUE_COLUMN_NAMES if col != 'recalculate_result_json'}
+    row['monto_desembolsar'] = _monto_desembolsar(record.get('recalculate_result_json'))
+    row['identificador_lote'] = row.get('identificador_lote') or 'Sin Lote'
+    return row
+
 def get_disbursed_proposals_by_lote(lote_id: str) -> List[Proposal]:
     """Retrieves a list of disbursed or in-liquidation proposals for a specific batch ID."""
     supabase = get_supabase_client()
@@ -207,10 +376,15 @@ def update_proposal_status(proposal_id: str, status: str) -> None:
     """Updates the status of a single proposal."""
     supabase = get_supabase_client()
     try:
-        supabase.table('propuestas').update({'estado': status}).eq('proposal_id', proposal_id).execute()
+        response = supabase.table('propuestas').update({'estado': status}).eq('proposal_id', proposal_id).execute()
     except Exception as e:
         print(f"[ERROR en update_proposal_status]: {e}")
         raise
+    finally:
+        # The update may have been applied even if the response failed
+        _bump_data_version('propuestas')
+    # The update returns the full row: listeners can place it without another query
+    _notify_change('propuestas', 'UPDATE', response.data[0] if response.data else {'proposal_id': proposal_id, 'estado': status})
 
 # --- Liquidation Specific ---
 
@@ -246,7 +420,7 @@ def get_or_create_liquidacion_resumen(proposal_id: str, datos_operacion: Proposa
         return existing_resumen['id']
 
     try:
-        recalc_data = json.loads(datos_operacion.get('recalculate_result_json', '{}'))
+        recalc_data = json_codec.loads(datos_operacion.get('recalculate_result_json') or '{}')
         capital = recalc_data.get('calculo_con_tasa_encontrada', {}).get('capital', 0.0)
         new_entry = {
             "proposal_id": proposal_id,
@@ -255,6 +429,7 @@ def get_or_create_liquidacion_resumen(proposal_id: str, datos_operacion: Proposa
         }
         response = supabase.table('liquidaciones_resumen').insert(new_entry).execute()
         if response.data:
+            _bump_data_version('liquidaciones_resumen')
             return response.data[0]['id']
         else:
             raise Exception(f"Failed to create liquidacion_resumen: {getattr(response, 'error', 'Unknown error')}")
@@ -276,18 +451,21 @@ def add_liquidacion_evento(liquidacion_resumen_id: str, tipo_evento: str, fecha_
             "fecha_evento": fecha_evento.isoformat(),
             "monto_recibido": monto_recibido,
             "dias_diferencia": dias_diferencia,
-            "resultado_json": json.dumps(resultado_json)
+            "resultado_json": json_codec.dumps(resultado_json)
         }
-        supabase.table('liquidacion_eventos').insert(new_event).execute()
+        response = supabase.table('liquidacion_eventos').insert(new_event).execute()
+        _bump_data_version('liquidacion_eventos')
     except Exception as e:
         print(f"[ERROR en add_liquidacion_evento]: {e}")
         raise
+    _notify_change('liquidacion_eventos', 'INSERT', response.data[0] if response.data else new_event)
 
 def update_liquidacion_resumen_saldo(liquidacion_resumen_id: str, saldo_actual: float) -> None:
     """Updates the saldo_actual in the liquidaciones_resumen table."""
     supabase = get_supabase_client()
     try:
         supabase.table('liquidaciones_resumen').update({'saldo_actual': saldo_actual}).eq('id', liquidacion_resumen_id).execute()
+        _bump_data_version('liquidaciones_resumen')
     except Exception as e:
         print(f"[ERROR en update_liquidacion_resumen_saldo]: {e}")
         raise
@@ -312,7 +490,7 @@ def get_or_create_desembolso_resumen(proposal_id: str, datos_operacion: Proposal
         return existing_resumen['id']
     
     try:
-        recalc_data = json.loads(datos_operacion.get('recalculate_result_json', '{}'))
+        recalc_data = json_codec.loads(datos_operacion.get('recalculate_result_json') or '{}')
         abono = recalc_data.get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0.0)
         new_entry = {
             "proposal_id": proposal_id,
@@ -320,6 +498,7 @@ def get_or_create_desembolso_resumen(proposal_id: str, datos_operacion: Proposal
         }
         response = supabase.table('desembolsos_resumen').insert(new_entry).execute()
         if response.data:
+            _bump_data_version('desembolsos_resumen')
             return response.data[0]['id']
         else:
             raise Exception(f"Failed to create desembolso_resumen: {getattr(response, 'error', 'Unknown error')}")
@@ -342,6 +521,7 @@ def add_desembolso_evento(desembolso_resumen_id: str, tipo_evento: str, fecha_ev
             "monto_desembolsado": monto_desembolsado,
         }
         supabase.table('desembolso_eventos').insert(new_event).execute()
+        _bump_data_version('desembolso_eventos')
     except Exception as e:
         print(f"[ERROR en add_desembolso_evento]: {e}")
         raise
@@ -358,7 +538,7 @@ def add_audit_event(usuario_id: str, entidad_id: str, accion: str, estado_anteri
             "accion": accion,
             "estado_anterior": estado_anterior,
             "estado_nuevo": estado_nuevo,
-            "detalles_adicionales": json.dumps(detalles_adicionales),
+            "detalles_adicionales": json_codec.dumps(detalles_adicionales),
             "timestamp": dt.datetime.now().isoformat()
         }
         supabase.table('auditoria_eventos').insert(new_event).execute()
@@ -414,6 +594,7 @@ def add_user_module_access(user_id: int, module_id: int, hierarchy_level: str =
     supabase = get_supabase_client()
     try:
         response = supabase.table('user_module_access').insert({'user_id': user_id, 'module_id': module_id, 'hierarchy_level': hierarchy_level}).execute()
+        invalidate_access_cache()
         return response.data[0] if response.data else None
     except Exception as e:
         print(f"[ERROR in add_user_module_access]: {e}")
@@ -424,6 +605,7 @@ def add_module(name: str, description: Optional[str] = None) -> Optional[Dict[st
     supabase = get_supabase_client()
     try:
         response = supabase.table('modules').insert({'name': name, 'description': description}).execute()
+        invalidate_access_cache()
         return response.data[0] if response.data else None
     except Exception as e:
         print(f"[ERROR in add_module]: {e}")
@@ -431,6 +613,32 @@ def add_module(name: str, description: Optional[str] = None) -> Optional[Dict[st
 
 # --- Functions for Registro de Clientes Module ---
 
+RUC_PATTERN = re.compile(r'^\d{11}$')
+TIPOS_EMISOR_DEUDOR = ('EMISOR', 'ACEPTANTE')
+
+def _validate_emisor_deudor(data: Dict[str, Any]) -> Optional[str]:
+    """
+    Valida los campos obligatorios de un emisor/aceptante (en memoria, sin consultar la BD)
+    y normaliza 'tipo' -> 'TIPO'. Devuelve el mensaje de error o None si es válido.
+    """
+    # Validar campos obligatorios (TIPO es el nombre correcto en la BD)
+    tipo_value = data.get('TIPO') or data.get('tipo')  # Aceptar ambos por compatibilidad
+    if not data.get('RUC') or not data.get('Razon Social') or not tipo_value:
+        return "Faltan campos obligatorios: RUC, Razon Social, TIPO"
+
+    # Validar RUC (11 dígitos)
+    if not RUC_PATTERN.match(str(data.get('RUC', ''))):
+        return "RUC debe tener 11 dígitos numéricos"
+
+    # Validar tipo
+    if tipo_value not in TIPOS_EMISOR_DEUDOR:
+        return "TIPO debe ser 'EMISOR' o 'ACEPTANTE'"
+
+    # Asegurar que se use TIPO (nombre correcto)
+    if 'tipo' in data and 'TIPO' not in data:
+        data['TIPO'] = data.pop('tipo')
+    return None
+
 def create_emisor_deudor(data: Dict[str, Any]) -> tuple[bool, str]:
     """
     Crea un nuevo emisor o deudor en la tabla EMISORES.ACEPTANTES.
@@ -442,26 +650,12 @@ def create_emisor_deudor(data: Dict[str, Any]) -> tuple[bool, str]:
     Returns:
         Tuple (success: bool, message: str)
     """
-    import re
     supabase = get_supabase_client()
     try:
-        # Validar campos obligatorios (TIPO es el nombre correcto en la BD)
-        tipo_value = data.get('TIPO') or data.get('tipo')  # Aceptar ambos por compatibilidad
-        if not data.get('RUC') or not data.get('Razon Social') or not tipo_value:
-            return False, "Faltan campos obligatorios: RUC, Razon Social, TIPO"
-        
-        # Validar RUC (11 dígitos)
-        if not re.match(r'^\d{11}$', str(data.get('RUC', ''))):
-            return False, "RUC debe tener 11 dígitos numéricos"
-        
-        # Validar tipo
-        if tipo_value not in ['EMISOR', 'ACEPTANTE']:
-            return False, "TIPO debe ser 'EMISOR' o 'ACEPTANTE'"
-        
-        # Asegurar que se use TIPO (nombre correcto)
-        if 'tipo' in data and 'TIPO' not in data:
-            data['TIPO'] = data.pop('tipo')
-        
+        error = _validate_emisor_deudor(data)
+        if error:
+            return False, error
+
         # Verificar si ya existe
         existing = supabase.table('EMISORES.ACEPTANTES').select('RUC').eq('RUC', data['RUC']).execute()
         if existing.data:
@@ -469,6 +663,7 @@ def create_emisor_deudor(data: Dict[str, Any]) -> tuple[bool, str]:
         
         # Insertar
         response = supabase.table('EMISORES.ACEPTANTES').insert(data).execute()
+        _bump_emisores_version()
         return True, f"Registro creado exitosamente: {data['Razon Social']}"
     except Exception as e:
         print(f"[ERROR en create_emisor_deudor]: {e}")
@@ -488,29 +683,134 @@ def update_emisor_deudor(ruc: str, data: Dict[str, Any]) -> tuple[bool, str]:
     """
     supabase = get_supabase_client()
     try:
-        # Verificar que existe
-        existing = supabase.table('EMISORES.ACEPTANTES').select('*').eq('RUC', ruc).execute()
-        if not existing.data:
-            return False, f"No se encontró registro con RUC {ruc}"
-        
         # Validar tipo si se está actualizando (aceptar TIPO o tipo)
         tipo_value = data.get('TIPO') or data.get('tipo')
-        if tipo_value and tipo_value not in ['EMISOR', 'ACEPTANTE']:
+        if tipo_value and tipo_value not in TIPOS_EMISOR_DEUDOR:
             return False, "TIPO debe ser 'EMISOR' o 'ACEPTANTE'"
-        
+
         # Asegurar que se use TIPO (nombre correcto)
         if 'tipo' in data and 'TIPO' not in data:
             data['TIPO'] = data.pop('tipo')
-        
-        # Actualizar (no permitir cambiar RUC)
+
+        # Actualizar (no permitir cambiar RUC). PostgREST devuelve las filas afectadas:
+        # si no hay ninguna, el RUC no existe (sin consulta previa de existencia).
         data_to_update = {k: v for k, v in data.items() if k != 'RUC'}
         response = supabase.table('EMISORES.ACEPTANTES').update(data_to_update).eq('RUC', ruc).execute()
+        if not response.data:
+            return False, f"No se encontró registro con RUC {ruc}"
+        _bump_emisores_version()
         return True, "Registro actualizado exitosamente"
     except Exception as e:
         print(f"[ERROR en update_emisor_deudor]: {e}")
         return False, f"Error al actualizar registro: {str(e)}"
 
 
+BULK_UPSERT_CHUNK_SIZE = 500
+FINANCIAL_CONDITION_COLUMNS = (
+    'tasa_avance', 'interes_mensual_pen', 'interes_moratorio_pen', 'interes_mensual_usd',
+    'interes_moratorio_usd', 'comision_estructuracion_pen', 'comision_estructuracion_usd',
+    'comision_estructuracion_pct', 'comision_afiliacion_pen', 'comision_afiliacion_usd',
+    'dias_minimos_interes',
+)
+
+def bulk_upsert_emisores_deudores(rows: List[Dict[str, Any]], chunk_size: int = BULK_UPSERT_CHUNK_SIZE,
+                                  update_existing: bool = True) -> List[Dict[str, Any]]:
+    """
+    Carga masiva de emisores/aceptantes (p. ej. desde emisores_import.parse_emisores_file).
+
+    Valida todas las filas en memoria con las mismas reglas que create_emisor_deudor,
+    descarta RUCs duplicados dentro del archivo (gana la última fila) y hace upsert por
+    bloques sobre la clave RUC: una consulta de existencia y un upsert por bloque,
+    en lugar de select + insert por registro.
+
+    Args:
+        rows: Lista de diccionarios con los campos de la tabla. La clave opcional
+              '_fila' (número de fila en el archivo) se usa para reportar.
+        chunk_size: Filas por petición de upsert.
+        update_existing: Si es False, los RUC que ya existen se omiten en vez de actualizarse.
+
+    Returns:
+        Un resultado por fila de entrada, en orden:
+        {'fila', 'RUC', 'Razon Social', 'estado': 'creado'|'actualizado'|'omitido'|'error', 'mensaje'}
+    """
+    results: List[Dict[str, Any]] = []
+    valid_by_ruc: Dict[str, Dict[str, Any]] = {}
+    result_by_ruc: Dict[str, Dict[str, Any]] = {}
+
+    for index, row in enumerate(rows, start=1):
+        # Celdas vacías no se envían: en un registro existente conservan su valor actual
+        data = {k: v for k, v in row.items() if not k.startswith('_') and v is not None}
+        if data.get('RUC') is not None:
+            data['RUC'] = str(data['RUC']).strip()
+        result = {
+            'fila': row.get('_fila', index),
+            'RUC': data.get('RUC'),
+            'Razon Social': data.get('Razon Social'),
+            'estado': 'error',
+            'mensaje': '',
+        }
+        results.append(result)
+
+        error = _validate_emisor_deudor(data)
+        if not error:
+            bad_numbers = [k for k in FINANCIAL_CONDITION_COLUMNS
+                           if data.get(k) is not None and not isinstance(data[k], (int, float))]
+            if bad_numbers:
+                error = f"Valores no numéricos en: {', '.join(bad_numbers)}"
+        if error:
+            result['mensaje'] = error
+            continue
+
+        ruc = data['RUC']
+        if ruc in result_by_ruc:
+            previous = result_by_ruc[ruc]
+            previous['estado'] = 'omitido'
+            previous['mensaje'] = f"RUC duplicado en el archivo (se usa la fila {result['fila']})"
+        valid_by_ruc[ruc] = data
+        result_by_ruc[ruc] = result
+
+    supabase = get_supabase_client()
+    rucs = list(valid_by_ruc)
+    for start in range(0, len(rucs), chunk_size):
+        chunk_rucs = rucs[start:start + chunk_size]
+        try:
+            existing = supabase.table('EMISORES.ACEPTANTES').select('RUC').in_('RUC', chunk_rucs).execute()
+            existing_rucs = {r['RUC'] for r in (existing.data or [])}
+
+            if not update_existing:
+                for ruc in existing_rucs:
+                    result_by_ruc[ruc]['estado'] = 'omitido'
+                    result_by_ruc[ruc]['mensaje'] = f"Ya existe un registro con RUC {ruc}"
+                chunk_rucs = [ruc for ruc in chunk_rucs if ruc not in existing_rucs]
+                if not chunk_rucs:
+                    continue
+
+            # PostgREST exige las mismas columnas en todas las filas de un upsert masivo:
+            # se agrupan por conjunto de columnas para no pisar con NULL campos no enviados.
+            groups: Dict[tuple, List[Dict[str, Any]]] = {}
+            for ruc in chunk_rucs:
+                data = valid_by_ruc[ruc]
+                groups.setdefault(tuple(sorted(data)), []).append(data)
+            for payload in groups.values():
+                supabase.table('EMISORES.ACEPTANTES').upsert(payload, on_conflict='RUC').execute()
+            _bump_emisores_version()
+
+            for ruc in chunk_rucs:
+                if ruc in existing_rucs:
+                    result_by_ruc[ruc]['estado'] = 'actualizado'
+                    result_by_ruc[ruc]['mensaje'] = "Registro actualizado"
+                else:
+                    result_by_ruc[ruc]['estado'] = 'creado'
+                    result_by_ruc[ruc]['mensaje'] = "Registro creado"
+        except Exception as e:
+            print(f"[ERROR en bulk_upsert_emisores_deudores]: {e}")
+            for ruc in chunk_rucs:
+                result_by_ruc[ruc]['estado'] = 'error'
+                result_by_ruc[ruc]['mensaje'] = f"Error al guardar el bloque: {str(e)}"
+
+    return results
+
+
 def get_all_emisores_deudores(tipo: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Obtiene todos los emisores/deudores, opcionalmente filtrados por tipo.
@@ -533,27 +833,62 @@ def get_all_emisores_deudores(tipo: Optional[str] = None) -> List[Dict[str, Any]
         return []
 
 
-def search_emisores_deudores(search_term: str) -> List[Dict[str, Any]]:
+SEARCH_COLUMNS = 'RUC, "Razon Social", TIPO'
+SEARCH_PAGE_SIZE = 1000  # Máximo de filas por respuesta de PostgREST
+
+def search_emisores_deudores(search_term: str, limit: int = 20) -> List[Dict[str, Any]]:
     """
-    Busca emisores/deudores por RUC o Razón Social.
-    
+    Busca emisores/deudores por RUC o Razón Social en el servidor.
+
+    Devuelve solo las columnas de búsqueda (RUC, Razon Social, TIPO), hasta `limit`
+    filas. Con migrations/add_trgm_search_emisores.sql el ILIKE usa índices GIN de
+    pg_trgm. Para búsqueda por tecla desde la UI usar
+    src/services/counterparty_search.search_counterparties (índice en memoria).
+
     Args:
         search_term: Término de búsqueda
-    
+        limit: Máximo de resultados
+
     Returns:
         Lista de diccionarios con los registros encontrados
     """
     supabase = get_supabase_client()
     try:
         # Buscar por RUC o Razón Social (case insensitive)
-        response = supabase.table('EMISORES.ACEPTANTES').select('*').or_(
+        response = supabase.table('EMISORES.ACEPTANTES').select(SEARCH_COLUMNS).or_(
             f'RUC.ilike.%{search_term}%,"Razon Social".ilike.%{search_term}%'
-        ).execute()
+        ).limit(limit).execute()
         return response.data if response.data else []
     except Exception as e:
         print(f"[ERROR en search_emisores_deudores]: {e}")
         return []
 
+def get_emisores_search_rows() -> List[Dict[str, Any]]:
+    """
+    Descarga RUC, Razon Social y TIPO de toda la tabla (paginado) para construir
+    el índice de búsqueda en memoria. Lanza la excepción si falla la consulta.
+    """
+    supabase = get_supabase_client()
+    rows: List[Dict[str, Any]] = []
+    start = 0
+    while True:
+        response = supabase.table('EMISORES.ACEPTANTES').select(SEARCH_COLUMNS).order('RUC').range(
+            start, start + SEARCH_PAGE_SIZE - 1
+        ).execute()
+        page = response.data or []
+        rows.extend(page)
+        if len(page) < SEARCH_PAGE_SIZE:
+            return rows
+        start += SEARCH_PAGE_SIZE
+
+# Token de cambios de EMISORES.ACEPTANTES (ver get_data_version): los índices en memoria
+# se reconstruyen sin esperar a su TTL.
+def get_emisores_version() -> tuple:
+    return get_data_version('EMISORES.ACEPTANTES')
+
+def _bump_emisores_version() -> None:
+    _bump_data_version('EMISORES.ACEPTANTES')
+
 def get_financial_conditions(ruc: str) -> Optional[Dict[str, float]]:
     """
     Retrieves default financial conditions for a given RUC from EMISORES.ACEPTANTES.
@@ -564,13 +899,37 @@ def get_financial_conditions(ruc: str) -> Optional[Dict[str, float]]:
     supabase = get_supabase_client()
     try:
         response = supabase.table('EMISORES.ACEPTANTES').select(
-            'tasa_avance, interes_mensual_pen, interes_moratorio_pen, interes_mensual_usd, interes_moratorio_usd, comision_estructuracion_pen, comision_estructuracion_usd, comision_estructuracion_pct, comision_afiliacion_pen, comision_afiliacion_usd, dias_minimos_interes'
+            ', '.join(FINANCIAL_CONDITION_COLUMNS)
         ).eq('RUC', ruc).single().execute()
         return response.data if response.data else None
     except Exception as e:
         print(f"[ERROR in get_financial_conditions]: {e}")
         return None
 
+# Conditions change rarely; sensitivity grids are requested repeatedly for the same emisor.
+FINANCIAL_CONDITIONS_TTL_SECONDS = 300
+
+_conditions_cache: Dict[str, tuple] = {}  # ruc -> (loaded_at, emisores_version, conditions)
+_conditions_cache_lock = threading.Lock()
+
+def get_financial_conditions_cached(ruc: str) -> Optional[Dict[str, float]]:
+    """
+    get_financial_conditions with a per-RUC cache (FINANCIAL_CONDITIONS_TTL_SECONDS),
+    dropped as soon as this process writes to EMISORES.ACEPTANTES. Misses are not cached.
+    """
+    if not ruc:
+        return None
+    ruc = str(ruc).strip()
+    entry = _conditions_cache.get(ruc)
+    if entry and entry[1] == get_emisores_version() and time.monotonic() - entry[0] < FINANCIAL_CONDITIONS_TTL_SECONDS:
+        return entry[2]
+
+    conditions = get_financial_conditions(ruc)
+    if conditions:
+        with _conditions_cache_lock:
+            _conditions_cache[ruc] = (time.monotonic(), get_emisores_version(), conditions)
+    return conditions
+
 def search_proposals_advanced(
     emisor_ruc: Optional[str] = None, 
     fecha_inicio: Optional[dt.date] = None, 
@@ -664,18 +1023,23 @@ def get_full_permissions_matrix() -> List[Dict[str, Any]]:
     Note: For this MVP, if multiple users share a role, we might only show one or comma separate.
     We will assume SINGLE assignment per role/module for the simplified Matrix UI.
     """
-    modules = get_all_modules()
-    users = get_all_authorized_users()
-    user_map = {u['id']: u['email'] for u in users} # ID -> Email
-    
-    # Get all access records
     supabase = get_supabase_client()
     try:
-        access_response = supabase.table('user_module_access').select('*').execute()
-        access_list = access_response.data if access_response.data else []
+        # Single round trip: modules with their grants and the granted user's email embedded
+        response = supabase.table('modules').select(
+            'id, name, user_module_access(hierarchy_level, authorized_users(email))'
+        ).order('id').execute()
+        modules = response.data or []
+        grants_by_module = {
+            mod['id']: [
+                {'hierarchy_level': acc.get('hierarchy_level'), 'email': (acc.get('authorized_users') or {}).get('email', '')}
+                for acc in (mod.get('user_module_access') or [])
+            ]
+            for mod in modules
+        }
     except Exception as e:
-        print(f"[ERROR getting user_module_access]: {e}")
-        access_list = []
+        print(f"[WARN get_full_permissions_matrix] Embedded query failed, using separate reads: {e}")
+        modules, grants_by_module = _load_permissions_separately()
 
     matrix = []
     for mod in modules:
@@ -687,25 +1051,37 @@ def get_full_permissions_matrix() -> List[Dict[str, Any]]:
             'secondary': ''
         }
         
-        # Filter access for this module
-        mod_access = [a for a in access_list if a['module_id'] == mod['id']]
-        
-        for acc in mod_access:
-            role = acc.get('hierarchy_level', '').lower()
-            uid = acc.get('user_id')
-            email = user_map.get(uid, '')
-            
-            if role == 'super_user':
-                row['super_user'] = email # Last one wins if multiple
-            elif role == 'principal':
-                row['principal'] = email
-            elif role == 'secondary':
-                row['secondary'] = email
+        for acc in grants_by_module.get(mod['id'], []):
+            role = (acc.get('hierarchy_level') or '').lower()
+            if role in ('super_user', 'principal', 'secondary'):
+                row[role] = acc['email'] or '' # Last one wins if multiple
                 
         matrix.append(row)
         
     return matrix
 
+def _load_permissions_separately() -> tuple:
+    """Fallback for get_full_permissions_matrix: three reads, grants grouped by module in one pass."""
+    modules = get_all_modules()
+    users = get_all_authorized_users()
+    user_map = {u['id']: u['email'] for u in users} # ID -> Email
+
+    supabase = get_supabase_client()
+    try:
+        access_response = supabase.table('user_module_access').select('module_id, user_id, hierarchy_level').execute()
+        access_list = access_response.data if access_response.data else []
+    except Exception as e:
+        print(f"[ERROR getting user_module_access]: {e}")
+        access_list = []
+
+    grants_by_module: Dict[Any, List[Dict[str, Any]]] = {}
+    for acc in access_list:
+        grants_by_module.setdefault(acc['module_id'], []).append({
+            'hierarchy_level': acc.get('hierarchy_level'),
+            'email': user_map.get(acc.get('user_id'), '')
+        })
+    return modules, grants_by_module
+
 def update_module_access_role(module_id: int, role: str, email: str) -> tuple[bool, str]:
     """
     Updates who holds a specific role (super_user, principal, secondary) for a module.
@@ -721,6 +1097,7 @@ def update_module_access_role(module_id: int, role: str, email: str) -> tuple[bo
         try:
             # We need to find IDs to delete? Or just delete by filter
             supabase.table('user_module_access').delete().eq('module_id', module_id).eq('hierarchy_level', role).execute()
+            invalidate_access_cache()
             return True, f"Rol {role} removido del módulo."
         except Exception as e:
             return False, f"Error removiendo rol: {e}"
@@ -759,6 +1136,56 @@ def update_module_access_role(module_id: int, role: str, email: str) -> tuple[bo
     except Exception as e:
         print(f"[ERROR updating access]: {e}")
         return False, f"Error DB: {e}"
+    finally:
+        # The delete may have succeeded even if the insert failed
+        invalidate_access_cache()
+
+# --- Access Control Cache ---
+# Every page checks access on every Streamlit rerun: keep the module -> users matrix in memory.
+ACCESS_CACHE_TTL_SECONDS = 60
+
+_access_cache: Dict[str, Any] = {'matrix': None, 'loaded_at': 0.0}
+_access_cache_lock = threading.Lock()
+
+def _load_access_matrix() -> Dict[str, set]:
+    """
+    Returns {module_name: {allowed emails (lowercase)}} for every module
+    (an empty set means the module has no roles assigned).
+    """
+    supabase = get_supabase_client()
+    modules = supabase.table('modules').select('id, name').execute().data or []
+    grants = supabase.table('user_module_access').select('module_id, authorized_users(email)').execute().data or []
+
+    emails_by_module_id: Dict[Any, set] = {}
+    for grant in grants:
+        user = grant.get('authorized_users') or {}
+        email = (user.get('email') or '').lower().strip()
+        emails = emails_by_module_id.setdefault(grant['module_id'], set())
+        if email:
+            emails.add(email)
+        else:
+            emails.add(None)  # Grant whose user can't be resolved: the module is still restricted
+
+    return {mod['name']: emails_by_module_id.get(mod['id'], set()) for mod in modules}
+
+def get_access_matrix(force_refresh: bool = False) -> Dict[str, set]:
+    """Cached module -> allowed emails matrix (ACCESS_CACHE_TTL_SECONDS)."""
+    matrix = _access_cache['matrix']
+    if not force_refresh and matrix is not None and (time.monotonic() - _access_cache['loaded_at']) < ACCESS_CACHE_TTL_SECONDS:
+        return matrix
+
+    with _access_cache_lock:
+        matrix = _access_cache['matrix']
+        if force_refresh or matrix is None or (time.monotonic() - _access_cache['loaded_at']) >= ACCESS_CACHE_TTL_SECONDS:
+            matrix = _load_access_matrix()
+            _access_cache['matrix'] = matrix
+            _access_cache['loaded_at'] = time.monotonic()
+    return matrix
+
+def invalidate_access_cache() -> None:
+    """Forces the next access check to reload the matrix (call after any permissions write)."""
+    with _access_cache_lock:
+        _access_cache['matrix'] = None
 
 def check_user_access(module_name: str, user_email: str) -> bool:
     """
@@ -767,37 +1194,20 @@ def check_user_access(module_name: str, user_email: str) -> bool:
     1. If module has NO roles assigned (empty matrix for this module) -> Allow All (Default Open).
     2. If module HAS roles assigned -> Only allow if user is in [Super, Principal, Secondary].
     """
-    supabase = get_supabase_client()
     try:
-        # Get Module ID
-        mod = get_module_by_name(module_name)
-        if not mod:
+        allowed_emails = get_access_matrix().get(module_name)
+        if allowed_emails is None:
             return True # Module doesn't exist? Fail open or closed? Let's say Open for dev.
         
-        module_id = mod['id']
-        
-        # Get all access entries for this module
-        # We can optimize this by query count, but let's just fetch
-        access_response = supabase.table('user_module_access').select('user_id').eq('module_id', module_id).execute()
-        access_list = access_response.data if access_response.data else []
-        
         # RULE 1: Default Open
-        if not access_list:
+        if not allowed_emails:
             return True
             
         # RULE 2: Strict Check
         if not user_email:
             return False # No email, no access if restricted
             
-        user = get_user_by_email(user_email)
-        if not user:
-            return False
-            
-        user_id = user['id']
-        
-        # Check if user_id is in access_list
-        allowed_ids = [a['user_id'] for a in access_list]
-        return user_id in allowed_ids
+        return user_email.lower().strip() in allowed_emails
         
     except Exception as e:
         print(f"[ERROR check_user_access]: {e}")
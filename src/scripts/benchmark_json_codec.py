@@ -0,0 +1,106 @@
+"""
+Benchmark of encode/decode for recalculate_result_json: stdlib json (what
+save_proposal and the pages used before) vs src/data/json_codec.py.
+
+Payloads:
+  - by default, generated with the same calculation as Originación (LoteOriginacion)
+    and with 'group_id', exactly as save_proposal stores them;
+  - with --desde-bd N, the last N recalculate_result_json rows of 'propuestas'.
+
+Usage:
+    python src/scripts/benchmark_json_codec.py [--facturas 200] [--repeticiones 20] [--desde-bd 500]
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import argparse
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.core.lote_originacion import LoteOriginacion
+from src.data import json_codec
+
+def generar_payloads(n_facturas: int, semilla: int = 7) -> list:
+    rnd = random.Random(semilla)
+    facturas = [
+        {
+            'monto_neto_factura': round(rnd.uniform(1_000, 250_000), 2),
+            'tasa_de_avance': rnd.choice([90.0, 95.0, 98.0]),
+            'moneda_factura': rnd.choice(['PEN', 'PEN', 'USD']),
+            'interes_mensual': rnd.choice([1.25, 1.5, 2.0, 2.35]),
+            'interes_moratorio': 3.0,
+            'plazo_operacion_calculado': rnd.randint(10, 120),
+            'dias_minimos_interes_individual': 15,
+        }
+        for _ in range(n_facturas)
+    ]
+    condiciones = {
+        'comision_estructuracion_pct': 0.5, 'aplicar_comision_afiliacion': True,
+        'comision_minima_pen': 200.0, 'comision_minima_usd': 50.0,
+        'comision_afiliacion_pen': 100.0, 'comision_afiliacion_usd': 30.0,
+    }
+    cambios = LoteOriginacion().recalcular(facturas, condiciones, forzar=True)
+    resultados = []
+    for idx in cambios.recalculadas:
+        resultado = cambios.resultados[idx]['recalculate_result']
+        resultado['group_id'] = idx % 5 + 1  # Como save_proposal
+        resultados.append(resultado)
+    return resultados
+
+def cargar_payloads_bd(limite: int) -> list:
+    from src.data.supabase_client import get_supabase_client
+    response = get_supabase_client().table('propuestas').select('recalculate_result_json') \
+        .not_.is_('recalculate_result_json', 'null').order('proposal_id', desc=True).limit(limite).execute()
+    return [json.loads(r['recalculate_result_json']) for r in response.data or []]
+
+def medir(fn, datos: list, repeticiones: int) -> float:
+    """Mejor tiempo (s) de una pasada sobre todos los datos."""
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        for d in datos:
+            fn(d)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--facturas', type=int, default=200, help="Facturas generadas (sin --desde-bd)")
+    parser.add_argument('--repeticiones', type=int, default=20)
+    parser.add_argument('--desde-bd', type=int, default=0, metavar='N', help="Usar las últimas N propuestas de Supabase")
+    args = parser.parse_args()
+
+    payloads = cargar_payloads_bd(args.desde_bd) if args.desde_bd else generar_payloads(args.facturas)
+    if not payloads:
+        print("No hay payloads para medir.")
+        return
+
+    textos_json = [json.dumps(p) for p in payloads]
+    textos_codec = [json_codec.dumps(p) for p in payloads]
+    assert all(json_codec.loads(t) == json.loads(t) for t in textos_json), "json_codec no decodifica igual que json"
+    bytes_totales = sum(len(t.encode('utf-8')) for t in textos_json)
+    origen = f"Supabase ({len(payloads)} filas)" if args.desde_bd else f"generados ({len(payloads)} facturas)"
+
+    print(f"Payloads: {origen}, {bytes_totales / len(payloads):,.0f} bytes promedio")
+    print(f"Backend de json_codec: {json_codec.BACKEND}\n")
+
+    casos = [
+        ("encode", "json.dumps", json.dumps, payloads),
+        ("encode", "json_codec.dumps", json_codec.dumps, payloads),
+        ("decode", "json.loads", json.loads, textos_json),
+        ("decode", "json_codec.loads", json_codec.loads, textos_codec),
+    ]
+    base = {}
+    print(f"{'':8}{'función':<20}{'payloads/s':>14}{'MB/s':>10}{'vs json':>10}")
+    for operacion, nombre, fn, datos in casos:
+        segundos = medir(fn, datos, args.repeticiones)
+        base.setdefault(operacion, segundos)
+        print(f"{operacion:<8}{nombre:<20}{len(datos) / segundos:>14,.0f}"
+              f"{bytes_totales / segundos / 1e6:>10,.1f}{base[operacion] / segundos:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
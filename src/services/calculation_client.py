@@ -0,0 +1,229 @@
+# src/services/calculation_client.py
+"""
+Client for the factoring calculations (desembolso inicial + búsqueda de tasa de avance).
+
+The Streamlit pages used to POST to the FastAPI backend with bare requests.post
+calls (no connection reuse, no timeout), and the Calculadora did it twice per
+invoice. Pages now go through a CalculationClient, one call per lot:
+
+- InProcessCalculationClient: calls src/core/factoring_calculator directly. Used
+  when the app and the calculator are co-located (the default: same repository).
+- HttpCalculationClient: pooled requests.Session per thread, connect/read timeouts
+  and retries on gateway errors, for a remote backend (CALCULATION_TRANSPORT=http).
+
+Both return exactly the JSON structures of /calcular_desembolso_lote,
+/encontrar_tasa_lote, /simular_lote and /sensibilidad_precios.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.core import factoring_calculator, simulacion_lote, sensibilidad_precios
+
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+HTTP_POOL_SIZE = 10
+HTTP_RETRIES = 2
+
+class CalculationError(Exception):
+    """The calculation failed (bad input, backend error or connection problem)."""
+
+class CalculationClient(ABC):
+    """
+    Common interface. Payload items use the keys of factoring_calculator (mfn, tasa_avance, ...).
+    Subclasses must implement the four abstract calls; calcular_lote is built on them.
+    """
+
+    transport = "base"
+
+    @abstractmethod
+    def calcular_desembolso_lote(self, payload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Desembolso inicial of every invoice (/calcular_desembolso_lote)."""
+
+    @abstractmethod
+    def encontrar_tasa_lote(self, payload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Tasa de avance that yields each invoice's monto objetivo (/encontrar_tasa_lote)."""
+
+    @abstractmethod
+    def simular_lote(self, facturas: List[Dict[str, Any]], grilla: Dict[str, List[float]],
+                     incluir_detalle: bool = False) -> Dict[str, Any]:
+        """Lot simulation over the cartesian grid of scenarios (see core/simulacion_lote)."""
+
+    @abstractmethod
+    def sensibilidad_precios(self, mfn: Any, emisor_ruc: Optional[str] = None,
+                             condiciones: Optional[Dict[str, Any]] = None, moneda: str = "PEN",
+                             **grilla: Any) -> Dict[str, Any]:
+        """
+        Pricing sensitivity grid (estructura x interés mensual x plazo) for an emisor,
+        see core/sensibilidad_precios. `grilla` accepts tasa_avance, interes_mensual,
+        plazos and estructuras, as in the /sensibilidad_precios request.
+        """
+
+    def calcular_lote(self, payload: List[Dict[str, Any]], redondeo_objetivo: float = 10) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Full originación calculation for a lot:
+        1. Desembolso inicial with the given tasa_avance.
+        2. Monto objetivo = abono teórico rounded down to `redondeo_objetivo`.
+        3. Tasa de avance that yields exactly that monto objetivo.
+
+        Returns (resultado_desembolso, resultado_tasa); both contain
+        'resultados_por_factura' aligned with `payload`. Raises CalculationError.
+        """
+        resultado_desembolso = self.calcular_desembolso_lote(payload)
+        _raise_on_error(resultado_desembolso)
+
+        payload_tasa = []
+        for item, inicial in zip(payload, resultado_desembolso["resultados_por_factura"]):
+            abono_teorico = inicial.get('abono_real_teorico', 0)
+            item_tasa = dict(item)
+            item_tasa['monto_objetivo'] = (abono_teorico // redondeo_objetivo) * redondeo_objetivo
+            item_tasa.pop('tasa_avance', None)  # The solver finds it
+            payload_tasa.append(item_tasa)
+
+        resultado_tasa = self.encontrar_tasa_lote(payload_tasa)
+        _raise_on_error(resultado_tasa)
+        return resultado_desembolso, resultado_tasa
+
+def _raise_on_error(result: Dict[str, Any]) -> None:
+    if not isinstance(result, dict):
+        raise CalculationError(f"Respuesta inesperada del cálculo: {result!r}")
+    if result.get("error"):
+        raise CalculationError(result["error"])
+
+class InProcessCalculationClient(CalculationClient):
+    """Direct calls into factoring_calculator (no serialization, no network)."""
+
+    transport = "inprocess"
+
+    def calcular_desembolso_lote(self, payload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            return factoring_calculator.procesar_lote_desembolso_inicial(payload)
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            raise CalculationError(f"Datos inválidos para el cálculo de desembolso: {e}") from e
+
+    def encontrar_tasa_lote(self, payload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            return factoring_calculator.procesar_lote_encontrar_tasa(payload)
+        except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+            raise CalculationError(f"Datos inválidos para la búsqueda de tasa: {e}") from e
+
+    def simular_lote(self, facturas: List[Dict[str, Any]], grilla: Dict[str, List[float]],
+                     incluir_detalle: bool = False) -> Dict[str, Any]:
+        try:
+            return simulacion_lote.simular_lote(facturas, simulacion_lote.expandir_grilla(grilla),
+                                                incluir_detalle=incluir_detalle)
+        except (KeyError, TypeError, ValueError) as e:
+            raise CalculationError(f"Datos inválidos para la simulación: {e}") from e
+
+    def sensibilidad_precios(self, mfn: Any, emisor_ruc: Optional[str] = None,
+                             condiciones: Optional[Dict[str, Any]] = None, moneda: str = "PEN",
+                             **grilla: Any) -> Dict[str, Any]:
+        if condiciones is None:
+            from src.data import supabase_repository as db
+            condiciones = db.get_financial_conditions_cached(emisor_ruc) if emisor_ruc else None
+            if not condiciones:
+                raise CalculationError(f"No hay condiciones financieras para el RUC {emisor_ruc}.")
+        try:
+            return sensibilidad_precios.sensibilidad_desde_condiciones(
+                condiciones, mfn, moneda=moneda, tasa_avance=grilla.get('tasa_avance'),
+                tasas_interes=grilla.get('interes_mensual'), plazos=grilla.get('plazos'),
+                estructuras=grilla.get('estructuras'))
+        except (KeyError, TypeError, ValueError) as e:
+            raise CalculationError(f"Datos inválidos para la sensibilidad de precios: {e}") from e
+
+class HttpCalculationClient(CalculationClient):
+    """Remote backend over HTTP with one pooled keep-alive session per thread."""
+
+    transport = "http"
+
+    def __init__(self, base_url: str, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT, pool_size: int = HTTP_POOL_SIZE,
+                 retries: int = HTTP_RETRIES):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            # Calculations are pure functions: retrying a POST is safe
+            retry = Retry(total=self.retries, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                          allowed_methods=frozenset(['POST']), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+        return session
+
+    def _post(self, path: str, payload: Any) -> Dict[str, Any]:
+        try:
+            response = self._session().post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            raise CalculationError(f"Error de conexión con la API ({path}): {e}") from e
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get('detail', response.text)
+            except ValueError:
+                detail = response.text
+            raise CalculationError(f"La API respondió {response.status_code} en {path}: {detail}")
+        return response.json()
+
+    def calcular_desembolso_lote(self, payload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self._post("/calcular_desembolso_lote", payload)
+
+    def encontrar_tasa_lote(self, payload: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self._post("/encontrar_tasa_lote", payload)
+
+    def simular_lote(self, facturas: List[Dict[str, Any]], grilla: Dict[str, List[float]],
+                     incluir_detalle: bool = False) -> Dict[str, Any]:
+        return self._post("/simular_lote", {'facturas': facturas, 'grilla': grilla, 'incluir_detalle': incluir_detalle})
+
+    def sensibilidad_precios(self, mfn: Any, emisor_ruc: Optional[str] = None,
+                             condiciones: Optional[Dict[str, Any]] = None, moneda: str = "PEN",
+                             **grilla: Any) -> Dict[str, Any]:
+        body = {'mfn': mfn, 'emisor_ruc': emisor_ruc, 'condiciones': condiciones, 'moneda': moneda}
+        body.update({k: v for k, v in grilla.items() if v is not None})
+        return self._post("/sensibilidad_precios", body)
+
+def _backend_setting(env_name: str, secret_key: str) -> Optional[str]:
+    value = os.getenv(env_name)
+    if value:
+        return value
+    try:
+        import streamlit as st
+        return st.secrets["backend_api"][secret_key]
+    except Exception:
+        return None
+
+_clients: Dict[tuple, CalculationClient] = {}
+_clients_lock = threading.Lock()
+
+def get_calculation_client(transport: Optional[str] = None, base_url: Optional[str] = None) -> CalculationClient:
+    """
+    Shared client for the configured transport:
+    CALCULATION_TRANSPORT env var (or st.secrets['backend_api']['transport']),
+    'inprocess' by default; 'http' uses BACKEND_API_URL / st.secrets['backend_api']['url'].
+    """
+    transport = (transport or _backend_setting("CALCULATION_TRANSPORT", "transport") or "inprocess").lower()
+    if transport == "http":
+        base_url = base_url or _backend_setting("BACKEND_API_URL", "url")
+        if not base_url:
+            raise CalculationError("La URL del backend no está configurada. Define BACKEND_API_URL o configúrala en st.secrets.")
+    elif transport != "inprocess":
+        raise CalculationError(f"Transporte de cálculo no soportado: {transport}")
+
+    key = (transport, base_url if transport == "http" else None)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = HttpCalculationClient(base_url) if transport == "http" else InProcessCalculationClient()
+        return client
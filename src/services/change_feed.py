@@ -0,0 +1,162 @@
+# src/services/change_feed.py
+"""
+Push of row changes on 'propuestas' and 'liquidacion_eventos' to open pages.
+
+Without it, Aprobación/Desembolso/Liquidación only see other operators' work after a
+manual reload (a full re-query of 'propuestas'). The feed is a process-wide ring
+buffer of changes with a monotonically increasing sequence number; every Streamlit
+session keeps a cursor and patches its in-memory lists with the changes after it.
+
+Sources (both feed the same buffer; consumers must apply changes idempotently):
+- Supabase Realtime (postgres_changes), in a background thread with its own event
+  loop: sees writes from every process (API, other servers, SQL editor). Needs the
+  tables in the supabase_realtime publication (migrations/enable_realtime_propuestas.sql).
+- Local stand-in: supabase_repository change listeners, i.e. writes made by this
+  process. Always on; it is the only source if Realtime is unavailable or
+  REALTIME_TRANSPORT=local.
+
+If a session's cursor fell out of the buffer, changes_since returns None and the
+session must reload from the database.
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+from src.data import supabase_repository as db
+
+FEED_TABLES = ('propuestas', 'liquidacion_eventos')
+FEED_EVENTS = {'propuestas': ('INSERT', 'UPDATE'), 'liquidacion_eventos': ('INSERT',)}
+FEED_BUFFER_SIZE = 2000
+REALTIME_CHANNEL = 'inandes-cambios'
+REALTIME_HEALTHCHECK_SECONDS = 5
+REALTIME_RECONNECT_SECONDS = 15
+
+class ChangeFeed:
+    """Process-wide buffer of row changes. Thread-safe."""
+
+    def __init__(self, buffer_size: int = FEED_BUFFER_SIZE):
+        self._events = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.transport = 'local'
+        self.realtime_connected = False
+        self.realtime_error: Optional[str] = None
+
+    def publish(self, table: str, event_type: str, record: Dict[str, Any],
+                old_record: Optional[Dict[str, Any]] = None, source: str = 'local') -> int:
+        """Appends a change and returns its sequence number."""
+        with self._lock:
+            self._seq += 1
+            self._events.append({
+                'seq': self._seq,
+                'table': table,
+                'type': event_type,
+                'record': record or {},
+                'old_record': old_record or {},
+                'source': source,
+                'received_at': time.time(),
+            })
+            return self._seq
+
+    def cursor(self) -> int:
+        """Sequence number of the last change (a new session starts here)."""
+        return self._seq
+
+    def changes_since(self, cursor: int, tables: Optional[Iterable[str]] = None) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+        """
+        (changes after `cursor` for `tables`, new cursor). The list is None if some changes
+        after the cursor were already dropped from the buffer: the caller must reload.
+        """
+        tables = set(tables) if tables else None
+        with self._lock:
+            seq = self._seq
+            if cursor >= seq:
+                return [], seq
+            if not self._events or self._events[0]['seq'] > cursor + 1:
+                return None, seq
+            changes = [e for e in self._events if e['seq'] > cursor and (tables is None or e['table'] in tables)]
+        return changes, seq
+
+    def has_changes(self, cursor: int, tables: Optional[Iterable[str]] = None) -> bool:
+        changes, _ = self.changes_since(cursor, tables)
+        return changes is None or bool(changes)
+
+    # --- Sources ---
+    def _on_local_change(self, table: str, event_type: str, record: Dict[str, Any]) -> None:
+        if table in FEED_TABLES:
+            self.publish(table, event_type, record)
+
+    def _on_realtime_change(self, payload: Dict[str, Any]) -> None:
+        # realtime-py versions differ in the payload shape
+        data = payload.get('data', payload) if isinstance(payload, dict) else {}
+        table = data.get('table')
+        event_type = data.get('type') or data.get('eventType')
+        if table not in FEED_TABLES:
+            return
+        self.publish(table, str(event_type).upper(), data.get('record') or data.get('new') or {},
+                     data.get('old_record') or data.get('old') or {}, source='realtime')
+        # Cached queries keyed by data_versions tokens must re-read the token now
+        db.invalidate_data_versions()
+
+    def start_realtime(self) -> None:
+        thread = threading.Thread(target=self._run_realtime, name='supabase-realtime', daemon=True)
+        thread.start()
+
+    def _run_realtime(self) -> None:
+        try:
+            asyncio.run(self._listen_realtime())
+        except Exception as e:
+            self.realtime_error = str(e)
+            print(f"[ERROR en ChangeFeed realtime]: {e}")
+
+    async def _listen_realtime(self) -> None:
+        try:
+            from supabase import acreate_client
+        except ImportError as e:
+            self.realtime_error = f"Cliente async de Supabase no disponible: {e}"
+            print(f"[ChangeFeed] {self.realtime_error}. Solo cambios locales.")
+            return
+        from src.data.supabase_client import get_supabase_credentials
+        url, key = get_supabase_credentials()
+
+        while True:
+            try:
+                client = await acreate_client(url, key)
+                channel = client.channel(REALTIME_CHANNEL)
+                for table, events in FEED_EVENTS.items():
+                    for event in events:
+                        channel.on_postgres_changes(event, schema='public', table=table,
+                                                    callback=self._on_realtime_change)
+                await channel.subscribe()
+                self.transport = 'realtime'
+                self.realtime_connected = True
+                self.realtime_error = None
+                while getattr(client.realtime, 'is_connected', True):
+                    await asyncio.sleep(REALTIME_HEALTHCHECK_SECONDS)
+                raise ConnectionError("Conexión Realtime cerrada")
+            except Exception as e:
+                self.realtime_connected = False
+                self.realtime_error = str(e)
+                print(f"[ERROR en ChangeFeed realtime]: {e}. Reintentando en {REALTIME_RECONNECT_SECONDS}s")
+                await asyncio.sleep(REALTIME_RECONNECT_SECONDS)
+
+_feed: Optional[ChangeFeed] = None
+_feed_lock = threading.Lock()
+
+def get_change_feed() -> ChangeFeed:
+    """
+    Process-wide feed, started on first use: always listens to this process' repository
+    writes, and to Supabase Realtime unless REALTIME_TRANSPORT=local.
+    """
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = ChangeFeed()
+            db.add_change_listener(_feed._on_local_change)
+            if os.getenv("REALTIME_TRANSPORT", "supabase").lower() != "local":
+                _feed.start_realtime()
+        return _feed
@@ -0,0 +1,204 @@
+# src/services/counterparty_search.py
+"""
+In-memory search index over EMISORES.ACEPTANTES (RUC, Razon Social, TIPO).
+
+The Registro search box queries on every keystroke; an ILIKE '%term%' round trip
+to Supabase per keystroke is both a table scan and a network hop. The table is
+small (thousands of rows), so the narrow columns are loaded once and indexed:
+
+- RUCs in a sorted list: prefix lookups by bisection.
+- Name words in a sorted list: prefix lookups for short queries (< 3 chars).
+- Name trigrams (pg_trgm style, per padded word) -> posting sets: fuzzy and
+  substring matches, ranked by the share of query trigrams found.
+
+The index is rebuilt when it is older than INDEX_TTL_SECONDS or when the
+table changed (supabase_repository.get_emisores_version, a data_versions token).
+"""
+
+import bisect
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Any, Optional, Callable
+
+from src.data import supabase_repository as db
+
+INDEX_TTL_SECONDS = 300
+DEFAULT_LIMIT = 10
+MIN_TRIGRAM_SCORE = 0.25
+TRIGRAM_SCORE_WEIGHT = 0.8  # Fuzzy matches rank below any prefix match
+
+def normalize_text(text: Any) -> str:
+    """Uppercase, accents removed, punctuation as spaces: 'Compañía S.A.C.' -> 'COMPANIA S A C'."""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^A-Z0-9]+', ' ', text.upper()).split())
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word padded like pg_trgm ('  word ')."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class CounterpartyIndex:
+    """Trigram + prefix index over the narrow counterparty rows. Thread-safe."""
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]] = db.get_emisores_search_rows,
+                 version_source: Callable[[], Any] = db.get_emisores_version,
+                 ttl_seconds: float = INDEX_TTL_SECONDS):
+        self._loader = loader
+        self._version_source = version_source
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._loaded_at = 0.0
+        self._version = None
+        self._rows: List[Dict[str, Any]] = []
+        self._names: List[str] = []
+        self._rucs: List[tuple] = []       # (ruc, row_idx), sorted
+        self._words: List[tuple] = []      # (word, row_idx), sorted
+        self._postings: Dict[str, set] = {}
+
+    # --- Build ---
+    def build(self, rows: List[Dict[str, Any]]) -> None:
+        names, rucs, words, postings = [], [], [], {}
+        for idx, row in enumerate(rows):
+            name = normalize_text(row.get('Razon Social'))
+            names.append(name)
+            rucs.append((str(row.get('RUC') or ''), idx))
+            for word in set(name.split()):
+                words.append((word, idx))
+            for gram in trigrams(name):
+                postings.setdefault(gram, set()).add(idx)
+        rucs.sort()
+        words.sort()
+        with self._lock:
+            self._rows, self._names, self._rucs, self._words, self._postings = rows, names, rucs, words, postings
+
+    def refresh(self, force: bool = False) -> None:
+        """Reloads the rows if the TTL expired or the table changed in this process."""
+        version = self._version_source()
+        if not force and self._is_fresh(version):
+            return
+        with self._refresh_lock:
+            # Another session may have rebuilt it while we waited
+            if not force and self._is_fresh(version):
+                return
+            try:
+                self.build(self._loader())
+                self._version = version
+                self._loaded_at = time.monotonic()
+            except Exception as e:
+                print(f"[ERROR en CounterpartyIndex.refresh]: {e}")
+                if not self._loaded_at:
+                    raise
+
+    def _is_fresh(self, version: Any) -> bool:
+        return bool(self._loaded_at) and version == self._version \
+            and time.monotonic() - self._loaded_at < self._ttl
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # --- Query ---
+    @staticmethod
+    def _prefix_matches(sorted_pairs: List[tuple], prefix: str, cap: int) -> List[tuple]:
+        start = bisect.bisect_left(sorted_pairs, (prefix, -1))
+        found = []
+        for key, idx in sorted_pairs[start:]:
+            if not key.startswith(prefix) or len(found) >= cap:
+                break
+            found.append((key, idx))
+        return found
+
+    def search(self, term: str, limit: int = DEFAULT_LIMIT, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Ranked matches: [{'RUC', 'Razon Social', 'TIPO', 'score'}], best first.
+        Scores: exact RUC 1.0, name prefix 0.95, RUC prefix 0.9, word prefix 0.85,
+        then 0.8 x the share of query trigrams found (at least 0.7 if the query
+        is a substring of the name; below MIN_TRIGRAM_SCORE is discarded).
+        """
+        query = normalize_text(term)
+        if not query:
+            return []
+        with self._lock:
+            rows, names, rucs, words, postings = self._rows, self._names, self._rucs, self._words, self._postings
+
+        scores: Dict[int, float] = {}
+
+        def offer(idx: int, score: float) -> None:
+            if score > scores.get(idx, 0.0):
+                scores[idx] = score
+
+        compact = query.replace(' ', '')
+        if compact.isdigit():
+            for ruc, idx in self._prefix_matches(rucs, compact, cap=limit * 5):
+                offer(idx, 1.0 if ruc == compact else 0.9)
+
+        query_words = query.split()
+        for word, idx in self._prefix_matches(words, query_words[0], cap=limit * 50):
+            if names[idx].startswith(query):
+                offer(idx, 0.95)
+            elif query in names[idx]:
+                offer(idx, 0.85)
+
+        query_grams = trigrams(query)
+        if len(query) >= 3 and query_grams:
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(postings.get(gram, ()))  # Counting loop runs in C
+            total = len(query_grams)
+            min_count = MIN_TRIGRAM_SCORE / TRIGRAM_SCORE_WEIGHT * total
+            # Only the best-overlapping candidates are scored (common words hit thousands of rows)
+            for idx, count in shared.most_common(limit * 20):
+                if count < min_count:
+                    break
+                if scores.get(idx, 0.0) >= 0.85:
+                    continue
+                score = TRIGRAM_SCORE_WEIGHT * count / total
+                if score < 0.7 and query in names[idx]:
+                    score = 0.7
+                offer(idx, score)
+
+        if tipo:
+            scores = {idx: sc for idx, sc in scores.items() if rows[idx].get('TIPO') == tipo}
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], names[item[0]]))[:limit]
+        return [
+            {
+                'RUC': rows[idx].get('RUC'),
+                'Razon Social': rows[idx].get('Razon Social'),
+                'TIPO': rows[idx].get('TIPO'),
+                'score': round(score, 3),
+            }
+            for idx, score in best
+        ]
+
+_index: Optional[CounterpartyIndex] = None
+_index_lock = threading.Lock()
+
+def get_counterparty_index() -> CounterpartyIndex:
+    """Process-wide index (shared across Streamlit sessions)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = CounterpartyIndex()
+        return _index
+
+def search_counterparties(term: str, limit: int = DEFAULT_LIMIT, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Ranked top-N counterparties for a partial RUC or name. Falls back to the
+    server-side search (supabase_repository.search_emisores_deudores) if the
+    index cannot be loaded.
+    """
+    index = get_counterparty_index()
+    try:
+        index.refresh()
+    except Exception:
+        results = db.search_emisores_deudores(term, limit=limit)
+        return [r for r in results if not tipo or r.get('TIPO') == tipo]
+    return index.search(term, limit=limit, tipo=tipo)
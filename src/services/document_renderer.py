@@ -0,0 +1,154 @@
+# src/services/document_renderer.py
+"""
+Batch PDF rendering service.
+
+WeasyPrint's write_pdf() is CPU bound, so rendering many documents inline on the
+Streamlit script thread uses a single core. This module keeps a pool of worker
+processes (each with its own warmed-up Jinja environment) and renders jobs in
+parallel, yielding the bytes of each document as soon as it is ready.
+
+A job is a dict:
+    {
+        'key': 'voucher_20601234567',                 # Caller-defined identifier
+        'report': 'generar_voucher_transferencia_pdf', # Public function in pdf_generators
+        'kwargs': {...}                                # Arguments for that function
+    }
+"""
+
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+from src.utils import pdf_generators
+
+# Reports that can be rendered by the pool (public generators in pdf_generators)
+RENDERABLE_REPORTS = {
+    'generate_perfil_operacion_pdf',
+    'generate_efide_report_pdf',
+    'generate_lote_report_pdf',
+    'generate_liquidacion_consolidada_pdf',
+    'generar_anexo_liquidacion_pdf',
+    'generate_liquidacion_universal_pdf',
+    'generar_voucher_transferencia_pdf',
+}
+
+DEFAULT_MAX_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", os.cpu_count() or 2))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# --- Worker Side ---
+
+def _init_worker() -> None:
+    """Compiles the templates and loads the static assets once per worker process."""
+    pdf_generators.warm_up_pdf_templates()
+    pdf_generators.preload_pdf_assets()
+
+def _render_job(report: str, kwargs: Dict[str, Any]) -> Optional[bytes]:
+    """Runs one public generator of pdf_generators (in a worker or inline)."""
+    if report not in RENDERABLE_REPORTS:
+        raise ValueError(f"Reporte no soportado: {report}")
+    generator = getattr(pdf_generators, report)
+    return generator(**kwargs)
+
+# --- Pool Management ---
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Returns the shared process pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 'spawn' avoids forking the threaded Streamlit/uvicorn server process
+            _executor = ProcessPoolExecutor(
+                max_workers=DEFAULT_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _executor
+
+def shutdown_document_renderer() -> None:
+    """Stops the worker processes. Registered at interpreter exit."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+atexit.register(shutdown_document_renderer)
+
+def _discard_broken_executor() -> None:
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+# --- Public API ---
+
+def render_documents(jobs: Iterable[Dict[str, Any]], use_pool: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Renders a batch of documents in parallel and yields results as they complete
+    (not in submission order):
+        {'key': ..., 'bytes': b'...' or None, 'error': None or 'message'}
+
+    Single-document batches, or use_pool=False, are rendered inline: for one PDF the
+    inter-process round trip costs more than it saves. If the pool breaks (a worker
+    crashed or processes cannot be spawned), the pending jobs are rendered inline.
+    A job whose future surfaced the crash is still pending and is rendered too.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+
+    if not use_pool or len(jobs) == 1:
+        for job in jobs:
+            yield _render_inline(job)
+        return
+
+    try:
+        executor = _get_executor()
+        future_to_job = {
+            executor.submit(_render_job, job['report'], job.get('kwargs', {})): job
+            for job in jobs
+        }
+    except (BrokenProcessPool, OSError, RuntimeError) as e:
+        print(f"[WARN render_documents] Pool no disponible, renderizando en línea: {e}")
+        _discard_broken_executor()
+        for job in jobs:
+            yield _render_inline(job)
+        return
+
+    pending = dict(future_to_job)
+    try:
+        for future in as_completed(future_to_job):
+            job = pending[future]
+            try:
+                result = {'key': job['key'], 'bytes': future.result(), 'error': None}
+            except BrokenProcessPool:
+                raise  # The job stays in `pending` and is rendered inline below
+            except Exception as e:
+                result = {'key': job['key'], 'bytes': None, 'error': str(e)}
+            del pending[future]
+            yield result
+    except BrokenProcessPool as e:
+        print(f"[WARN render_documents] Pool caído, renderizando {len(pending)} pendientes en línea: {e}")
+        _discard_broken_executor()
+        for job in pending.values():
+            yield _render_inline(job)
+
+def render_documents_to_dict(jobs: Iterable[Dict[str, Any]], use_pool: bool = True) -> Dict[str, Optional[bytes]]:
+    """Convenience wrapper: waits for the whole batch and returns {key: bytes}. Failed jobs map to None."""
+    results = {}
+    for result in render_documents(jobs, use_pool=use_pool):
+        if result['error']:
+            print(f"[ERROR en render_documents_to_dict] {result['key']}: {result['error']}")
+        results[result['key']] = result['bytes']
+    return results
+
+def _render_inline(job: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return {'key': job['key'], 'bytes': _render_job(job['report'], job.get('kwargs', {})), 'error': None}
+    except Exception as e:
+        return {'key': job['key'], 'bytes': None, 'error': str(e)}
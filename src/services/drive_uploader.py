@@ -0,0 +1,359 @@
+# src/services/drive_uploader.py
+"""
+Batch upload manager for Google Drive (REST API v3).
+
+- Small files go in one multipart request; large files (scanned sustentos) use a
+  resumable session uploaded in chunks, so a network hiccup only repeats the
+  current chunk instead of the whole file.
+- 429 / 5xx responses, 403 rateLimitExceeded / userRateLimitExceeded (how Drive
+  usually signals throttling) and connection errors are retried with exponential
+  backoff (with jitter).
+- Concurrency adapts to the API: it grows by one slot after a streak of clean
+  uploads and halves when Drive throttles (AIMD).
+- Every batch reports files, bytes, retries, elapsed time and throughput.
+
+The endpoint is configurable (upload_url), so the manager can be
+exercised against src/utils/fake_drive_server.py without touching Google.
+"""
+
+import json
+import time
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+import requests
+
+DRIVE_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+
+# Resumable chunks must be multiples of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 32 * CHUNK_ALIGNMENT           # 8 MiB
+DEFAULT_RESUMABLE_THRESHOLD = 5 * 1024 * 1024       # Files above 5 MiB use resumable uploads
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# 403 reasons that mean "slow down" (any other 403 is a real permission error)
+THROTTLE_REASONS_403 = {'rateLimitExceeded', 'userRateLimitExceeded'}
+REQUEST_TIMEOUT = (10, 120)                          # (connect, read) seconds
+
+class DriveUploadError(Exception):
+    """Raised when a file cannot be uploaded after all retries."""
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, throttled: bool = False):
+        super().__init__(message)
+        self.throttled = throttled
+
+def _error_reasons(response: requests.Response) -> set:
+    """Reasons of a Drive error body: {"error": {"errors": [{"reason": ...}], "details": [{"reason": ...}]}}."""
+    try:
+        error = response.json().get('error') or {}
+    except ValueError:
+        return set()
+    if not isinstance(error, dict):
+        return set()
+    items = (error.get('errors') or []) + (error.get('details') or [])
+    return {item.get('reason') for item in items if isinstance(item, dict) and item.get('reason')}
+
+class _AdaptiveLimiter:
+    """Concurrency limit with additive increase / multiplicative decrease."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, increase_after: int = 3):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase_after = increase_after
+        self._active = 0
+        self._streak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._streak += 1
+            if self._streak >= self.increase_after and self.limit < self.maximum:
+                self.limit += 1
+                self._streak = 0
+                self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            self._streak = 0
+            self.limit = max(self.minimum, self.limit // 2)
+
+class DriveUploadManager:
+    """
+    Uploads files to Drive folders. token_provider returns a valid OAuth access token
+    (for the service account, see sa_token_provider).
+    """
+
+    def __init__(
+        self,
+        token_provider: Callable[[], str],
+        upload_url: str = DRIVE_UPLOAD_URL,
+        max_workers: int = 8,
+        initial_workers: int = 4,
+        min_workers: int = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        resumable_threshold: int = DEFAULT_RESUMABLE_THRESHOLD,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+    ):
+        if chunk_size % CHUNK_ALIGNMENT:
+            raise ValueError(f"chunk_size debe ser múltiplo de {CHUNK_ALIGNMENT} bytes")
+        self.token_provider = token_provider
+        self.upload_url = upload_url
+        self.max_workers = max_workers
+        self.initial_workers = initial_workers
+        self.min_workers = min_workers
+        self.chunk_size = chunk_size
+        self.resumable_threshold = resumable_threshold
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._retries = 0
+
+    # --- HTTP plumbing ---
+
+    def _session(self) -> requests.Session:
+        # One Session (connection pool) per worker thread
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _headers(self, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        headers = {"Authorization": f"Bearer {self.token_provider()}"}
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def _backoff(self, attempt: int) -> None:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Single HTTP call. Retryable failures raise _RetryableError."""
+        try:
+            response = self._session().request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _RetryableError(f"Error de red: {e}")
+        if response.status_code in RETRYABLE_STATUS:
+            raise _RetryableError(
+                f"HTTP {response.status_code}: {response.text[:200]}",
+                throttled=response.status_code != 408,
+            )
+        if response.status_code == 403 and _error_reasons(response) & THROTTLE_REASONS_403:
+            raise _RetryableError(f"HTTP 403: {response.text[:200]}", throttled=True)
+        return response
+
+    def _with_retries(self, func: Callable[[], Any], limiter: Optional[_AdaptiveLimiter] = None) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except _RetryableError as e:
+                if e.throttled and limiter is not None:
+                    limiter.on_throttle()
+                if attempt >= self.max_retries:
+                    raise DriveUploadError(f"Reintentos agotados: {e}")
+                with self._stats_lock:
+                    self._retries += 1
+                self._backoff(attempt)
+                attempt += 1
+
+    # --- Upload strategies ---
+
+    def _upload_multipart(self, file_bytes: bytes, metadata: Dict[str, Any], mime_type: str,
+                          limiter: Optional[_AdaptiveLimiter]) -> str:
+        boundary = f"inandes_{uuid.uuid4().hex}"
+        body = b"".join([
+            f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n".encode(),
+            json.dumps(metadata).encode(),
+            f"\r\n--{boundary}\r\nContent-Type: {mime_type}\r\n\r\n".encode(),
+            file_bytes,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+
+        def send():
+            response = self._request(
+                "POST",
+                f"{self.upload_url}?uploadType=multipart&supportsAllDrives=true&fields=id",
+                data=body,
+                headers=self._headers({"Content-Type": f"multipart/related; boundary={boundary}"}),
+            )
+            if response.status_code not in (200, 201):
+                raise DriveUploadError(f"HTTP {response.status_code}: {response.text[:200]}", response.status_code)
+            return response.json()['id']
+
+        return self._with_retries(send, limiter)
+
+    def _start_resumable_session(self, total: int, metadata: Dict[str, Any], mime_type: str) -> str:
+        response = self._request(
+            "POST",
+            f"{self.upload_url}?uploadType=resumable&supportsAllDrives=true&fields=id",
+            data=json.dumps(metadata),
+            headers=self._headers({
+                "Content-Type": "application/json; charset=UTF-8",
+                "X-Upload-Content-Type": mime_type,
+                "X-Upload-Content-Length": str(total),
+            }),
+        )
+        if response.status_code != 200 or 'Location' not in response.headers:
+            raise DriveUploadError(f"No se pudo iniciar la sesión resumable: HTTP {response.status_code}", response.status_code)
+        return response.headers['Location']
+
+    @staticmethod
+    def _next_offset(response: requests.Response) -> int:
+        # 308 'Range: bytes=0-N' -> the server has bytes [0, N]
+        received = response.headers.get('Range')
+        return int(received.rsplit('-', 1)[1]) + 1 if received else 0
+
+    def _query_offset(self, session_url: str, total: int) -> Tuple[int, Optional[str]]:
+        """Asks the server how much it has. Returns (offset, file_id if already complete)."""
+        response = self._request("PUT", session_url, headers=self._headers({
+            "Content-Length": "0",
+            "Content-Range": f"bytes */{total}",
+        }))
+        if response.status_code in (200, 201):
+            return total, response.json()['id']
+        if response.status_code == 308:
+            return self._next_offset(response), None
+        raise DriveUploadError(f"Sesión resumable inválida: HTTP {response.status_code}", response.status_code)
+
+    def _upload_resumable(self, file_bytes: bytes, metadata: Dict[str, Any], mime_type: str,
+                          limiter: Optional[_AdaptiveLimiter]) -> str:
+        total = len(file_bytes)
+        session_url = self._with_retries(lambda: self._start_resumable_session(total, metadata, mime_type), limiter)
+        offset = 0
+        attempt = 0
+
+        while True:
+            end = min(offset + self.chunk_size, total)
+            try:
+                response = self._request("PUT", session_url, data=file_bytes[offset:end], headers=self._headers({
+                    "Content-Length": str(end - offset),
+                    "Content-Range": f"bytes {offset}-{end - 1}/{total}",
+                }))
+                if response.status_code in (200, 201):
+                    return response.json()['id']
+                if response.status_code != 308:
+                    raise DriveUploadError(f"HTTP {response.status_code}: {response.text[:200]}", response.status_code)
+                offset = self._next_offset(response)
+                attempt = 0
+            except _RetryableError as e:
+                if e.throttled and limiter is not None:
+                    limiter.on_throttle()
+                if attempt >= self.max_retries:
+                    raise DriveUploadError(f"Reintentos agotados en carga por partes: {e}")
+                with self._stats_lock:
+                    self._retries += 1
+                self._backoff(attempt)
+                attempt += 1
+                # Resume from whatever the server actually stored
+                offset, file_id = self._with_retries(lambda: self._query_offset(session_url, total), limiter)
+                if file_id:
+                    return file_id
+
+    # --- Public API ---
+
+    def upload(self, file_bytes: bytes, file_name: str, folder_id: str,
+               mime_type: str = 'application/pdf', limiter: Optional[_AdaptiveLimiter] = None) -> Tuple[bool, str]:
+        """Uploads one file. Returns (True, file_id) or (False, error message), like upload_file_with_sa."""
+        if not file_bytes:
+            return False, f"Sin contenido: {file_name}"
+        metadata = {'name': file_name, 'parents': [folder_id]}
+        try:
+            if len(file_bytes) > self.resumable_threshold:
+                file_id = self._upload_resumable(file_bytes, metadata, mime_type, limiter)
+            else:
+                file_id = self._upload_multipart(file_bytes, metadata, mime_type, limiter)
+            return True, file_id
+        except Exception as e:
+            return False, str(e)
+
+    def upload_many(self, tasks: Iterable[Tuple[bytes, str]], folder_id: str,
+                    mime_type: str = 'application/pdf') -> Iterator[Dict[str, Any]]:
+        """
+        Uploads (file_bytes, file_name) pairs to folder_id with adaptive concurrency.
+        Yields, as each upload finishes:
+            {'name': ..., 'success': bool, 'result': file_id or error, 'bytes': n}
+        The batch statistics are available afterwards in self.last_stats.
+        """
+        tasks = list(tasks)
+        self._retries = 0
+        self.last_stats = None
+        limiter = _AdaptiveLimiter(self.initial_workers, self.min_workers, self.max_workers)
+        started = time.monotonic()
+        total_bytes = 0
+        ok_count = 0
+
+        def run(file_bytes, file_name):
+            limiter.acquire()
+            try:
+                success, result = self.upload(file_bytes, file_name, folder_id, mime_type, limiter)
+            finally:
+                limiter.release()
+            if success:
+                limiter.on_success()
+            return success, result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_task = {executor.submit(run, b, n): (b, n) for b, n in tasks}
+            for future in as_completed(future_to_task):
+                file_bytes, file_name = future_to_task[future]
+                success, result = future.result()
+                if success:
+                    ok_count += 1
+                    total_bytes += len(file_bytes or b'')
+                yield {'name': file_name, 'success': success, 'result': result, 'bytes': len(file_bytes or b'')}
+
+        elapsed = time.monotonic() - started
+        self.last_stats = {
+            'files': len(tasks),
+            'uploaded': ok_count,
+            'failed': len(tasks) - ok_count,
+            'bytes': total_bytes,
+            'retries': self._retries,
+            'seconds': round(elapsed, 2),
+            'mb_per_second': round((total_bytes / 1_048_576) / elapsed, 2) if elapsed > 0 else 0.0,
+            'final_concurrency': limiter.limit,
+        }
+
+def create_sa_upload_manager(sa_credentials, **kwargs) -> DriveUploadManager:
+    """DriveUploadManager authenticated with the service account (dict from st.secrets or JSON path)."""
+    return DriveUploadManager(sa_token_provider(sa_credentials), **kwargs)
+
+def sa_token_provider(sa_credentials) -> Callable[[], str]:
+    """Token provider backed by the cached service account credentials of google_integration."""
+    from src.utils.google_integration import get_sa_credentials, _ensure_valid_token
+
+    def provider() -> str:
+        return _ensure_valid_token(get_sa_credentials(sa_credentials)).token
+    return provider
+
+def format_upload_stats(stats: Optional[Dict[str, Any]]) -> str:
+    """Human readable one-liner for the UI."""
+    if not stats:
+        return ""
+    return (
+        f"{stats['uploaded']}/{stats['files']} archivos | {stats['bytes'] / 1_048_576:.2f} MB en "
+        f"{stats['seconds']:.1f}s ({stats['mb_per_second']:.2f} MB/s) | reintentos: {stats['retries']}"
+    )
@@ -0,0 +1,172 @@
+# src/services/emisores_import.py
+"""
+Parsing of bulk counterparty files (emisores / aceptantes) for the Registro module.
+
+Accepts CSV (comma, semicolon or tab separated, UTF-8 or Latin-1) and XLSX streams
+and returns one dict per data row, keyed by the EMISORES.ACEPTANTES column names.
+Headers are matched ignoring case, accents and punctuation, so 'Razón Social',
+'razon_social' and 'RAZON SOCIAL' all map to 'Razon Social'. Unknown columns are
+ignored. Validation and persistence live in
+supabase_repository.bulk_upsert_emisores_deudores.
+"""
+
+import io
+import csv
+import re
+import unicodedata
+from typing import List, Dict, Any, Iterable, Optional, BinaryIO, Union
+
+# Columns of EMISORES.ACEPTANTES that can be loaded in bulk
+TEXT_COLUMNS = [
+    'RUC', 'Razon Social', 'TIPO',
+    'Depositario 1', 'DNI Depositario 1',
+    'Garante/Fiador solidario 1', 'DNI Garante/Fiador solidario 1',
+    'Garante/Fiador solidario 2', 'DNI Garante/Fiador solidario 2',
+    'Institucion Financiera',
+    'Numero de Cuenta PEN', 'Numero de CCI PEN',
+    'Numero de Cuenta USD', 'Numero de CCI USD',
+    'Correo Electronico 1', 'Correo Electronico 2',
+]
+NUMERIC_COLUMNS = [
+    'tasa_avance',
+    'interes_mensual_pen', 'interes_moratorio_pen',
+    'interes_mensual_usd', 'interes_moratorio_usd',
+    'comision_estructuracion_pen', 'comision_estructuracion_usd', 'comision_estructuracion_pct',
+    'comision_afiliacion_pen', 'comision_afiliacion_usd',
+]
+INTEGER_COLUMNS = ['dias_minimos_interes']
+
+# Extra header spellings seen in spreadsheets
+_HEADER_ALIASES = {
+    'tipo': 'TIPO',
+    'razonsocial': 'Razon Social',
+    'cuentapen': 'Numero de Cuenta PEN',
+    'ccipen': 'Numero de CCI PEN',
+    'cuentausd': 'Numero de Cuenta USD',
+    'cciusd': 'Numero de CCI USD',
+    'correo1': 'Correo Electronico 1',
+    'correo2': 'Correo Electronico 2',
+    'email1': 'Correo Electronico 1',
+    'email2': 'Correo Electronico 2',
+}
+
+def _header_key(header: Any) -> str:
+    text = unicodedata.normalize('NFKD', str(header or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9]', '', text.lower())
+
+_HEADER_MAP = {_header_key(col): col for col in TEXT_COLUMNS + NUMERIC_COLUMNS + INTEGER_COLUMNS}
+_HEADER_MAP.update(_HEADER_ALIASES)
+
+def map_headers(headers: Iterable[Any]) -> List[Optional[str]]:
+    """Maps raw file headers to table columns (None for unknown columns)."""
+    return [_HEADER_MAP.get(_header_key(h)) for h in headers]
+
+def _clean_text(column: str, value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores RUC/DNI/cuentas as numbers: 20601234567.0 -> '20601234567'
+        value = int(value)
+    text = str(value).strip()
+    if not text:
+        return None
+    if column == 'TIPO':
+        text = text.upper()
+    return text
+
+def _clean_number(value: Any, as_int: bool = False) -> Optional[float]:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, str):
+        text = value.strip().replace('%', '').replace(' ', '')
+        # Decimal comma (es-PE spreadsheets): '1.234,5' -> '1234.5'
+        if ',' in text and text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+        value = text
+    number = float(value)
+    return int(number) if as_int else number
+
+def _build_record(columns: List[Optional[str]], values: Iterable[Any]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {}
+    for column, value in zip(columns, values):
+        if column is None:
+            continue
+        if column in NUMERIC_COLUMNS or column in INTEGER_COLUMNS:
+            try:
+                record[column] = _clean_number(value, as_int=column in INTEGER_COLUMNS)
+            except (ValueError, TypeError):
+                # Kept as-is: the repository reports it as an invalid row
+                record[column] = value
+        else:
+            record[column] = _clean_text(column, value)
+    return record
+
+def _decode(raw: bytes) -> str:
+    for encoding in ('utf-8-sig', 'cp1252', 'latin-1'):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('utf-8', errors='replace')
+
+def _read_csv_rows(raw: bytes) -> Iterable[List[Any]]:
+    text = _decode(raw)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(io.StringIO(text, newline=''), dialect)
+
+def _read_xlsx_rows(raw: bytes) -> Iterable[List[Any]]:
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError("Para importar archivos XLSX se requiere el paquete 'openpyxl'. Use CSV o instálelo.")
+    try:
+        workbook = openpyxl.load_workbook(io.BytesIO(raw), read_only=True, data_only=True)
+    except Exception as e:  # zipfile.BadZipFile, InvalidFileException, KeyError (missing parts)...
+        raise ValueError(f"El archivo no es un libro de Excel válido: {e}") from e
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    except Exception as e:  # Corrupt sheet XML: only found while reading rows
+        raise ValueError(f"No se pudo leer la hoja del archivo Excel: {e}") from e
+    finally:
+        workbook.close()
+
+def parse_emisores_file(source: Union[bytes, BinaryIO], filename: str = '') -> List[Dict[str, Any]]:
+    """
+    Reads a CSV/XLSX stream (bytes or file-like, e.g. st.file_uploader) and returns
+    the data rows as dicts with the table column names. Each dict also carries
+    '_fila': the row number in the file (header = 1), used to report outcomes.
+    Blank rows are skipped.
+
+    Raises ValueError if the format is not supported or the RUC column is missing.
+    """
+    raw = source if isinstance(source, (bytes, bytearray)) else source.read()
+    name = (filename or getattr(source, 'name', '') or '').lower()
+    if name.endswith(('.xlsx', '.xlsm')) or raw[:2] == b'PK':
+        rows = iter(_read_xlsx_rows(bytes(raw)))
+    elif name.endswith(('.csv', '.txt')) or not name:
+        rows = iter(_read_csv_rows(bytes(raw)))
+    else:
+        raise ValueError(f"Formato no soportado: {filename}. Use CSV o XLSX.")
+
+    header = next(rows, None)
+    if not header:
+        return []
+    columns = map_headers(header)
+    if 'RUC' not in columns:
+        raise ValueError("El archivo no tiene una columna 'RUC'.")
+
+    records = []
+    for line_number, values in enumerate(rows, start=2):
+        if not any(v not in (None, '') and str(v).strip() for v in values):
+            continue
+        record = _build_record(columns, values)
+        record['_fila'] = line_number
+        records.append(record)
+    return records
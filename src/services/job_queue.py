@@ -0,0 +1,409 @@
+# src/services/job_queue.py
+"""
+Persistent background job queue (SQLite) for slow side effects of the commit
+steps: Drive uploads and email sends.
+
+The Streamlit page enqueues the jobs and returns immediately; a separate worker
+process (`python -m src.services.job_queue`) executes them. Jobs live in a SQLite
+file, so neither a page rerun nor a restart of the app or the worker loses them:
+a job whose worker died is re-queued by the next worker that starts (leases of
+running jobs are renewed on every heartbeat, so long jobs are never taken twice).
+
+Job kinds:
+    'drive_upload'  payload {'file_name', 'folder_id'}                 blobs {'file': bytes}
+    'email_send'    payload {'to_email', 'subject', 'body', 'cc_email'} blobs {<attachment name>: bytes}
+
+Credentials are never stored in the queue: the worker reads them from
+st.secrets (.streamlit/secrets.toml), like the pages do.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import subprocess
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_DB_PATH = os.getenv("JOB_QUEUE_DB", os.path.join(PROJECT_ROOT, '.jobs', 'jobs.sqlite3'))
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 3
+LEASE_SECONDS = 30               # A 'running' job whose lease was not renewed for this long is orphaned
+WORKER_HEARTBEAT_SECONDS = 5
+WORKER_STALE_SECONDS = 30        # No heartbeat for this long -> the worker is gone
+RETRY_BACKOFF_SECONDS = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    batch_id TEXT,
+    label TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    locked_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id);
+CREATE TABLE IF NOT EXISTS job_blobs (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, name)
+);
+CREATE TABLE IF NOT EXISTS worker_heartbeat (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+def _connect(db_path: str = None) -> sqlite3.Connection:
+    db_path = db_path or DEFAULT_DB_PATH
+    if db_path not in _initialized_paths:
+        with _init_lock:
+            if db_path not in _initialized_paths:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                conn = sqlite3.connect(db_path)
+                conn.execute("PRAGMA journal_mode=WAL")  # Readers (UI polling) don't block the worker
+                conn.executescript(_SCHEMA)
+                conn.close()
+                _initialized_paths.add(db_path)
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+# --- Producer Side (Streamlit pages) ---
+
+def enqueue_job(kind: str, payload: Dict[str, Any], blobs: Optional[Dict[str, bytes]] = None,
+                batch_id: Optional[str] = None, label: Optional[str] = None,
+                max_attempts: int = DEFAULT_MAX_ATTEMPTS, db_path: str = None) -> str:
+    """Persists a job and returns its id."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de trabajo no soportado: {kind}")
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN")
+        conn.execute(
+            "INSERT INTO jobs (id, kind, batch_id, label, payload, status, max_attempts, created_at, updated_at, available_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, batch_id, label, json.dumps(payload), JOB_PENDING, max_attempts, now, now, now)
+        )
+        for position, (name, data) in enumerate((blobs or {}).items()):
+            conn.execute(
+                "INSERT INTO job_blobs (job_id, name, position, data) VALUES (?, ?, ?, ?)",
+                (job_id, name, position, sqlite3.Binary(data or b''))
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return job_id
+
+def enqueue_drive_uploads(upload_tasks: List[tuple], folder_id: str, batch_id: Optional[str] = None,
+                          db_path: str = None) -> str:
+    """Enqueues one 'drive_upload' job per (file_bytes, file_name). Returns the batch id."""
+    batch_id = batch_id or uuid.uuid4().hex
+    for file_bytes, file_name in upload_tasks:
+        enqueue_job('drive_upload', {'file_name': file_name, 'folder_id': folder_id},
+                    blobs={'file': file_bytes}, batch_id=batch_id, label=file_name, db_path=db_path)
+    return batch_id
+
+def enqueue_email(to_email: str, subject: str, body: str, attachments: list = None, cc_email: str = "",
+                  batch_id: Optional[str] = None, db_path: str = None) -> str:
+    """Enqueues an 'email_send' job (attachments: [{'name', 'bytes'}]). Returns the job id."""
+    blobs = {att['name']: att['bytes'] for att in (attachments or [])}
+    return enqueue_job('email_send',
+                       {'to_email': to_email, 'subject': subject, 'body': body, 'cc_email': cc_email},
+                       blobs=blobs, batch_id=batch_id, label=f"Correo: {subject}", db_path=db_path)
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'label': row['label'],
+        'status': row['status'],
+        'attempts': row['attempts'],
+        'result': row['result'],
+        'error': row['error'],
+        'updated_at': row['updated_at'],
+    }
+
+def get_job(job_id: str, db_path: str = None) -> Optional[Dict[str, Any]]:
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT id, kind, label, status, attempts, result, error, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return _row_to_job(row) if row else None
+    finally:
+        conn.close()
+
+def get_batch_status(batch_id: str, db_path: str = None) -> Dict[str, Any]:
+    """
+    Status of every job of a batch, for UI polling:
+        {'total': n, 'pending': .., 'running': .., 'done': .., 'failed': .., 'finished': bool, 'jobs': [...]}
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT id, kind, label, status, attempts, result, error, updated_at FROM jobs "
+            "WHERE batch_id = ? ORDER BY created_at", (batch_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    jobs = [_row_to_job(r) for r in rows]
+    counts = {s: 0 for s in (JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED)}
+    for job in jobs:
+        counts[job['status']] += 1
+    return {
+        'total': len(jobs),
+        **counts,
+        'finished': counts[JOB_PENDING] == 0 and counts[JOB_RUNNING] == 0,
+        'jobs': jobs,
+    }
+
+def retry_failed_jobs(batch_id: str, db_path: str = None) -> int:
+    """Puts the failed jobs of a batch back in the queue. Returns how many."""
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, attempts = 0, error = NULL, available_at = ?, updated_at = ? "
+            "WHERE batch_id = ? AND status = ?",
+            (JOB_PENDING, now, now, batch_id, JOB_FAILED)
+        )
+        return cur.rowcount
+    finally:
+        conn.close()
+
+# --- Worker Lifecycle ---
+
+def is_worker_alive(db_path: str = None) -> bool:
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT heartbeat_at FROM worker_heartbeat WHERE id = 1").fetchone()
+        return row is not None and (time.time() - row['heartbeat_at']) < WORKER_STALE_SECONDS
+    finally:
+        conn.close()
+
+def ensure_worker_running(db_path: str = None) -> bool:
+    """
+    Starts a detached worker process if none has reported a heartbeat recently.
+    The heartbeat row is claimed inside a write transaction, so concurrent sessions
+    don't spawn duplicate workers. Returns True if a worker was started.
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT heartbeat_at FROM worker_heartbeat WHERE id = 1").fetchone()
+        if row is not None and (time.time() - row['heartbeat_at']) < WORKER_STALE_SECONDS:
+            conn.execute("COMMIT")
+            return False
+        # Claim: the new worker has WORKER_STALE_SECONDS to send its first heartbeat
+        conn.execute(
+            "INSERT INTO worker_heartbeat (id, pid, heartbeat_at) VALUES (1, NULL, ?) "
+            "ON CONFLICT(id) DO UPDATE SET pid = NULL, heartbeat_at = excluded.heartbeat_at",
+            (time.time(),)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    env = dict(os.environ, JOB_QUEUE_DB=db_path or DEFAULT_DB_PATH)
+    subprocess.Popen(
+        [sys.executable, "-m", "src.services.job_queue"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        start_new_session=True,  # Survives Streamlit reruns and session teardown
+    )
+    return True
+
+def _heartbeat(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "INSERT INTO worker_heartbeat (id, pid, heartbeat_at) VALUES (1, ?, ?) "
+        "ON CONFLICT(id) DO UPDATE SET pid = excluded.pid, heartbeat_at = excluded.heartbeat_at",
+        (os.getpid(), time.time())
+    )
+
+def _renew_leases(conn: sqlite3.Connection, job_ids: List[str]) -> None:
+    """Keeps the jobs this worker is running leased, however long they take."""
+    if job_ids:
+        conn.execute(
+            f"UPDATE jobs SET locked_at = ? WHERE status = ? AND id IN ({','.join('?' * len(job_ids))})",
+            (time.time(), JOB_RUNNING, *job_ids)
+        )
+
+def _heartbeat_loop(db_path: Optional[str], stop: threading.Event, in_flight: set) -> None:
+    conn = _connect(db_path)
+    try:
+        while not stop.is_set():
+            try:
+                _heartbeat(conn)
+                # Orphans are only requeued when a worker starts (run_worker): requeuing
+                # here would also catch this worker's own long uploads and run them twice
+                _renew_leases(conn, list(in_flight))
+            except sqlite3.Error as e:
+                print(f"[WARN job_queue heartbeat] {e}")
+            stop.wait(WORKER_HEARTBEAT_SECONDS)
+    finally:
+        conn.close()
+
+def _requeue_orphans(conn: sqlite3.Connection) -> int:
+    now = time.time()
+    cur = conn.execute(
+        "UPDATE jobs SET status = ?, locked_at = NULL, updated_at = ? WHERE status = ? AND locked_at < ?",
+        (JOB_PENDING, now, JOB_RUNNING, now - LEASE_SECONDS)
+    )
+    return cur.rowcount
+
+def _claim_next(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, kind, payload, attempts, max_attempts FROM jobs "
+            "WHERE status = ? AND available_at <= ? ORDER BY created_at LIMIT 1",
+            (JOB_PENDING, now)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_at = ?, updated_at = ? WHERE id = ?",
+            (JOB_RUNNING, now, now, row['id'])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    blobs = conn.execute(
+        "SELECT name, data FROM job_blobs WHERE job_id = ? ORDER BY position", (row['id'],)
+    ).fetchall()
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'payload': json.loads(row['payload']),
+        'blobs': {b['name']: bytes(b['data']) for b in blobs},
+        'attempts': row['attempts'] + 1,
+        'max_attempts': row['max_attempts'],
+    }
+
+def _finish(conn: sqlite3.Connection, job: Dict[str, Any], success: bool, message: str) -> None:
+    now = time.time()
+    if success:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, locked_at = NULL, updated_at = ? WHERE id = ?",
+            (JOB_DONE, message, now, job['id'])
+        )
+        # The file bytes are no longer needed once the side effect happened
+        conn.execute("DELETE FROM job_blobs WHERE job_id = ?", (job['id'],))
+    elif job['attempts'] < job['max_attempts']:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, locked_at = NULL, available_at = ?, updated_at = ? WHERE id = ?",
+            (JOB_PENDING, message, now + RETRY_BACKOFF_SECONDS * job['attempts'], now, job['id'])
+        )
+    else:
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, locked_at = NULL, updated_at = ? WHERE id = ?",
+            (JOB_FAILED, message, now, job['id'])
+        )
+
+# --- Job Handlers (worker side) ---
+
+def _handle_drive_upload(payload: Dict[str, Any], blobs: Dict[str, bytes]) -> tuple:
+    import streamlit as st
+    from src.services.drive_uploader import create_sa_upload_manager
+
+    uploader = create_sa_upload_manager(dict(st.secrets["google_drive"]))
+    return uploader.upload(blobs.get('file', b''), payload['file_name'], payload['folder_id'])
+
+def _handle_email_send(payload: Dict[str, Any], blobs: Dict[str, bytes]) -> tuple:
+    from src.utils.email_integration import send_email_with_attachments
+
+    attachments = [{'name': name, 'bytes': data} for name, data in blobs.items()]
+    return send_email_with_attachments(
+        to_email=payload['to_email'],
+        subject=payload['subject'],
+        body=payload['body'],
+        attachments=attachments,
+        cc_email=payload.get('cc_email', "")
+    )
+
+# Each handler returns (success, message), like the synchronous helpers it wraps
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any], Dict[str, bytes]], tuple]] = {
+    'drive_upload': _handle_drive_upload,
+    'email_send': _handle_email_send,
+}
+
+def run_worker(poll_interval: float = 1.0, stop_event: Optional[threading.Event] = None,
+               db_path: str = None, exit_when_idle: bool = False) -> None:
+    """
+    Processes jobs until stop_event is set (or, with exit_when_idle, until the queue is empty).
+    """
+    conn = _connect(db_path)
+    # Heartbeat on its own thread: a long upload must not make the worker look dead
+    heartbeat_stop = threading.Event()
+    in_flight = set()
+    heartbeat_thread = threading.Thread(
+        target=_heartbeat_loop, args=(db_path, heartbeat_stop, in_flight), daemon=True, name="job_queue_heartbeat"
+    )
+    heartbeat_thread.start()
+    try:
+        requeued = _requeue_orphans(conn)
+        if requeued:
+            print(f"[job_queue] {requeued} trabajos huérfanos re-encolados")
+
+        while stop_event is None or not stop_event.is_set():
+            job = _claim_next(conn)
+            if job is None:
+                if exit_when_idle:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            in_flight.add(job['id'])
+            try:
+                success, message = JOB_HANDLERS[job['kind']](job['payload'], job['blobs'])
+            except Exception as e:
+                success, message = False, str(e)
+            _finish(conn, job, success, str(message))
+            in_flight.discard(job['id'])
+    finally:
+        heartbeat_stop.set()
+        conn.close()
+
+if __name__ == "__main__":
+    print(f"[job_queue] Worker iniciado (pid {os.getpid()}) - DB: {DEFAULT_DB_PATH}")
+    run_worker()
@@ -57,6 +57,71 @@ def text_to_float(text_number: str) -> float:
     total_sum += current_number
     return float(total_sum + fractional_part)
 
+# Header of the SUNAT credit schedule block and the legend that closes the page body.
+CREDIT_INFO_PATTERN = r'Informaci[oó]n del cr[eé]dito'
+CREDIT_FOOTER_PATTERN = r'Esta es una representaci[oó]n impresa'
+# One schedule entry: quota number, due date, amount. SUNAT prints up to three per row.
+QUOTA_ENTRY_PATTERN = re.compile(r'\b(\d{1,3})\s+(\d{2}[-/]\d{2}[-/]\d{4})\s+([\d,]+\.\d{2})\b')
+
+def _group_words_into_lines(words: list, y_tolerance: float = 3) -> list:
+    """
+    Groups pdfplumber word boxes into visual lines (by their top coordinate),
+    returning each line as a string with words ordered left to right.
+    """
+    lines = []
+    for word in sorted(words, key=lambda w: (w['top'], w['x0'])):
+        if lines and abs(word['top'] - lines[-1]['top']) <= y_tolerance:
+            lines[-1]['words'].append(word)
+        else:
+            lines.append({'top': word['top'], 'words': [word]})
+    return [" ".join(w['text'] for w in sorted(line['words'], key=lambda w: w['x0'])) for line in lines]
+
+def _extract_credit_schedule(pdf) -> list:
+    """
+    Extracts every installment (cuota) listed under "Información del crédito".
+    Only the region between the header and the SUNAT footer legend (or the page
+    bottom) is read, using word boxes so the three-column layout of the schedule
+    is parsed row by row.
+    """
+    cuotas = {}
+    for page in pdf.pages:
+        headers = page.search(CREDIT_INFO_PATTERN, regex=True, case=False)
+        if not headers:
+            continue
+
+        region_top = headers[0]['top']
+        region_bottom = page.height
+        for footer in page.search(CREDIT_FOOTER_PATTERN, regex=True, case=False):
+            if footer['top'] > region_top:
+                region_bottom = footer['top']
+                break
+
+        region = page.crop((0, region_top, page.width, region_bottom))
+        for line in _group_words_into_lines(region.extract_words()):
+            for numero, fecha, monto in QUOTA_ENTRY_PATTERN.findall(line):
+                cuota_num = int(numero)
+                if cuota_num in cuotas:
+                    continue
+                cuotas[cuota_num] = {
+                    'numero': cuota_num,
+                    'fecha_vencimiento': fecha.replace('/', '-'),
+                    'monto': float(monto.replace(',', '')),
+                }
+
+    return [cuotas[n] for n in sorted(cuotas)]
+
+def extract_installments_from_pdf(pdf_path: str) -> list:
+    """
+    Returns the full installment schedule of an invoice as a list of dicts:
+    [{'numero': 1, 'fecha_vencimiento': 'DD-MM-YYYY', 'monto': 1318.80}, ...]
+    """
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            return _extract_credit_schedule(pdf)
+    except Exception as e:
+        print(f"[ERROR en extract_installments_from_pdf]: {e}")
+        return []
+
 def extract_fields_from_pdf(pdf_path: str) -> dict:
     """
     Extracts key fields from a PDF invoice based on updated user requirements.
@@ -64,11 +129,17 @@ def extract_fields_from_pdf(pdf_path: str) -> dict:
     """
     extracted_data = {}
     full_text = ""
+    cuotas = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
             for page in pdf.pages:
                 full_text += page.extract_text() + "\n"
-            
+            try:
+                cuotas = _extract_credit_schedule(pdf)
+            except Exception as e:
+                print(f"[ERROR extrayendo cuotas]: {e}")
+                cuotas = []
+
         normalized_text = re.sub(r'\s+', ' ', full_text).strip()
 
         # --- RUC Data ---
@@ -103,12 +174,15 @@ def extract_fields_from_pdf(pdf_path: str) -> dict:
                 extracted_data['fecha_emision'] = date_str
 
         # --- Due Date (Vencimiento) ---
-        # Strategy 1: Look for "Información del crédito" table (common in electronic invoices)
+        # Strategy 1: Installment schedule read from the "Información del crédito" region
+        extracted_data['cuotas'] = cuotas
+        due_date_found = cuotas[0]['fecha_vencimiento'] if cuotas else None
+
+        # Strategy 1b: Same table, but from the flattened text
         # Pattern: quota number, date, amount. e.g. "1 24/04/2025 1,318.80"
-        credit_info_match = re.search(r'Informaci[oó]n del cr[eé]dito', normalized_text, re.IGNORECASE)
-        due_date_found = None
-        
-        if credit_info_match:
+        credit_info_match = re.search(CREDIT_INFO_PATTERN, normalized_text, re.IGNORECASE)
+
+        if not due_date_found and credit_info_match:
             # Search in the text following the header
             post_header_text = normalized_text[credit_info_match.end():]
             # Regex for: boundary, digits (quota), spaces, date (DD/MM/YYYY or DD-MM-YYYY), spaces
@@ -169,5 +243,7 @@ def extract_fields_from_pdf(pdf_path: str) -> dict:
     for field in required_fields:
         if field not in extracted_data:
             extracted_data[field] = None
+    if 'cuotas' not in extracted_data:
+        extracted_data['cuotas'] = []
             
     return extracted_data
\ No newline at end of file
@@ -0,0 +1,136 @@
+# src/services/spill_store.py
+"""
+Content-addressed spill store for uploaded and generated files.
+
+Originación used to keep every uploaded PDF (UploadedFile objects plus a copy of
+their bytes) and every generated report in st.session_state, i.e. in the RAM of
+the Streamlit server, once per operator session. The store keeps each distinct
+content exactly once on disk (tmpfs when available) under its SHA-256; session
+state only holds the hex digest.
+
+- put(data) -> digest: idempotent; the same file uploaded by two sessions is stored once.
+- get(digest) -> bytes | None, path(digest) -> str | None: every read refreshes the
+  file's mtime, so content in use is never collected.
+- Entries not read or written for SPILL_TTL_SECONDS are deleted (checked at most
+  every SPILL_GC_INTERVAL_SECONDS, on put). Sessions do not release their files
+  explicitly: a closed browser tab never tells the server.
+
+Location: SPILL_STORE_DIR, or /dev/shm/inandes_spill (tmpfs) if it exists, or the
+system temp directory. Files are written to a temp name and renamed, so readers in
+other processes never see a partial file.
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Optional
+
+SPILL_TTL_SECONDS = int(os.getenv("SPILL_TTL_SECONDS", 12 * 3600))
+SPILL_GC_INTERVAL_SECONDS = 600
+
+def _default_dir() -> str:
+    base = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else tempfile.gettempdir()
+    return os.path.join(base, 'inandes_spill')
+
+class SpillStore:
+    """Blobs on disk addressed by their SHA-256. Thread-safe; shared by every session."""
+
+    def __init__(self, directory: Optional[str] = None, ttl_seconds: int = SPILL_TTL_SECONDS):
+        self.directory = directory or os.getenv("SPILL_STORE_DIR") or _default_dir()
+        self.ttl_seconds = ttl_seconds
+        self._last_gc = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        # Two-level fan-out keeps directories small with thousands of files
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Stores `data` (if not already stored) and returns its SHA-256 hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            self._touch(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        self._maybe_collect()
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Content for `digest`, or None if it was never stored or already expired."""
+        path = self.path(digest)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def path(self, digest: str) -> Optional[str]:
+        """Path of the stored file (e.g. for parsers that need a file), or None."""
+        if not digest:
+            return None
+        path = self._path(digest)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def __contains__(self, digest: str) -> bool:
+        return bool(digest) and os.path.exists(self._path(digest))
+
+    def _touch(self, path: str) -> None:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _maybe_collect(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now - self._last_gc < SPILL_GC_INTERVAL_SECONDS:
+                return
+            self._last_gc = now
+        self.collect(now - self.ttl_seconds)
+
+    def collect(self, older_than: Optional[float] = None) -> int:
+        """Deletes entries not used since `older_than` (epoch). Returns how many were deleted."""
+        older_than = older_than if older_than is not None else time.time() - self.ttl_seconds
+        deleted = 0
+        try:
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        if os.path.getmtime(path) < older_than:
+                            os.remove(path)
+                            deleted += 1
+                    except OSError:
+                        pass  # Deleted or replaced by another process meanwhile
+        except Exception as e:
+            print(f"[ERROR en SpillStore.collect]: {e}")
+        return deleted
+
+_store: Optional[SpillStore] = None
+_store_lock = threading.Lock()
+
+def get_spill_store() -> SpillStore:
+    """Process-wide spill store (see module docstring for its location)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SpillStore()
+        return _store
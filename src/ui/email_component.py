@@ -1,7 +1,9 @@
 import streamlit as st
 from src.utils.email_integration import send_email_with_attachments
+from src.services.job_queue import enqueue_email, ensure_worker_running
+from src.ui.job_status_component import render_job_status
 
-def render_email_sender(key_suffix: str, documents: list, default_email: str = "", default_subject: str = "", default_body: str = ""):
+def render_email_sender(key_suffix: str, documents: list, default_email: str = "", default_subject: str = "", default_body: str = "", background: bool = False):
     """
     Renderiza el componente de envío de correos.
     
@@ -11,6 +13,7 @@ def render_email_sender(key_suffix: str, documents: list, default_email: str = "
         default_email (str): Email por defecto.
         default_subject (str): Asunto por defecto.
         default_body (str): Cuerpo por defecto.
+        background (bool): Si es True, el correo se encola (job_queue) y se envía en segundo plano.
     """
     st.markdown("### Notificación por Correo")
     
@@ -50,6 +53,14 @@ def render_email_sender(key_suffix: str, documents: list, default_email: str = "
         
         body = st.text_area("Mensaje", value=default_body, height=200, key=f"body_{key_suffix}")
         
+        # Estado del último correo encolado (modo background)
+        if background and st.session_state.get(f"email_job_{key_suffix}"):
+            render_job_status(st.session_state[f"email_job_{key_suffix}"], key_suffix=f"email_{key_suffix}")
+            worker_error = st.session_state.pop(f"email_worker_warning_{key_suffix}", None)
+            if worker_error:
+                st.warning(f"⚠️ El correo quedó encolado, pero no se pudo iniciar el proceso de envío ({worker_error}). "
+                           "Se enviará cuando arranque; no es necesario reenviarlo.")
+        
         # 3. Botón de Envío
         if st.button("📤 Enviar Correo", key=f"btn_send_{key_suffix}", type="primary", use_container_width=True):
             # Validaciones básicas de integridad
@@ -61,6 +72,26 @@ def render_email_sender(key_suffix: str, documents: list, default_email: str = "
             if has_documents and not selected_docs:
                 st.warning("⚠️ No has seleccionado ningún archivo adjunto (puedes enviar igual si lo deseas).")
             
+            if background:
+                try:
+                    st.session_state[f"email_job_{key_suffix}"] = enqueue_email(
+                        to_email=to_email.strip(),
+                        subject=subject,
+                        body=body,
+                        attachments=selected_docs,
+                        cc_email=cc_email.strip()
+                    )
+                except Exception as e:
+                    st.error(f"❌ No se pudo encolar el correo: {e}")
+                    return
+                try:
+                    ensure_worker_running()
+                except Exception as e:
+                    # El correo ya está en la cola: no reenviarlo, se enviará cuando arranque el worker
+                    print(f"[ERROR en render_email_sender]: {e}")
+                    st.session_state[f"email_worker_warning_{key_suffix}"] = str(e)
+                st.rerun()  # Mostrar el estado del correo encolado
+
             with st.spinner("Conectando con servidor SMTP y enviando..."):
                 ok, msg = send_email_with_attachments(
                     to_email=to_email.strip(), # Clean spaces
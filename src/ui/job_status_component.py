@@ -0,0 +1,84 @@
+import streamlit as st
+from src.services.job_queue import (
+    get_batch_status, get_job, retry_failed_jobs, ensure_worker_running, is_worker_alive,
+    JOB_DONE, JOB_FAILED
+)
+
+STATUS_LABELS = {
+    'pending': "⏳ En cola",
+    'running': "🔄 Procesando",
+    'done': "✅ Completado",
+    'failed': "❌ Falló",
+}
+
+def _keep_worker_alive(finished: bool):
+    # Si el worker murió (reinicio del servidor) con trabajos pendientes, levantar otro
+    if not finished and not is_worker_alive():
+        try:
+            ensure_worker_running()
+        except Exception as e:
+            st.warning(f"No se pudo iniciar el procesador en segundo plano: {e}")
+
+def render_job_batch_status(batch_id: str, key_suffix: str, title: str = "Carga de Archivos a Drive"):
+    """
+    Renderiza el avance de un lote de trabajos en segundo plano (job_queue).
+
+    Args:
+        batch_id (str): Lote retornado por enqueue_drive_uploads.
+        key_suffix (str): Sufijo único para las keys de los widgets.
+        title (str): Título de la sección.
+    Returns:
+        dict: Estado del lote (ver get_batch_status).
+    """
+    status = get_batch_status(batch_id)
+    if status['total'] == 0:
+        return status
+
+    st.markdown(f"**{title}**")
+    processed = status[JOB_DONE] + status[JOB_FAILED]
+    st.progress(processed / status['total'], text=f"{processed}/{status['total']} procesados")
+    _keep_worker_alive(status['finished'])
+
+    if not status['finished']:
+        c1, c2 = st.columns([3, 1])
+        c1.caption("Los archivos se suben en segundo plano: puedes seguir trabajando o recargar la página sin perderlos.")
+        if c2.button("🔄 Actualizar estado", key=f"refresh_jobs_{key_suffix}", use_container_width=True):
+            st.rerun()
+    elif status[JOB_FAILED] == 0:
+        st.success(f"✅ {status[JOB_DONE]} archivos subidos a Drive.")
+
+    with st.expander("Detalle de la carga", expanded=status[JOB_FAILED] > 0):
+        for job in status['jobs']:
+            line = f"{STATUS_LABELS.get(job['status'], job['status'])} — {job['label']}"
+            if job['status'] == JOB_FAILED:
+                st.error(f"{line}: {job['error']}")
+            elif job['error'] and job['status'] != JOB_DONE:
+                st.write(f"{line} (reintento {job['attempts']}: {job['error']})")
+            else:
+                st.write(line)
+
+    if status['finished'] and status[JOB_FAILED]:
+        if st.button("🔁 Reintentar fallidos", key=f"retry_jobs_{key_suffix}"):
+            retry_failed_jobs(batch_id)
+            ensure_worker_running()
+            st.rerun()
+
+    return status
+
+def render_job_status(job_id: str, key_suffix: str):
+    """Estado de un único trabajo (p.ej. un correo encolado)."""
+    job = get_job(job_id)
+    if not job:
+        return None
+
+    _keep_worker_alive(job['status'] not in (JOB_DONE, JOB_FAILED))
+    if job['status'] == JOB_DONE:
+        st.success(f"✅ {job['label']}: {job['result']}")
+    elif job['status'] == JOB_FAILED:
+        st.error(f"❌ {job['label']}: {job['error']}")
+    else:
+        c1, c2 = st.columns([3, 1])
+        c1.info(f"{STATUS_LABELS.get(job['status'], job['status'])} — {job['label']}")
+        if c2.button("🔄 Actualizar", key=f"refresh_job_{key_suffix}", use_container_width=True):
+            st.rerun()
+    return job
@@ -0,0 +1,48 @@
+import streamlit as st
+
+from src.services.change_feed import get_change_feed
+
+LIVE_POLL_SECONDS = 3
+
+def reiniciar_cursor(key: str):
+    """Posiciona el cursor de la sesión en el último cambio (llamar antes de cargar datos de la BD)."""
+    st.session_state[f"feed_cursor_{key}"] = get_change_feed().cursor()
+
+def consumir_cambios(key: str, tablas: tuple):
+    """
+    Cambios de `tablas` recibidos desde la última llamada de esta sesión (change_feed).
+
+    Returns:
+        list: Cambios ({'seq', 'table', 'type', 'record', 'old_record', ...}), en orden.
+        None: Se perdieron cambios (buffer desbordado): hay que recargar desde la BD.
+    """
+    cursor_key = f"feed_cursor_{key}"
+    feed = get_change_feed()
+    if cursor_key not in st.session_state:
+        st.session_state[cursor_key] = feed.cursor()
+        return []
+    cambios, st.session_state[cursor_key] = feed.changes_since(st.session_state[cursor_key], tablas)
+    return cambios
+
+def _vigilar_cambios(key: str, tablas: tuple):
+    # Solo consulta el buffer en memoria: sin cambios no hay rerun ni consultas a la BD
+    cursor = st.session_state.get(f"feed_cursor_{key}")
+    if cursor is not None and get_change_feed().has_changes(cursor, tablas):
+        st.rerun()
+
+_fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+if _fragment is not None:
+    _vigilar_cambios = _fragment(run_every=LIVE_POLL_SECONDS)(_vigilar_cambios)
+
+def render_vigilancia_cambios(key: str, tablas: tuple = ('propuestas',)):
+    """
+    Relanza la página cuando llegan cambios de `tablas` (cada LIVE_POLL_SECONDS, sin tocar la BD)
+    y muestra el estado de la conexión. Sin st.fragment (Streamlit antiguo) solo muestra el estado.
+    """
+    feed = get_change_feed()
+    if feed.realtime_connected:
+        st.caption("🟢 Actualización en vivo (Supabase Realtime)")
+    else:
+        st.caption("🟡 Actualización en vivo: solo cambios de este servidor")
+    if _fragment is not None:
+        _vigilar_cambios(key, tablas)
@@ -0,0 +1,211 @@
+import streamlit as st
+import pandas as pd
+
+from src.data import supabase_repository as db
+from src.ui.live_updates import consumir_cambios, reiniciar_cursor
+
+LOTES_POR_PAGINA = 10
+QUEUE_CACHE_TTL_SECONDS = 300
+
+# Las colas se cachean por (estado, lotes, token de cambios): cualquier escritura en
+# 'propuestas' cambia el token y la siguiente recarga vuelve a consultar.
+@st.cache_data(ttl=QUEUE_CACHE_TTL_SECONDS, show_spinner=False)
+def cargar_lotes_cola(estado: str, version: int):
+    return db.get_queue_lotes(estado)
+
+@st.cache_data(ttl=QUEUE_CACHE_TTL_SECONDS, show_spinner=False)
+def cargar_facturas_cola(estado: str, lote_ids: tuple, version: int):
+    return db.get_queue_proposals(estado, list(lote_ids))
+
+def invalidar_colas():
+    """Descarta las colas cacheadas y las copias de esta sesión (p. ej. tras escrituras de la API)."""
+    cargar_lotes_cola.clear()
+    cargar_facturas_cola.clear()
+    for key in [k for k in st.session_state if str(k).startswith('cola_')]:
+        del st.session_state[key]
+
+class ColaSesion:
+    """
+    Copia de una cola en la sesión: índice de lotes y filas de los lotes ya mostrados.
+    Se parcha con los cambios de 'propuestas' del change feed en lugar de volver a consultar.
+    """
+
+    def __init__(self, estado: str):
+        self.estado = estado
+        self.lotes = []   # [{'identificador_lote', 'emisor_nombre', 'n_facturas', 'fecha'}]
+        self.filas = {}   # lote -> [filas de la cola] (solo lotes ya mostrados)
+        self._contados = set()  # (proposal_id, entra/sale) ya contados en lotes no mostrados
+
+    def cargar(self):
+        self.lotes = [dict(l) for l in cargar_lotes_cola(self.estado, db.get_data_version('propuestas'))]
+        self.filas = {}
+        self._contados = set()
+
+    def filas_de(self, lote_ids: list) -> list:
+        """Filas de los lotes pedidos; consulta solo los que aún no se cargaron."""
+        faltantes = [l for l in lote_ids if l not in self.filas]
+        if faltantes:
+            for l in faltantes:
+                self.filas[l] = []
+            for fila in cargar_facturas_cola(self.estado, tuple(faltantes), db.get_data_version('propuestas')):
+                self.filas.setdefault(fila['identificador_lote'], []).append(fila)
+            for l in faltantes:
+                # Al cargarse, el conteo del lote pasa a ser exacto
+                lote = self._lote(l)
+                if lote:
+                    lote['n_facturas'] = len(self.filas[l])
+        return [f for l in lote_ids for f in self.filas.get(l, [])]
+
+    def _ubicar(self, pid: str):
+        for lote_id, filas in self.filas.items():
+            for i, fila in enumerate(filas):
+                if fila['proposal_id'] == pid:
+                    return lote_id, i
+        return None, None
+
+    def _lote(self, lote_id: str):
+        return next((l for l in self.lotes if l['identificador_lote'] == lote_id), None)
+
+    def _contar(self, lote: dict, pid: str, delta: int):
+        """Ajusta el conteo de un lote no mostrado una sola vez por factura y sentido."""
+        if (pid, delta) not in self._contados:
+            self._contados.add((pid, delta))
+            lote['n_facturas'] += delta
+
+    def aplicar(self, cambios: list):
+        """
+        Aplica cambios de 'propuestas' (idempotente: un mismo cambio puede llegar por
+        Realtime y por el aviso local). Devuelve (ids que salieron de la cola, requiere_recarga).
+        """
+        salieron = set()
+        for cambio in cambios:
+            registro = cambio.get('record') or {}
+            pid = registro.get('proposal_id')
+            if cambio.get('table') != 'propuestas' or not pid:
+                continue
+            estado = registro.get('estado')
+            lote_id, idx = self._ubicar(pid)
+
+            if lote_id is not None:
+                # Factura en un lote mostrado
+                if estado is not None and estado != self.estado:
+                    del self.filas[lote_id][idx]
+                    salieron.add(pid)
+                else:
+                    nueva = db.to_queue_row(registro)
+                    self.filas[lote_id][idx].update({
+                        k: v for k, v in nueva.items()
+                        if k in registro or (k == 'monto_desembolsar' and 'recalculate_result_json' in registro)
+                    })
+            elif estado == self.estado:
+                # Entra a la cola
+                if 'identificador_lote' not in registro:
+                    return salieron, True  # Aviso incompleto: no se puede ubicar la factura
+                nueva = db.to_queue_row(registro)
+                lote_id = nueva['identificador_lote']
+                lote = self._lote(lote_id)
+                if lote is None:
+                    lote = {'identificador_lote': lote_id, 'emisor_nombre': nueva.get('emisor_nombre') or 'N/A',
+                            'n_facturas': 0, 'fecha': db.proposal_date_key(pid)}
+                    self.lotes.insert(0, lote)
+                    self.filas[lote_id] = []
+                if lote_id in self.filas:
+                    self.filas[lote_id].append(nueva)
+                else:
+                    self._contar(lote, pid, +1)  # Sus filas se consultarán al mostrarlo
+            elif estado is not None and (cambio.get('old_record') or {}).get('estado', self.estado) == self.estado:
+                # Sale de un lote no mostrado. Los avisos locales (y Realtime sin REPLICA IDENTITY
+                # FULL) no traen el estado anterior: se asume que estaba en la cola; el conteo
+                # vuelve a ser exacto al mostrar el lote
+                lote = self._lote(db.to_queue_row(registro)['identificador_lote']) if 'identificador_lote' in registro else None
+                if lote:
+                    self._contar(lote, pid, -1)
+
+        for lote_id, filas in self.filas.items():
+            lote = self._lote(lote_id)
+            if lote:
+                lote['n_facturas'] = len(filas)
+        self.lotes = [l for l in self.lotes if l['n_facturas'] > 0]
+        return salieron, False
+
+def sincronizar_cola(key: str, estado: str):
+    """
+    Cola de la sesión para `estado`, al día con el change feed.
+
+    Returns:
+        (ColaSesion, salieron): `salieron` son los proposal_id que dejaron la cola desde el
+        último rerun, o None si la cola se recargó completa desde la BD.
+    """
+    state_key = f"cola_{key}"
+    cola = st.session_state.get(state_key)
+    if cola is not None:
+        cambios = consumir_cambios(key, ('propuestas',))
+        if cambios is not None:
+            salieron, requiere_recarga = cola.aplicar(cambios)
+            if not requiere_recarga:
+                return cola, salieron
+
+    cola = ColaSesion(estado)
+    reiniciar_cursor(key)  # Antes de consultar: lo que llegue durante la carga se reaplica
+    cola.cargar()
+    st.session_state[state_key] = cola
+    return cola, None
+
+def render_paginacion_lotes(lotes: list, key: str) -> list:
+    """
+    Paginador de lotes (LOTES_POR_PAGINA por página). Devuelve los lotes de la página actual.
+    """
+    total_paginas = max(1, -(-len(lotes) // LOTES_POR_PAGINA))
+    page_key = f"pagina_{key}"
+    pagina = min(max(1, st.session_state.get(page_key, 1)), total_paginas)
+    st.session_state[page_key] = pagina
+
+    inicio = (pagina - 1) * LOTES_POR_PAGINA
+    lotes_pagina = lotes[inicio:inicio + LOTES_POR_PAGINA]
+    total_facturas = sum(l['n_facturas'] for l in lotes)
+
+    c_info, c_pag = st.columns([3, 1])
+    c_info.caption(
+        f"Lotes {inicio + 1}-{inicio + len(lotes_pagina)} de {len(lotes)} "
+        f"({total_facturas} facturas en total)"
+    )
+    if total_paginas > 1:
+        c_pag.number_input("Página", min_value=1, max_value=total_paginas, step=1, key=page_key)
+    return lotes_pagina
+
+def seleccionar_lote(seleccion: dict, pids: list, checkbox_key: str, editor_key: str):
+    """Callback del checkbox maestro: marca/desmarca todo el lote y reinicia su tabla editable."""
+    valor = st.session_state[checkbox_key]
+    for pid in pids:
+        seleccion[pid] = valor
+    # Las ediciones de un data_editor se guardan como deltas sobre sus datos: se descartan
+    st.session_state.pop(editor_key, None)
+
+def render_tabla_seleccion(filas: list, columnas: dict, seleccion: dict, key: str, column_config: dict = None):
+    """
+    Tabla editable (st.data_editor) con una columna de selección en lugar de una fila de
+    widgets por factura. Solo la columna 'Sel' es editable.
+
+    Args:
+        filas (list): Propuestas de la cola (get_queue_proposals).
+        columnas (dict): {titulo: función(fila) -> valor} de las columnas de solo lectura.
+        seleccion (dict): {proposal_id: bool}; se actualiza con lo marcado en la tabla.
+        key (str): Key única del data_editor.
+        column_config (dict): Configuración adicional de columnas de Streamlit.
+    """
+    if not filas:
+        return
+    df = pd.DataFrame(
+        [{'Sel': bool(seleccion.get(f['proposal_id'], False)), **{titulo: fn(f) for titulo, fn in columnas.items()}}
+         for f in filas]
+    )
+    editado = st.data_editor(
+        df,
+        key=key,
+        hide_index=True,
+        use_container_width=True,
+        disabled=list(columnas),
+        column_config={'Sel': st.column_config.CheckboxColumn("Sel", width="small"), **(column_config or {})},
+    )
+    for fila, marcado in zip(filas, editado['Sel']):
+        seleccion[fila['proposal_id']] = bool(marcado)
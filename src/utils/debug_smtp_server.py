@@ -0,0 +1,135 @@
+# src/utils/debug_smtp_server.py
+"""
+Servidor SMTP local de depuración (sin TLS) para probar el envío de correos
+(src/utils/email_integration.py) sin enviar nada real.
+
+Acepta cualquier AUTH, guarda los mensajes en memoria y, opcionalmente, como
+archivos .eml en un directorio.
+
+Uso:
+    python src/utils/debug_smtp_server.py --port 1025 --out-dir ./correos_debug
+    # .streamlit/secrets.toml:
+    # [smtp]
+    # server = "127.0.0.1"
+    # port = 1025
+    # user = "debug@inandes.local"
+    # password = "debug"
+    # starttls = false
+"""
+
+import os
+import time
+import argparse
+import threading
+import socketserver
+
+class DebugSMTPState:
+    def __init__(self, out_dir=None):
+        self.out_dir = out_dir
+        self.messages = []      # [{'sender', 'recipients', 'data': bytes}]
+        self.connections = 0
+        self.logins = 0
+        self.lock = threading.Lock()
+
+    def store(self, sender, recipients, data):
+        with self.lock:
+            self.messages.append({'sender': sender, 'recipients': list(recipients), 'data': data})
+            count = len(self.messages)
+        if self.out_dir:
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(self.out_dir, f"{int(time.time())}_{count:04d}.eml")
+            with open(path, 'wb') as f:
+                f.write(data)
+
+def _make_handler(state):
+    class Handler(socketserver.StreamRequestHandler):
+        def _reply(self, line):
+            self.wfile.write(line.encode() + b"\r\n")
+
+        def _read_data(self):
+            lines = []
+            while True:
+                line = self.rfile.readline()
+                if not line or line == b".\r\n":
+                    break
+                if line.startswith(b".."):
+                    line = line[1:]  # Undo dot-stuffing
+                lines.append(line)
+            return b"".join(lines)
+
+        def handle(self):
+            with state.lock:
+                state.connections += 1
+            sender, recipients = None, []
+            self._reply("220 debug-smtp listo")
+            while True:
+                raw = self.rfile.readline()
+                if not raw:
+                    return
+                line = raw.decode('utf-8', errors='replace').strip()
+                cmd = line.split(" ", 1)[0].upper()
+
+                if cmd in ("EHLO", "HELO"):
+                    self.wfile.write(b"250-debug-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+                elif cmd == "AUTH":
+                    parts = line.split()
+                    if len(parts) > 1 and parts[1].upper() == "LOGIN":
+                        # smtplib may send the username inline; ask for whatever is missing
+                        if len(parts) < 3:
+                            self._reply("334 VXNlcm5hbWU6")
+                            self.rfile.readline()
+                        self._reply("334 UGFzc3dvcmQ6")
+                        self.rfile.readline()
+                    elif len(parts) < 3:
+                        self._reply("334 ")
+                        self.rfile.readline()
+                    with state.lock:
+                        state.logins += 1
+                    self._reply("235 Autenticado")
+                elif cmd == "MAIL":
+                    sender, recipients = line.split(":", 1)[1].strip().strip("<>"), []
+                    self._reply("250 OK")
+                elif cmd == "RCPT":
+                    recipients.append(line.split(":", 1)[1].strip().strip("<>"))
+                    self._reply("250 OK")
+                elif cmd == "DATA":
+                    self._reply("354 Enviar datos; terminar con <CRLF>.<CRLF>")
+                    state.store(sender, recipients, self._read_data())
+                    sender, recipients = None, []
+                    self._reply("250 Mensaje recibido")
+                elif cmd == "RSET":
+                    sender, recipients = None, []
+                    self._reply("250 OK")
+                elif cmd == "NOOP":
+                    self._reply("250 OK")
+                elif cmd == "QUIT":
+                    self._reply("221 Adiós")
+                    return
+                else:
+                    self._reply("502 Comando no implementado")
+    return Handler
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_debug_smtp_server(host="127.0.0.1", port=0, out_dir=None):
+    """Arranca el servidor en un hilo daemon. Retorna (server, state, port). port=0 elige uno libre."""
+    state = DebugSMTPState(out_dir=out_dir)
+    server = _ThreadingTCPServer((host, port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, server.server_address[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor SMTP local de depuración")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--out-dir", default=None, help="Directorio donde guardar los .eml recibidos")
+    args = parser.parse_args()
+
+    server, state, port = start_debug_smtp_server(args.host, args.port, args.out_dir)
+    print(f"SMTP de depuración escuchando en {args.host}:{port} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
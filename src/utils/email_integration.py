@@ -1,77 +1,273 @@
 import smtplib
+import socket
+import threading
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from email.generator import BytesGenerator
+from email import policy
 import streamlit as st
 import os
 
+SMTP_IDLE_TIMEOUT_SECONDS = 240   # Most servers drop idle sessions after ~5 min
+SMTP_SOCKET_TIMEOUT_SECONDS = 60
+STREAM_BUFFER_SIZE = 64 * 1024
+
+def _split_emails(email_str):
+    """Clean and split email strings (comma or semicolon separated)."""
+    if not email_str: return []
+    # Replace semicolons with commas and split
+    return [e.strip() for e in email_str.replace(';', ',').split(',') if e.strip()]
+
+def _load_smtp_config():
+    smtp_config = st.secrets["smtp"]
+    return {
+        'server': smtp_config["server"],
+        'port': int(smtp_config["port"]),
+        'user': smtp_config["user"],
+        'password': smtp_config["password"],
+        # Optional: the local debug server (src/utils/debug_smtp_server.py) runs without TLS
+        'starttls': bool(smtp_config.get("starttls", True)),
+    }
+
+def build_email_message(sender: str, to_list: list, subject: str, body: str, attachments: list = None, cc_list: list = None):
+    """Builds the MIME message. attachments: [{'name': 'filename.pdf', 'bytes': b'...'}]"""
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ", ".join(to_list)
+    msg['Subject'] = subject
+
+    if cc_list:
+        msg['Cc'] = ", ".join(cc_list)
+
+    msg.attach(MIMEText(body, 'plain'))
+
+    for att in attachments or []:
+        part = MIMEApplication(att['bytes'], Name=att['name'])
+        part['Content-Disposition'] = f'attachment; filename="{att["name"]}"'
+        msg.attach(part)
+    return msg
+
+class _SMTPDataWriter:
+    """
+    File-like sink for BytesGenerator that streams the message to the SMTP socket
+    in blocks, applying dot-stuffing, instead of building the whole text in memory.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.at_line_start = True
+        self.last_byte = b''
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if not data:
+            return
+        # Dot-stuffing (RFC 5321 4.5.2): lines starting with '.' get an extra '.'
+        if self.at_line_start and data.startswith(b'.'):
+            self.buffer += b'.'
+        elif self.last_byte == b'\r' and data.startswith(b'\n.'):
+            data = b'\n..' + data[2:]
+        self.buffer += data.replace(b'\r\n.', b'\r\n..')
+        self.at_line_start = data.endswith(b'\r\n') or (self.last_byte == b'\r' and data == b'\n')
+        self.last_byte = data[-1:]
+        if len(self.buffer) >= STREAM_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.sock.sendall(bytes(self.buffer))
+            self.buffer.clear()
+
+    def finish(self):
+        self.buffer += b'.\r\n' if self.at_line_start else b'\r\n.\r\n'
+        self.flush()
+
+class SMTPMailer:
+    """
+    Authenticated SMTP session reused across sends (and across reruns: see get_mailer).
+    The connection is checked with NOOP after being idle and reopened transparently
+    if the server dropped it. Thread-safe: one send at a time per mailer.
+    """
+
+    def __init__(self, server: str, port: int, user: str, password: str, starttls: bool = True):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self._conn = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    # --- Connection management ---
+    def _open(self):
+        conn = smtplib.SMTP(self.server, self.port, timeout=SMTP_SOCKET_TIMEOUT_SECONDS)
+        conn.ehlo()
+        if self.starttls:
+            conn.starttls()
+            conn.ehlo()
+        if self.user and self.password:
+            conn.login(self.user, self.password)
+        return conn
+
+    def _connection(self):
+        if self._conn is not None:
+            idle = time.monotonic() - self._last_used
+            if idle > SMTP_IDLE_TIMEOUT_SECONDS:
+                self._close()
+            elif idle > 5:
+                try:
+                    if self._conn.noop()[0] != 250:
+                        self._close()
+                except (smtplib.SMTPException, OSError):
+                    self._close()
+        if self._conn is None:
+            self._conn = self._open()
+        return self._conn
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    # --- Sending ---
+    def _stream_message(self, conn, sender, recipients, msg):
+        """MAIL/RCPT/DATA with the body generated straight into the socket."""
+        code, resp = conn.mail(sender)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, resp, sender)
+        refused = {}
+        for rcpt in recipients:
+            code, resp = conn.rcpt(rcpt)
+            if code not in (250, 251):
+                refused[rcpt] = (code, resp)
+        if len(refused) == len(recipients):
+            conn.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, resp = conn.docmd("DATA")
+        if code != 354:
+            raise smtplib.SMTPDataError(code, resp)
+        writer = _SMTPDataWriter(conn.sock)
+        BytesGenerator(writer, policy=policy.SMTP).flatten(msg)
+        writer.finish()
+        code, resp = conn.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return refused
+
+    def _send_locked(self, msg, recipients):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                refused = self._stream_message(conn, self.user, recipients, msg)
+                self._last_used = time.monotonic()
+                return refused
+            except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+                # Stale pooled session: reconnect once. SMTP replies (refused sender,
+                # DATA errors...) are not retried: the server may have accepted the mail.
+                self._close()
+                if attempt == 1:
+                    raise
+
+    def send(self, to_email: str, subject: str, body: str, attachments: list = None, cc_email: str = ""):
+        """Sends one email. Returns (bool, str) like send_email_with_attachments."""
+        return self.send_bulk([{
+            'to_email': to_email, 'subject': subject, 'body': body,
+            'attachments': attachments, 'cc_email': cc_email
+        }])[0]
+
+    def send_bulk(self, messages: list):
+        """
+        Sends many emails over the same authenticated session.
+        messages: [{'to_email', 'subject', 'body', 'attachments' (opt), 'cc_email' (opt)}]
+        Returns a list of (bool, str), one per message, in order.
+        """
+        results = []
+        with self._lock:
+            for item in messages:
+                to_list = _split_emails(item.get('to_email', ''))
+                cc_list = _split_emails(item.get('cc_email', ''))
+                if not to_list:
+                    results.append((False, "No se ha definido ningún destinatario (TO)."))
+                    continue
+                try:
+                    msg = build_email_message(
+                        self.user, to_list, item.get('subject', ''), item.get('body', ''),
+                        item.get('attachments'), cc_list
+                    )
+                except Exception as e:
+                    results.append((False, f"Error adjuntando archivos: {e}"))
+                    continue
+                try:
+                    # Envelope recipients must include TO and CC
+                    refused = self._send_locked(msg, to_list + cc_list)
+                    if refused:
+                        results.append((True, f"Email enviado (rechazados: {', '.join(refused)})."))
+                    else:
+                        results.append((True, "Email enviado correctamente."))
+                except Exception as e:
+                    try:
+                        if self._conn is not None:
+                            self._conn.rset()
+                    except Exception:
+                        self._close()
+                    results.append((False, f"Error enviando email: {e}"))
+        return results
+
+_mailers = {}
+_mailers_lock = threading.Lock()
+
+def get_mailer(config: dict = None) -> SMTPMailer:
+    """Process-wide SMTPMailer for the given config (defaults to st.secrets['smtp'])."""
+    config = config or _load_smtp_config()
+    key = (config['server'], config['port'], config['user'])
+    with _mailers_lock:
+        mailer = _mailers.get(key)
+        if mailer is None or mailer.password != config['password']:
+            mailer = _mailers[key] = SMTPMailer(**config)
+        return mailer
+
 def send_email_with_attachments(to_email: str, subject: str, body: str, attachments: list = None, cc_email: str = ""):
     """
     Sends an email with optional attachments using SMTP credentials from st.secrets.
-    
+    Reuses the pooled SMTP session (see get_mailer).
+
     Args:
         to_email (str): Recipient email address (can be comma separated).
         subject (str): Email subject.
         body (str): Email body text.
         attachments (list): List of dicts [{'name': 'filename.pdf', 'bytes': b'...'}]
         cc_email (str): CC email address (can be comma separated).
-    
+
     Returns:
         tuple: (bool, str) -> (Success, Message)
     """
     try:
-        # Load secrets
-        smtp_config = st.secrets["smtp"]
-        smtp_server = smtp_config["server"]
-        smtp_port = smtp_config["port"]
-        smtp_user = smtp_config["user"]
-        smtp_password = smtp_config["password"]
+        mailer = get_mailer()
     except Exception as e:
         return False, f"Configuración SMTP faltante o incorrecta en secrets.toml: {e}"
+    return mailer.send(to_email, subject, body, attachments=attachments, cc_email=cc_email)
 
-    # Helper to clean and split email strings
-    def regex_split_emails(email_str):
-        if not email_str: return []
-        # Replace semicolons with commas and split
-        return [e.strip() for e in email_str.replace(';', ',').split(',') if e.strip()]
-
-    to_list = regex_split_emails(to_email)
-    cc_list = regex_split_emails(cc_email)
-    
-    if not to_list:
-        return False, "No se ha definido ningún destinatario (TO)."
-
-    msg = MIMEMultipart()
-    msg['From'] = smtp_user
-    msg['To'] = ", ".join(to_list)
-    msg['Subject'] = subject
-    
-    if cc_list:
-        msg['Cc'] = ", ".join(cc_list)
-
-    msg.attach(MIMEText(body, 'plain'))
-
-    if attachments:
-        for att in attachments:
-            try:
-                part = MIMEApplication(att['bytes'], Name=att['name'])
-                part['Content-Disposition'] = f'attachment; filename="{att["name"]}"'
-                msg.attach(part)
-            except Exception as e:
-                return False, f"Error adjuntando archivo {att.get('name', 'bqe')}: {e}"
-
+def send_bulk_emails(messages: list):
+    """
+    Sends many emails (e.g. month-end: one per emisor) over a single SMTP session.
+    messages: [{'to_email', 'subject', 'body', 'attachments', 'cc_email'}]
+    Returns a list of (bool, str) in the same order.
+    """
     try:
-        # Connect to server
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        text = msg.as_string()
-        
-        # Envelope recipients must include TO and CC
-        recipients = to_list + cc_list
-        
-        server.sendmail(smtp_user, recipients, text)
-        server.quit()
-        return True, "Email enviado correctamente."
+        mailer = get_mailer()
     except Exception as e:
-        return False, f"Error enviando email: {e}"
+        return [(False, f"Configuración SMTP faltante o incorrecta en secrets.toml: {e}")] * len(messages)
+    return mailer.send_bulk(messages)
@@ -0,0 +1,166 @@
+# src/utils/fake_drive_server.py
+"""
+Servidor HTTP local que imita el endpoint de subida de Drive v3
+(uploadType=multipart y uploadType=resumable) para probar
+src/services/drive_uploader.py sin tocar Google.
+
+Permite inyectar fallas: fail_rate devuelve 503 y throttle_rate devuelve 429 o
+403 userRateLimitExceeded (como Drive) en una fracción aleatoria de las peticiones.
+
+Uso:
+    python src/utils/fake_drive_server.py --port 8765 --fail-rate 0.1 --throttle-rate 0.1
+    # DriveUploadManager(lambda: "token", upload_url="http://127.0.0.1:8765/upload/drive/v3/files")
+"""
+
+import re
+import json
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+UPLOAD_PATH = "/upload/drive/v3/files"
+
+class FakeDriveState:
+    def __init__(self, fail_rate=0.0, throttle_rate=0.0):
+        self.fail_rate = fail_rate
+        self.throttle_rate = throttle_rate
+        self.files = {}      # file_id -> {'name', 'parents', 'bytes'}
+        self.sessions = {}   # session_id -> {'metadata', 'total', 'data'}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def _make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=None, headers=None):
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _inject_fault(self):
+            with state.lock:
+                state.requests += 1
+            roll = random.random()
+            if roll < state.throttle_rate:
+                if random.random() < 0.5:
+                    self._send(429, {"error": {"code": 429, "message": "Rate Limit Exceeded"}})
+                else:
+                    self._send(403, {"error": {"code": 403, "message": "User Rate Limit Exceeded",
+                                               "errors": [{"domain": "usageLimits", "reason": "userRateLimitExceeded"}]}})
+                return True
+            if roll < state.throttle_rate + state.fail_rate:
+                self._send(503, {"error": {"code": 503, "message": "Backend Error"}})
+                return True
+            return False
+
+        def _store(self, metadata, data):
+            file_id = uuid.uuid4().hex
+            with state.lock:
+                state.files[file_id] = {'name': metadata.get('name'), 'parents': metadata.get('parents', []), 'bytes': data}
+            return file_id
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self._read_body()
+            if url.path != UPLOAD_PATH:
+                return self._send(404, {"error": "not found"})
+            if self._inject_fault():
+                return
+            upload_type = parse_qs(url.query).get("uploadType", [""])[0]
+
+            if upload_type == "multipart":
+                match = re.search(r'boundary=([^;]+)', self.headers.get("Content-Type", ""))
+                if not match:
+                    return self._send(400, {"error": "missing boundary"})
+                parts = body.split(b"--" + match.group(1).encode())
+                meta_part, media_part = parts[1], parts[2]
+                metadata = json.loads(meta_part.split(b"\r\n\r\n", 1)[1].strip())
+                data = media_part.split(b"\r\n\r\n", 1)[1][:-2]  # strip trailing CRLF
+                return self._send(200, {"id": self._store(metadata, data)})
+
+            if upload_type == "resumable":
+                session_id = uuid.uuid4().hex
+                with state.lock:
+                    state.sessions[session_id] = {
+                        'metadata': json.loads(body or b"{}"),
+                        'total': int(self.headers.get("X-Upload-Content-Length") or 0),
+                        'data': bytearray(),
+                    }
+                host = self.headers.get("Host")
+                return self._send(200, headers={"Location": f"http://{host}{UPLOAD_PATH}?upload_id={session_id}"})
+
+            return self._send(400, {"error": "unsupported uploadType"})
+
+        def do_PUT(self):
+            url = urlparse(self.path)
+            body = self._read_body()
+            session_id = parse_qs(url.query).get("upload_id", [""])[0]
+            session = state.sessions.get(session_id)
+            if session is None:
+                return self._send(404, {"error": "upload session not found"})
+            if self._inject_fault():
+                return
+
+            content_range = self.headers.get("Content-Range", "")
+            received = len(session['data'])
+            if content_range.startswith("bytes */"):
+                pass  # Status query
+            else:
+                match = re.match(r"bytes (\d+)-(\d+)/(\d+)", content_range)
+                if not match:
+                    return self._send(400, {"error": "bad Content-Range"})
+                start = int(match.group(1))
+                if start != received:
+                    return self._send(400, {"error": f"expected offset {received}"})
+                session['data'].extend(body)
+                received = len(session['data'])
+
+            if received >= session['total']:
+                file_id = self._store(session['metadata'], bytes(session['data']))
+                return self._send(200, {"id": file_id})
+            headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+            return self._send(308, headers=headers)
+
+    return Handler
+
+def start_fake_drive_server(host="127.0.0.1", port=0, fail_rate=0.0, throttle_rate=0.0):
+    """
+    Arranca el servidor en un hilo daemon. Retorna (server, state, upload_url).
+    port=0 elige un puerto libre.
+    """
+    state = FakeDriveState(fail_rate=fail_rate, throttle_rate=throttle_rate)
+    server = ThreadingHTTPServer((host, port), _make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    upload_url = f"http://{host}:{server.server_address[1]}{UPLOAD_PATH}"
+    return server, state, upload_url
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Google Drive upload server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, state, upload_url = start_fake_drive_server(args.host, args.port, args.fail_rate, args.throttle_rate)
+    print(f"Fake Drive escuchando en {upload_url} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -5,6 +5,8 @@ from streamlit_google_picker import google_picker
 import streamlit_google_picker.uploaded_file as lib_upl # Import for monkeypatching
 import uuid  # Para generar keys únicas por sesión
 import io
+import time
+import threading
 
 # --- CONFIGURACIÓN SHARED DRIVE ---
 # ID de la carpeta raíz del repositorio en el SHARED DRIVE
@@ -52,65 +54,262 @@ def patch_picker_flatten():
         lib_upl.flatten_picker_result = original_flatten
 # --------------------------
 
-# --- HELPER: Listar Carpetas con Service Account (Backend del Browser Nativo) ---
-def list_folders_with_sa(parent_id, sa_creds):
+# --- SERVICE ACCOUNT: Credenciales y servicio Drive cacheados ---
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+
+_sa_credentials_cache = {}
+_sa_credentials_lock = threading.Lock()
+# googleapiclient usa httplib2, que NO es thread-safe: un servicio por hilo (ThreadPoolExecutor)
+_drive_services = threading.local()
+
+def _sa_cache_key(sa_credentials):
+    """Identifica una Service Account (ruta al JSON o dict/AttrDict de st.secrets)."""
+    if isinstance(sa_credentials, str):
+        return ('file', sa_credentials)
+    return ('info', sa_credentials.get('client_email'), sa_credentials.get('private_key_id'))
+
+def get_sa_credentials(sa_credentials):
     """
-    Lista las subcarpetas dentro de parent_id usando credenciales de Service Account.
-    Retorna lista de dicts: [{'id': '...', 'name': '...'}]
+    Retorna las credenciales de la Service Account, construidas una sola vez por proceso.
+    :param sa_credentials: Path to JSON file (str) OR dictionary with credentials (dict)
     """
-    try:
-        from google.oauth2 import service_account
-        from googleapiclient.discovery import build
+    cache_key = _sa_cache_key(sa_credentials)
+    creds = _sa_credentials_cache.get(cache_key)
+    if creds is not None:
+        return creds
+
+    from google.oauth2 import service_account
+
+    with _sa_credentials_lock:
+        creds = _sa_credentials_cache.get(cache_key)
+        if creds is None:
+            if isinstance(sa_credentials, str):
+                creds = service_account.Credentials.from_service_account_file(
+                    sa_credentials, scopes=DRIVE_SCOPES
+                )
+            else:
+                # Clonar para no modificar el original de st.secrets (que podría ser inmutable)
+                info = dict(sa_credentials)
+                if 'private_key' in info:
+                    # Fix común para Streamlit Secrets: reemplazar \\n con \n real
+                    info['private_key'] = info['private_key'].replace('\\n', '\n')
+                creds = service_account.Credentials.from_service_account_info(
+                    info, scopes=DRIVE_SCOPES
+                )
+            _sa_credentials_cache[cache_key] = creds
+    return creds
+
+def _ensure_valid_token(creds):
+    """Refresca el token solo si no existe o está por expirar (google-auth aplica un margen previo a la expiración)."""
+    if not creds.valid:
+        import google.auth.transport.requests
+        with _sa_credentials_lock:
+            if not creds.valid:
+                creds.refresh(google.auth.transport.requests.Request())
+    return creds
 
-        creds = service_account.Credentials.from_service_account_info(
-            sa_creds, scopes=['https://www.googleapis.com/auth/drive']
-        )
-        service = build('drive', 'v3', credentials=creds)
+def get_drive_service(sa_credentials):
+    """
+    Retorna un cliente Drive v3 para el hilo actual, reutilizado entre llamadas.
+    Usa el documento de descubrimiento empaquetado con googleapiclient (sin descarga HTTP).
+    """
+    services = getattr(_drive_services, 'by_key', None)
+    if services is None:
+        services = _drive_services.by_key = {}
 
-        # Query solo carpetas y que no estén en la papelera
-        query = f"'{parent_id}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-        
+    cache_key = _sa_cache_key(sa_credentials)
+    service = services.get(cache_key)
+    if service is None:
+        from googleapiclient.discovery import build
+        creds = _ensure_valid_token(get_sa_credentials(sa_credentials))
+        service = build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+        services[cache_key] = service
+    return service
+
+# --- HELPER: Listar Carpetas con Service Account (Backend del Browser Nativo) ---
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+FOLDER_CACHE_TTL_SECONDS = 600       # Vigencia máxima de un listado en caché
+CHANGES_POLL_INTERVAL_SECONDS = 15   # Frecuencia mínima de consulta al feed de cambios
+PREFETCH_MAX_WORKERS = 4
+
+def _fetch_subfolders(parent_id, sa_creds):
+    """Lista TODAS las subcarpetas de parent_id (sigue nextPageToken). Lanza excepción si falla."""
+    service = get_drive_service(sa_creds)
+    # Query solo carpetas y que no estén en la papelera
+    query = f"'{parent_id}' in parents and mimeType = '{FOLDER_MIME_TYPE}' and trashed = false"
+
+    folders = []
+    page_token = None
+    while True:
         results = service.files().list(
             q=query,
-            pageSize=50,
+            pageSize=1000,
+            pageToken=page_token,
             fields="nextPageToken, files(id, name)",
             includeItemsFromAllDrives=True, # Necesario para Shared Drives
             supportsAllDrives=True
         ).execute()
-        
-        return results.get('files', [])
+        folders.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return folders
+
+class DriveFolderIndex:
+    """
+    Índice en memoria (compartido por todas las sesiones del proceso) de parent_id -> subcarpetas.
+    - Cada listado vence a los FOLDER_CACHE_TTL_SECONDS.
+    - El feed de cambios de Drive (changes.list) parcha el índice: carpetas creadas,
+      renombradas, movidas o eliminadas se reflejan sin volver a listar.
+    - prefetch() carga en segundo plano las subcarpetas de un nivel más abajo.
+    """
+
+    def __init__(self, ttl_seconds=FOLDER_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}   # parent_id -> {'folders': [...], 'fetched_at': float}
+        self._lock = threading.Lock()
+        self._changes_token = None
+        self._last_changes_poll = 0.0
+        self._prefetch_executor = None
+        self._prefetching = set()
+
+    def _is_fresh(self, entry):
+        return entry is not None and (time.monotonic() - entry['fetched_at']) < self.ttl_seconds
+
+    def get_subfolders(self, parent_id, sa_creds, force_refresh=False):
+        self._apply_changes(sa_creds)
+        entry = self._entries.get(parent_id)
+        if not force_refresh and self._is_fresh(entry):
+            return list(entry['folders'])
+
+        folders = _fetch_subfolders(parent_id, sa_creds)
+        with self._lock:
+            self._entries[parent_id] = {'folders': folders, 'fetched_at': time.monotonic()}
+        return list(folders)
+
+    def invalidate(self, parent_id=None):
+        with self._lock:
+            if parent_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(parent_id, None)
+
+    # --- Prefetch (un nivel adelante) ---
+    def prefetch(self, folder_ids, sa_creds):
+        from concurrent.futures import ThreadPoolExecutor
+
+        with self._lock:
+            if self._prefetch_executor is None:
+                self._prefetch_executor = ThreadPoolExecutor(
+                    max_workers=PREFETCH_MAX_WORKERS, thread_name_prefix="drive_prefetch"
+                )
+            pending = [
+                fid for fid in folder_ids
+                if fid not in self._prefetching and not self._is_fresh(self._entries.get(fid))
+            ]
+            self._prefetching.update(pending)
+
+        for folder_id in pending:
+            self._prefetch_executor.submit(self._prefetch_one, folder_id, sa_creds)
+
+    def _prefetch_one(self, folder_id, sa_creds):
+        try:
+            folders = _fetch_subfolders(folder_id, sa_creds)
+            with self._lock:
+                self._entries[folder_id] = {'folders': folders, 'fetched_at': time.monotonic()}
+        except Exception as e:
+            print(f"[WARN prefetch carpetas] {folder_id}: {e}")
+        finally:
+            with self._lock:
+                self._prefetching.discard(folder_id)
+
+    # --- Refresco incremental (Drive changes feed) ---
+    def _apply_changes(self, sa_creds):
+        now = time.monotonic()
+        if now - self._last_changes_poll < CHANGES_POLL_INTERVAL_SECONDS:
+            return
+        self._last_changes_poll = now
+
+        try:
+            service = get_drive_service(sa_creds)
+            if self._changes_token is None:
+                response = service.changes().getStartPageToken(supportsAllDrives=True).execute()
+                self._changes_token = response.get('startPageToken')
+                return
+
+            page_token = self._changes_token
+            while page_token:
+                response = service.changes().list(
+                    pageToken=page_token,
+                    pageSize=1000,
+                    includeItemsFromAllDrives=True,
+                    supportsAllDrives=True,
+                    fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, parents, trashed))"
+                ).execute()
+                self._patch(response.get('changes', []))
+                page_token = response.get('nextPageToken')
+                if response.get('newStartPageToken'):
+                    self._changes_token = response['newStartPageToken']
+        except Exception as e:
+            # Sin feed confiable: descartar el índice y volver a listar bajo demanda
+            print(f"[WARN feed de cambios Drive] {e}")
+            self._changes_token = None
+            self.invalidate()
+
+    def _patch(self, changes):
+        with self._lock:
+            for change in changes:
+                file = change.get('file') or {}
+                if file and file.get('mimeType') != FOLDER_MIME_TYPE:
+                    continue
+                folder_id = change.get('fileId')
+
+                # Quitar la carpeta de cualquier listado (se reinserta abajo si sigue viva)
+                for entry in self._entries.values():
+                    entry['folders'] = [f for f in entry['folders'] if f['id'] != folder_id]
+
+                if change.get('removed') or not file or file.get('trashed'):
+                    self._entries.pop(folder_id, None)
+                    continue
+
+                for parent_id in file.get('parents', []):
+                    entry = self._entries.get(parent_id)
+                    if entry is not None:
+                        entry['folders'].append({'id': folder_id, 'name': file.get('name')})
+
+_folder_index = DriveFolderIndex()
+
+def get_folder_index():
+    """Índice de carpetas compartido por el proceso."""
+    return _folder_index
+
+def list_folders_with_sa(parent_id, sa_creds, force_refresh=False):
+    """
+    Lista las subcarpetas dentro de parent_id usando credenciales de Service Account.
+    Retorna lista de dicts: [{'id': '...', 'name': '...'}]
+    Sirve desde el índice en caché; force_refresh=True vuelve a consultar Drive.
+    """
+    try:
+        return _folder_index.get_subfolders(parent_id, sa_creds, force_refresh=force_refresh)
     except Exception as e:
         st.error(f"Error listando carpetas: {e}")
         return []
 
+def prefetch_subfolders(folders, sa_creds):
+    """Precarga en segundo plano el siguiente nivel para que la navegación sea instantánea."""
+    try:
+        _folder_index.prefetch([f['id'] for f in folders], sa_creds)
+    except Exception as e:
+        print(f"[WARN prefetch_subfolders] {e}")
+
 # ---------------------------------------------------------
 
 def get_service_account_token():
     """
-    Genera un access_token FRESCO del Service Account para usar en el Google Picker.
-    IMPORTANTE: Se genera un token nuevo en cada llamada para evitar problemas de caché.
+    Retorna un access_token del Service Account para usar en el Google Picker.
+    El token se reutiliza mientras sea válido y se refresca solo cuando está por expirar.
     """
     try:
-        from google.oauth2 import service_account
-        import google.auth.transport.requests
-        
-        # Obtener credenciales del Service Account
-        sa_creds_dict = dict(st.secrets["google_drive"])
-        
-        # Fix de private_key si viene con \\n en lugar de \n
-        if 'private_key' in sa_creds_dict:
-            original_key = sa_creds_dict['private_key']
-            sa_creds_dict['private_key'] = original_key.replace('\\n', '\n')
-        
-        # Crear credenciales con scope de Drive
-        creds = service_account.Credentials.from_service_account_info(
-            sa_creds_dict,
-            scopes=['https://www.googleapis.com/auth/drive']
-        )
-        
-        # FORZAR refresh para obtener token FRESCO (no en caché)
-        creds.refresh(google.auth.transport.requests.Request())
-        
+        creds = _ensure_valid_token(get_sa_credentials(st.secrets["google_drive"]))
         return creds.token
         
     except Exception as e:
@@ -314,30 +513,8 @@ def upload_file_with_sa(file_bytes, file_name, folder_id, sa_credentials):
     :param sa_credentials: Path to JSON file (str) OR dictionary with credentials (dict)
     """
     try:
-        from google.oauth2 import service_account
-        from googleapiclient.discovery import build
-        
-        # Load credentials
-        # Check if it's NOT a string (path). If so, treat as dict/AttrDict.
-        if not isinstance(sa_credentials, str):
-            # Clonar para no modificar el original de st.secrets (que podría ser inmutable)
-            info = dict(sa_credentials)
-            if 'private_key' in info:
-                # Fix común para Streamlit Secrets: reemplazar \\n con \n real
-                info['private_key'] = info['private_key'].replace('\\n', '\n')
-            
-            creds = service_account.Credentials.from_service_account_info(
-                info, 
-                scopes=['https://www.googleapis.com/auth/drive']
-            )
-        else:
-            creds = service_account.Credentials.from_service_account_file(
-                sa_credentials, 
-                scopes=['https://www.googleapis.com/auth/drive']
-            )
-        
-        # Build Service
-        service = build('drive', 'v3', credentials=creds)
+        # Credenciales y servicio cacheados (por proceso / por hilo)
+        service = get_drive_service(sa_credentials)
         
         # File Metadata
         file_metadata = {
@@ -363,7 +540,9 @@ def upload_file_with_sa(file_bytes, file_name, folder_id, sa_credentials):
         if isinstance(sa_credentials, dict) and 'private_key' in sa_credentials:
              pk = sa_credentials['private_key']
              # Mostrar si tiene saltos de linea o no
-             debug_msg += f" | KeyLen: {len(pk)} | HasRealNewLine: {'\\n' in pk} | HasEscapedNewLine: {'\\\\n' in pk} | Start: {pk[:10]}..."
+             has_real_newline = '\n' in pk
+             has_escaped_newline = '\\n' in pk
+             debug_msg += f" | KeyLen: {len(pk)} | HasRealNewLine: {has_real_newline} | HasEscapedNewLine: {has_escaped_newline} | Start: {pk[:10]}..."
         return False, debug_msg
 
 
@@ -431,6 +610,7 @@ def render_simple_folder_selector(key, label="Seleccionar Carpeta Destino"):
     try:
         sa_creds = st.secrets["google_drive"]
         subfolders = list_folders_with_sa(current_id, sa_creds)
+        prefetch_subfolders(subfolders, sa_creds)
     except Exception as e:
         st.error(f"Error accediendo al repositorio: {e}")
         subfolders = []
@@ -530,6 +710,7 @@ def render_folder_navigator_v2(key, label="Navegador del Repositorio"):
             try:
                 sa_creds = st.secrets["google_drive"]
                 subfolders = list_folders_with_sa(current_id, sa_creds)
+                prefetch_subfolders(subfolders, sa_creds)
             except Exception as e:
                 st.error(f"Error: {e}")
                 subfolders = []
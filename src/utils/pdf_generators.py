@@ -2,9 +2,28 @@
 
 import os
 import datetime
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML
-from typing import List, Dict, Any
+import threading
+import tempfile
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from weasyprint import HTML, default_url_fetcher
+from weasyprint.urls import path2url
+from typing import List, Dict, Any, Optional
+
+from src.core.invoice_aggregation import aggregate_invoices
+
+try:
+    from weasyprint.text.fonts import FontConfiguration
+except ImportError:  # WeasyPrint < 53
+    from weasyprint.fonts import FontConfiguration
+
+# --- Paths ---
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+TEMPLATES_DIR = os.path.join(PROJECT_ROOT, 'src', 'templates')
+STATIC_DIR = os.path.join(PROJECT_ROOT, 'static')
+# Compiled template bytecode survives process restarts (Streamlit redeploys, API workers)
+JINJA_BYTECODE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'inandes_jinja_cache')
+# Local assets (logos, fonts) kept in memory for the url_fetcher
+PRELOADED_ASSET_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.svg', '.gif', '.ttf', '.otf', '.woff', '.woff2', '.css')
 
 # --- Helper Functions for Templates ---
 
@@ -18,6 +37,114 @@ def _format_currency(value: float, currency: str = "PEN") -> str:
         return str(value)
     return f"{currency} {val:,.2f}"
 
+# --- Template Environment (Singleton) ---
+
+_template_env: Optional[Environment] = None
+_template_env_lock = threading.Lock()
+
+def get_template_environment() -> Environment:
+    """
+    Returns the process-wide Jinja environment used by every PDF report.
+    Filters are registered once, parsed templates are kept in the environment's
+    in-memory cache and compiled bytecode is persisted on disk.
+    """
+    global _template_env
+    if _template_env is None:
+        with _template_env_lock:
+            if _template_env is None:
+                os.makedirs(JINJA_BYTECODE_CACHE_DIR, exist_ok=True)
+                env = Environment(
+                    loader=FileSystemLoader(TEMPLATES_DIR),
+                    bytecode_cache=FileSystemBytecodeCache(JINJA_BYTECODE_CACHE_DIR),
+                )
+                env.filters['format_currency'] = _format_currency
+                _template_env = env
+    return _template_env
+
+def warm_up_pdf_templates() -> int:
+    """
+    Compiles every template in src/templates ahead of the first PDF request.
+    Safe to call on every app start/rerun: templates already compiled are served from cache.
+    Returns the number of templates loaded.
+    """
+    env = get_template_environment()
+    loaded = 0
+    for template_name in env.list_templates(extensions=['html']):
+        try:
+            env.get_template(template_name)
+            loaded += 1
+        except Exception as e:
+            print(f"[ERROR en warm_up_pdf_templates] {template_name}: {e}")
+    return loaded
+
+# --- WeasyPrint Shared Resources ---
+
+_asset_cache: Dict[str, Dict[str, Any]] = {}
+_asset_cache_lock = threading.Lock()
+# FontConfiguration objects are not shared between threads (one Streamlit session per thread)
+_render_resources = threading.local()
+
+def _is_local_asset(url: str) -> bool:
+    return url.startswith('file:') and url.lower().endswith(PRELOADED_ASSET_EXTENSIONS)
+
+def _read_fetch_result(url: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Turns a WeasyPrint fetch result into a reusable in-memory entry."""
+    if 'string' in result:
+        data = result['string']
+    else:
+        file_obj = result['file_obj']
+        try:
+            data = file_obj.read()
+        finally:
+            file_obj.close()
+    return {
+        'string': data,
+        'mime_type': result.get('mime_type'),
+        'encoding': result.get('encoding'),
+        'redirected_url': result.get('redirected_url', url),
+    }
+
+def cached_url_fetcher(url: str, *args, **kwargs) -> Dict[str, Any]:
+    """
+    url_fetcher for WeasyPrint that serves local static assets (logos, fonts) from
+    memory. Anything else (remote URLs, data: URIs) goes to the default fetcher.
+    """
+    if not _is_local_asset(url):
+        return default_url_fetcher(url, *args, **kwargs)
+
+    entry = _asset_cache.get(url)
+    if entry is None:
+        entry = _read_fetch_result(url, default_url_fetcher(url, *args, **kwargs))
+        with _asset_cache_lock:
+            _asset_cache[url] = entry
+    return dict(entry)
+
+def preload_pdf_assets() -> int:
+    """
+    Loads every image/font under static/ into the url_fetcher memory cache.
+    Returns the number of cached assets.
+    """
+    if os.path.isdir(STATIC_DIR):
+        for dirpath, _, filenames in os.walk(STATIC_DIR):
+            for filename in filenames:
+                if not filename.lower().endswith(PRELOADED_ASSET_EXTENSIONS):
+                    continue
+                try:
+                    cached_url_fetcher(path2url(os.path.join(dirpath, filename)))
+                except Exception as e:
+                    print(f"[ERROR en preload_pdf_assets] {filename}: {e}")
+    return len(_asset_cache)
+
+def _get_render_resources() -> Dict[str, Any]:
+    """
+    Returns the FontConfiguration for the current thread, creating it on first use.
+    """
+    resources = getattr(_render_resources, 'value', None)
+    if resources is None:
+        resources = {'font_config': FontConfiguration()}
+        _render_resources.value = resources
+    return resources
+
 # --- Main PDF Generation Logic ---
 
 def _generate_pdf_in_memory(
@@ -27,17 +154,15 @@ def _generate_pdf_in_memory(
     """
     Core PDF generation function that returns the PDF as bytes.
     """
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    templates_dir = os.path.join(project_root, 'src', 'templates')
-    
-    env = Environment(loader=FileSystemLoader(templates_dir))
-    env.filters['format_currency'] = _format_currency
-    template = env.get_template(template_name)
+    template = get_template_environment().get_template(template_name)
 
     html_out = template.render(template_data)
     
-    base_url = project_root
-    return HTML(string=html_out, base_url=base_url).write_pdf()
+    base_url = PROJECT_ROOT
+    resources = _get_render_resources()
+    return HTML(string=html_out, base_url=base_url, url_fetcher=cached_url_fetcher).write_pdf(
+        font_config=resources['font_config'],
+    )
 
 # --- Public Functions for Specific Reports ---
 
@@ -45,35 +170,24 @@ def generate_perfil_operacion_pdf(invoices_data: List[Dict[str, Any]]) -> bytes
     """
     Generates the 'Perfil de Operación' PDF for one or more invoices and returns it as bytes.
     """
-    # --- Calculate Totals for the Consolidated Summary ---
-    total_monto_total_factura = sum(inv.get('monto_total_factura', 0) for inv in invoices_data)
-    total_detraccion_monto = sum(inv.get('detraccion_monto', 0) for inv in invoices_data)
-    total_monto_neto_factura = sum(inv.get('monto_neto_factura', 0) for inv in invoices_data)
-    total_margen_seguridad = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('margen_seguridad', {}).get('monto', 0) for inv in invoices_data)
-    total_capital = sum(inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('capital', 0) for inv in invoices_data)
-    total_intereses = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('interes', {}).get('monto', 0) for inv in invoices_data)
-    total_igv_interes = sum(inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('igv_interes', 0) for inv in invoices_data)
-    total_comision_estructuracion = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('comision_estructuracion', {}).get('monto', 0) for inv in invoices_data)
-    total_igv_com_est = sum(inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('igv_comision_estructuracion', 0) for inv in invoices_data)
-    total_comision_afiliacion = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('comision_afiliacion', {}).get('monto', 0) for inv in invoices_data)
-    total_igv_com_afi = sum(inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('igv_afiliacion', 0) for inv in invoices_data)
-    total_monto_desembolsar = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0) for inv in invoices_data)
+    # --- Calculate Totals for the Consolidated Summary (single pass) ---
+    totals = aggregate_invoices(invoices_data)['totals']
 
     template_data = {
         'invoices': invoices_data,
         'print_date': datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S'),
-        'total_monto_total_factura': total_monto_total_factura,
-        'total_detraccion_monto': total_detraccion_monto,
-        'total_monto_neto_factura': total_monto_neto_factura,
-        'total_margen_seguridad': total_margen_seguridad,
-        'total_capital': total_capital,
-        'total_intereses': total_intereses,
-        'total_igv_interes': total_igv_interes,
-        'total_comision_estructuracion': total_comision_estructuracion,
-        'total_igv_com_est': total_igv_com_est,
-        'total_comision_afiliacion': total_comision_afiliacion,
-        'total_igv_com_afi': total_igv_com_afi,
-        'total_monto_desembolsar': total_monto_desembolsar,
+        'total_monto_total_factura': totals['monto_total_factura'],
+        'total_detraccion_monto': totals['detraccion_monto'],
+        'total_monto_neto_factura': totals['monto_neto_factura'],
+        'total_margen_seguridad': totals['margen_seguridad'],
+        'total_capital': totals['capital'],
+        'total_intereses': totals['intereses'],
+        'total_igv_interes': totals['igv_interes'],
+        'total_comision_estructuracion': totals['comision_estructuracion'],
+        'total_igv_com_est': totals['igv_comision_estructuracion'],
+        'total_comision_afiliacion': totals['comision_afiliacion'],
+        'total_igv_com_afi': totals['igv_afiliacion'],
+        'total_monto_desembolsar': totals['monto_desembolsar'],
     }
     return _generate_pdf_in_memory("perfil_operacion.html", template_data)
 
@@ -81,48 +195,25 @@ def generate_efide_report_pdf(invoices_data: List[Dict[str, Any]], signatory_dat
     """
     Generates the EFIDE report PDF with all calculations and returns it as bytes.
     """
-    # --- Calculate Totals for the Footer ---
-    total_monto_total_factura = sum(inv.get('monto_total_factura', 0) for inv in invoices_data)
-    total_detraccion_monto = sum(inv.get('detraccion_monto', 0) for inv in invoices_data)
-    total_monto_neto_factura = sum(inv.get('monto_neto_factura', 0) for inv in invoices_data)
-    
-    weighted_sum_tasa_avance = sum(
-        inv.get('monto_neto_factura', 0) * inv.get('recalculate_result', {}).get('resultado_busqueda', {}).get('tasa_avance_encontrada', 0)
-        for inv in invoices_data
-    )
-    total_tasa_avance_aplicada = (weighted_sum_tasa_avance / total_monto_neto_factura) if total_monto_neto_factura > 0 else 0
-    
-    total_margen_seguridad = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('margen_seguridad', {}).get('monto', 0) for inv in invoices_data)
-    total_capital = sum(inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('capital', 0) for inv in invoices_data)
-    total_intereses = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('interes', {}).get('monto', 0) for inv in invoices_data)
-    total_comision_estructuracion = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('comision_estructuracion', {}).get('monto', 0) for inv in invoices_data)
-    total_comision_afiliacion = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('comision_afiliacion', {}).get('monto', 0) for inv in invoices_data)
-    
-    total_igv = sum(
-        inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('igv_interes', 0) +
-        inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('igv_comision_estructuracion', 0) +
-        inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('igv_afiliacion', 0)
-        for inv in invoices_data
-    )
-    
-    total_monto_desembolsar = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0) for inv in invoices_data)
+    # --- Calculate Totals for the Footer (single pass) ---
+    totals = aggregate_invoices(invoices_data)['totals']
 
     template_data = {
         'invoices': invoices_data,
         'print_date': datetime.datetime.now(),
         'main_invoice': invoices_data[0] if invoices_data else {},
         'signatory_data': signatory_data or {}, # Ensure it's a dict
-        'total_monto_total_factura': total_monto_total_factura,
-        'total_detraccion_monto': total_detraccion_monto,
-        'total_monto_neto_factura': total_monto_neto_factura,
-        'total_tasa_avance_aplicada': total_tasa_avance_aplicada,
-        'total_margen_seguridad': total_margen_seguridad,
-        'total_capital': total_capital,
-        'total_intereses': total_intereses,
-        'total_comision_estructuracion': total_comision_estructuracion,
-        'total_comision_afiliacion': total_comision_afiliacion,
-        'total_igv': total_igv,
-        'total_monto_desembolsar': total_monto_desembolsar,
+        'total_monto_total_factura': totals['monto_total_factura'],
+        'total_detraccion_monto': totals['detraccion_monto'],
+        'total_monto_neto_factura': totals['monto_neto_factura'],
+        'total_tasa_avance_aplicada': totals['tasa_avance_ponderada'],
+        'total_margen_seguridad': totals['margen_seguridad'],
+        'total_capital': totals['capital'],
+        'total_intereses': totals['intereses'],
+        'total_comision_estructuracion': totals['comision_estructuracion'],
+        'total_comision_afiliacion': totals['comision_afiliacion'],
+        'total_igv': totals['igv_operacion'],
+        'total_monto_desembolsar': totals['monto_desembolsar'],
     }
     
     return _generate_pdf_in_memory("reporte_efide.html", template_data)
@@ -149,19 +240,8 @@ def generar_anexo_liquidacion_pdf(invoices_data: List[Dict[str, Any]], bank_info
 
     first_inv = invoices_data[0]
     
-    # --- Calculate Totals ---
-    total_monto_neto = sum(inv.get('monto_neto_factura', 0) for inv in invoices_data)
-    total_capital = sum(inv.get('recalculate_result', {}).get('calculo_con_tasa_encontrada', {}).get('capital', 0) for inv in invoices_data)
-    total_intereses = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('interes', {}).get('monto', 0) for inv in invoices_data)
-    total_monto_desembolsar = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('abono', {}).get('monto', 0) for inv in invoices_data)
-    
-    total_comision_est = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('comision_estructuracion', {}).get('monto', 0) for inv in invoices_data)
-    total_comision_afi = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('comision_afiliacion', {}).get('monto', 0) for inv in invoices_data)
-    total_comisiones = total_comision_est + total_comision_afi
-    
-    total_margen_seguridad = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('margen_seguridad', {}).get('monto', 0) for inv in invoices_data)
-    
-    total_igv = sum(inv.get('recalculate_result', {}).get('desglose_final_detallado', {}).get('igv_total', {}).get('monto', 0) for inv in invoices_data)
+    # --- Calculate Totals (single pass) ---
+    totals = aggregate_invoices(invoices_data)['totals']
     
     # Metadata for Title
     c_num = first_inv.get('contract_number', '')
@@ -192,14 +272,14 @@ def generar_anexo_liquidacion_pdf(invoices_data: List[Dict[str, Any]], bank_info
         'moneda': first_inv.get('moneda_factura', 'PEN'),
         'invoices': invoices_data,
         'totals': {
-            'monto_neto': total_monto_neto,
-            'capital': total_capital,
-            'intereses': total_intereses,
-            'monto_desembolsar': total_monto_desembolsar, 
-            'comisiones': total_comisiones,
-            'margen_seguridad': total_margen_seguridad,
-            'igv': total_igv,
-            'neto_desembolsar': total_monto_desembolsar 
+            'monto_neto': totals['monto_neto_factura'],
+            'capital': totals['capital'],
+            'intereses': totals['intereses'],
+            'monto_desembolsar': totals['monto_desembolsar'], 
+            'comisiones': totals['comisiones'],
+            'margen_seguridad': totals['margen_seguridad'],
+            'igv': totals['igv_total'],
+            'neto_desembolsar': totals['monto_desembolsar'] 
         },
         'deposit_info': {
             'forma_desembolso': 'TRANSFERENCIA',